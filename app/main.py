@@ -17,8 +17,10 @@ from yaml.loader import SafeLoader
 import google.cloud.logging
 
 from prompts.openai_summarise import system_prompt, user_prompt
+from src.collection_utils.format_results import format_search_results
 from src.collection_utils.query_collection import (
     filter_search,
+    get_search_params,
     get_semantically_similar_results,
 )
 from src.common import renaming_dict, urgency_translate
@@ -161,6 +163,11 @@ stream = config.get("openai_stream")
 similarity_threshold = float(config.get("similarity_threshold_1"))
 max_context_records = int(config.get("max_records_for_summarisation"))
 min_records_for_summarisation = int(config.get("min_records_for_summarisation"))
+# Quantization search params have no effect if the collection is not quantized
+search_params = get_search_params(
+    rescore=config.get("quantization_rescore", True),
+    oversampling=config.get("quantization_oversampling"),
+)
 
 summariser = Summariser(
     OPENAI_API_KEY,
@@ -423,6 +430,7 @@ def main():
                             query_embedding=query_embedding,
                             score_threshold=similarity_threshold,
                             filter_dict=filter_dict,
+                            search_params=search_params,
                         )
                     results = [dict(result) for result in search_results]
                     logger.info(
@@ -466,51 +474,11 @@ def main():
                 )
                 st.stop()
 
-            filtered_list = []
-            # Extract and append key-value pairs
-            for result in results:
-                payload = result["payload"]
-                for key in payload:
-                    if key in renaming_dict:
-                        for (
-                            key,
-                            value,
-                        ) in (
-                            renaming_dict.items()
-                        ):  # Check if the key exists in keys_to_extract
-                            result[value] = payload[key]
-
-                result_ordered = {key: result[key] for key in renaming_dict.values()}
-                result_ordered["Similarity score"] = (
-                    result["score"] if "score" in result else float(1)
-                )
-
-                result_ordered["created_date"] = datetime.datetime.strptime(
-                    result_ordered[renaming_dict["created"]], "%Y-%m-%d"
-                ).date()
-
-                # Reformat urgency to human readable
-                inverted_urgency_translate = {
-                    v: k for k, v in urgency_translate.items()
-                }
-                numeric_urgency = str(result_ordered["Urgency"])
-                if numeric_urgency in inverted_urgency_translate:
-                    result_ordered["Urgency"] = inverted_urgency_translate[
-                        numeric_urgency
-                    ]
-
-                # Filter on date and similarity score
-                if (
-                    result_ordered["Similarity score"] > similarity_threshold
-                    and start_date <= result_ordered["created_date"] <= end_date
-                ):
-                    filtered_list.append(result_ordered)
-
-            # Sort descending by similairty score, then date, to get the most similar results first, then the most recent where similarity is the same
-            filtered_sorted_list = sorted(
-                filtered_list,
-                key=lambda d: (d["Similarity score"], d["created_date"]),
-                reverse=True,
+            filtered_sorted_list = format_search_results(
+                results,
+                similarity_threshold=similarity_threshold,
+                start_date=start_date,
+                end_date=end_date,
             )
 
             # Topic summary where > n records returned
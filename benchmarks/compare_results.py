@@ -0,0 +1,74 @@
+import argparse
+import json
+
+
+def parse_arguments():
+    """
+    Parses command line arguments.
+
+    Returns:
+        argparse.Namespace: The namespace containing the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark results files, e.g. from two commits."
+    )
+    parser.add_argument("baseline", help="Path of the baseline results JSON.")
+    parser.add_argument("candidate", help="Path of the candidate results JSON.")
+    return parser.parse_args()
+
+
+def compare_results(baseline: dict, candidate: dict) -> list[dict]:
+    """Compare latency percentiles for each collection size and scenario in both results
+
+    Args:
+        baseline (dict): baseline benchmark results
+        candidate (dict): candidate benchmark results
+
+    Returns:
+        list[dict]: one row per collection size, scenario and percentile
+    """
+    baseline_runs = {run["n_records"]: run for run in baseline["runs"]}
+    rows = []
+    for run in candidate["runs"]:
+        baseline_run = baseline_runs.get(run["n_records"])
+        if baseline_run is None:
+            continue
+        for name, summary in run["scenarios"].items():
+            baseline_summary = baseline_run["scenarios"].get(name)
+            if baseline_summary is None:
+                continue
+            for percentile in ["p50_ms", "p95_ms", "p99_ms"]:
+                before = baseline_summary[percentile]
+                after = summary[percentile]
+                rows.append(
+                    {
+                        "n_records": run["n_records"],
+                        "scenario": name,
+                        "percentile": percentile,
+                        "baseline": before,
+                        "candidate": after,
+                        "change": (after - before) / before if before else 0.0,
+                    }
+                )
+    return rows
+
+
+def main():
+    args = parse_arguments()
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r") as f:
+        candidate = json.load(f)
+
+    print(
+        f"Baseline {baseline['metadata']['commit']} vs candidate {candidate['metadata']['commit']}"
+    )
+    for row in compare_results(baseline, candidate):
+        print(
+            f"{row['n_records']:>8} {row['scenario']:<26} {row['percentile']:<7} "
+            f"{row['baseline']:>10.2f} -> {row['candidate']:>10.2f} ({row['change']:+.1%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
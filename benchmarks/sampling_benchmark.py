@@ -0,0 +1,95 @@
+import argparse
+import time
+
+import numpy as np
+
+from src.utils.sample import get_stratified_sample
+
+
+def parse_arguments():
+    """
+    Parses command line arguments.
+
+    Returns:
+        argparse.Namespace: The namespace containing the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark stratified sampling of synthetic labelled records."
+    )
+    parser.add_argument(
+        "--n-records",
+        type=int,
+        nargs="+",
+        default=[20000, 200000],
+        help="Numbers of records to sample from. Defaults to 20000 200000.",
+    )
+    parser.add_argument(
+        "--records-per-label",
+        type=int,
+        default=5,
+        help="Records per distinct label, so that there are many more labels than samples. Defaults to 5.",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=1000,
+        help="Number of records to sample. Defaults to 1000.",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    return parser.parse_args()
+
+
+def generate_records(n_records: int, n_distinct_labels: int, seed: int = 0) -> list:
+    """Generate records with one to three labels, drawn with very uneven label
+    frequencies
+
+    Args:
+        n_records (int): number of records
+        n_distinct_labels (int): number of distinct labels
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        list[dict]: records with a feedback_record_id and labels
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, n_distinct_labels + 1)
+    n_labels = rng.integers(1, 4, n_records)
+    codes = rng.choice(
+        n_distinct_labels, n_labels.sum(), p=weights / weights.sum()
+    ).tolist()
+    ends = np.cumsum(n_labels).tolist()
+    return [
+        {
+            "feedback_record_id": i,
+            "labels": [f"label {code}" for code in codes[end - n : end]],
+        }
+        for i, (n, end) in enumerate(zip(n_labels.tolist(), ends))
+    ]
+
+
+def main():
+    """
+    Time stratified sampling from synthetic records of each size, printing how the time
+    taken grows with the number of records.
+    """
+    args = parse_arguments()
+    timings = {}
+    for n_records in args.n_records:
+        records = generate_records(
+            n_records, max(n_records // args.records_per_label, 1), seed=args.seed
+        )
+        start = time.perf_counter()
+        get_stratified_sample(records, args.sample_size, seed=args.seed)
+        timings[n_records] = time.perf_counter() - start
+        print(f"Sampled {n_records} records in {timings[n_records]:.3f}s")
+
+    sizes = sorted(timings)
+    for smaller, larger in zip(sizes, sizes[1:]):
+        print(
+            f"{larger / smaller:.0f}x the records took "
+            f"{timings[larger] / timings[smaller]:.1f}x as long"
+        )
+
+
+if __name__ == "__main__":
+    main()
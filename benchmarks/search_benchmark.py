@@ -0,0 +1,346 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from importlib.metadata import version
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance
+
+from benchmarks.synthetic_feedback import (
+    generate_feedback,
+    generate_queries,
+    organisations,
+    to_publishing_view_rows,
+)
+from src.collection_utils.format_results import format_search_results
+from src.collection_utils.latency import summarise_latencies
+from src.collection_utils.query_collection import (
+    filter_search,
+    get_semantically_similar_results,
+)
+from src.collection_utils.set_collection import (
+    create_collection,
+    create_vectors_from_data,
+    upsert_to_collection_from_vectors,
+)
+
+
+def parse_arguments():
+    """
+    Parses command line arguments.
+
+    Returns:
+        argparse.Namespace: The namespace containing the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark search over a synthetic feedback collection."
+    )
+    parser.add_argument(
+        "--n-records",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="Collection sizes to benchmark, e.g. 10000 100000 1000000. Defaults to 10000.",
+    )
+    parser.add_argument(
+        "--n-queries",
+        type=int,
+        default=100,
+        help="Number of timed queries per scenario. Defaults to 100.",
+    )
+    parser.add_argument(
+        "--location",
+        default=":memory:",
+        help="Qdrant location: ':memory:' for the local in-process stand-in, or a URL such as http://localhost:6333. Defaults to ':memory:'.",
+    )
+    parser.add_argument(
+        "--similarity-threshold",
+        type=float,
+        default=None,
+        help="Score threshold for semantic search. Defaults to similarity_threshold_1 in .config/config.json.",
+    )
+    parser.add_argument(
+        "--parquet-dir",
+        default=None,
+        help="Also write the synthetic feedback as publishing_view.parquet here, for the DuckDB query backend.",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Path of the JSON results file. Defaults to data/benchmarks/search_<commit>.json.",
+    )
+    return parser.parse_args()
+
+
+def get_git_commit() -> str:
+    """Get the short hash of the current commit, marked dirty if there are local changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        return f"{commit}-dirty" if status else commit
+    except Exception:
+        return "unknown"
+
+
+def time_calls(function, inputs: list) -> tuple[dict, list]:
+    """Call a function once per input, timing each call
+
+    Args:
+        function (Callable): the function to call with each input
+        inputs (list): the inputs
+
+    Returns:
+        dict: latency summary
+        list: the output of each call
+    """
+    latencies = []
+    outputs = []
+    for function_input in inputs:
+        start = time.perf_counter()
+        outputs.append(function(function_input))
+        latencies.append(time.perf_counter() - start)
+    return summarise_latencies(latencies), outputs
+
+
+def load_synthetic_collection(
+    client: QdrantClient,
+    collection_name: str,
+    n_records: int,
+    seed: int,
+    parquet_dir: str | None = None,
+) -> tuple[float, list[str]]:
+    """Create a collection and upsert synthetic feedback to it
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        n_records (int): number of records
+        seed (int): random seed
+        parquet_dir (str, optional): directory to also write publishing_view.parquet to
+
+    Returns:
+        float: seconds taken to load the collection
+        list[str]: distinct page paths in the collection
+    """
+    create_collection(
+        client, collection_name, size=768, distance_metric=Distance.COSINE
+    )
+    writer = None
+    pages = set()
+    start = time.perf_counter()
+    for chunk in generate_feedback(n_records, seed=seed):
+        points = create_vectors_from_data(
+            chunk, id_key="feedback_record_id", embedding_key="embeddings"
+        )
+        # upsert_to_collection_from_vectors prints every chunk, which swamps the output
+        with contextlib.redirect_stdout(io.StringIO()):
+            upsert_to_collection_from_vectors(client, collection_name, data=points)
+        pages.update(record["url"] for record in chunk)
+
+        if parquet_dir:
+            table = pa.Table.from_pylist(to_publishing_view_rows(chunk))
+            if writer is None:
+                os.makedirs(parquet_dir, exist_ok=True)
+                path = os.path.join(parquet_dir, "publishing_view.parquet")
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    load_seconds = time.perf_counter() - start
+
+    if writer is not None:
+        writer.close()
+    return load_seconds, sorted(pages)
+
+
+def run_scenarios(
+    client: QdrantClient,
+    collection_name: str,
+    pages: list[str],
+    n_queries: int,
+    similarity_threshold: float,
+    seed: int,
+) -> dict:
+    """Time semantic search, filter search and the app's post-processing
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        pages (list[str]): distinct page paths in the collection
+        n_queries (int): number of timed queries per scenario
+        similarity_threshold (float): score threshold for semantic search
+        seed (int): random seed, matching the collection
+
+    Returns:
+        dict: latency summary and mean number of results for each scenario
+    """
+    rng = np.random.default_rng(seed + 2)
+    query_embeddings = list(generate_queries(n_queries, seed=seed))
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=90)
+
+    # Filters as built by the app for a URL search: a URL prefix matched to its child
+    # pages, an organisation and the default spam filter
+    filter_dicts = []
+    for _ in range(n_queries):
+        page = pages[rng.integers(len(pages))]
+        prefix = page.rsplit("/", 1)[0] or page
+        filter_dicts.append(
+            {
+                "url": [url for url in pages if url.startswith(prefix)],
+                "urgency": [],
+                "primary_department": [organisations[rng.integers(len(organisations))]],
+                "document_type": [],
+                "spam_classification": ["spam", "not spam", ""],
+            }
+        )
+
+    scenarios = {}
+
+    summary, semantic_results = time_calls(
+        lambda query_embedding: get_semantically_similar_results(
+            client=client,
+            collection_name=collection_name,
+            query_embedding=query_embedding,
+            score_threshold=similarity_threshold,
+        ),
+        query_embeddings,
+    )
+    summary["mean_results"] = float(np.mean([len(r) for r in semantic_results]))
+    scenarios["semantic_search"] = summary
+
+    # Filter on the organisation of the top unfiltered result, so the filter and the
+    # query overlap as they would for a real search
+    filtered_inputs = []
+    for query_embedding, search_results in zip(query_embeddings, semantic_results):
+        organisation = (
+            search_results[0].payload["primary_department"]
+            if search_results
+            else organisations[0]
+        )
+        filter_dict = {
+            "primary_department": [organisation],
+            "spam_classification": ["spam", "not spam", ""],
+        }
+        filtered_inputs.append((query_embedding, filter_dict))
+
+    summary, results = time_calls(
+        lambda inputs: get_semantically_similar_results(
+            client=client,
+            collection_name=collection_name,
+            query_embedding=inputs[0],
+            score_threshold=similarity_threshold,
+            filter_dict=inputs[1],
+        ),
+        filtered_inputs,
+    )
+    summary["mean_results"] = float(np.mean([len(r) for r in results]))
+    scenarios["semantic_search_filtered"] = summary
+
+    summary, results = time_calls(
+        lambda filter_dict: filter_search(
+            client=client,
+            collection_name=collection_name,
+            filter_dict=filter_dict,
+        ),
+        filter_dicts,
+    )
+    summary["mean_results"] = float(np.mean([len(r[0]) for r in results]))
+    scenarios["filter_search"] = summary
+
+    summary, results = time_calls(
+        lambda search_results: format_search_results(
+            [dict(result) for result in search_results],
+            similarity_threshold=similarity_threshold,
+            start_date=start_date,
+            end_date=end_date,
+        ),
+        semantic_results,
+    )
+    summary["mean_results"] = float(np.mean([len(r) for r in results]))
+    scenarios["post_processing"] = summary
+
+    return scenarios
+
+
+def main():
+    """
+    Load synthetic collections of each size, time the search scenarios and write the
+    results to JSON for comparison between commits.
+    """
+    args = parse_arguments()
+
+    similarity_threshold = args.similarity_threshold
+    if similarity_threshold is None:
+        with open(".config/config.json", "r") as file:
+            similarity_threshold = float(json.load(file)["similarity_threshold_1"])
+
+    commit = get_git_commit()
+    output = args.output or f"data/benchmarks/search_{commit}.json"
+    results = {
+        "metadata": {
+            "commit": commit,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "location": args.location,
+            "n_queries": args.n_queries,
+            "similarity_threshold": similarity_threshold,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "qdrant_client": version("qdrant-client"),
+        },
+        "runs": [],
+    }
+
+    client = QdrantClient(location=args.location)
+    for n_records in args.n_records:
+        collection_name = f"benchmark_{n_records}"
+        print(f"Loading {n_records} synthetic records into {collection_name}...")
+        load_seconds, pages = load_synthetic_collection(
+            client, collection_name, n_records, args.seed, args.parquet_dir
+        )
+        print(f"Loaded in {load_seconds:.1f}s, running scenarios...")
+
+        scenarios = run_scenarios(
+            client,
+            collection_name,
+            pages,
+            args.n_queries,
+            similarity_threshold,
+            args.seed,
+        )
+        for name, summary in scenarios.items():
+            print(
+                f"{name}: p50 {summary['p50_ms']:.1f}ms, p95 {summary['p95_ms']:.1f}ms, "
+                f"p99 {summary['p99_ms']:.1f}ms, {summary['mean_results']:.0f} results"
+            )
+        results["runs"].append(
+            {
+                "n_records": n_records,
+                "load_seconds": load_seconds,
+                "scenarios": scenarios,
+            }
+        )
+        client.delete_collection(collection_name)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
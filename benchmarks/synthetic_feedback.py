@@ -0,0 +1,313 @@
+import datetime
+from typing import Iterator
+
+import numpy as np
+
+organisations = [
+    "HM Revenue & Customs",
+    "Driver and Vehicle Licensing Agency",
+    "Department for Work and Pensions",
+    "Home Office",
+    "UK Visas and Immigration",
+    "HM Passport Office",
+    "Companies House",
+    "Department for Education",
+    "Ministry of Justice",
+    "Land Registry",
+    "Department of Health and Social Care",
+    "Foreign, Commonwealth & Development Office",
+    "Student Loans Company",
+    "Office of the Public Guardian",
+    "Cabinet Office",
+]
+
+document_types = [
+    "guide",
+    "detailed_guide",
+    "answer",
+    "transaction",
+    "simple_smart_answer",
+    "form",
+    "guidance",
+    "news_story",
+    "consultation",
+    "statutory_guidance",
+    "mainstream_browse_page",
+    "manual_section",
+]
+
+url_sections = [
+    "/browse",
+    "/government/publications",
+    "/guidance",
+    "/government/organisations",
+    "/government/consultations",
+    "/hmrc-internal-manuals",
+    "",
+]
+
+url_words = [
+    "tax",
+    "vat",
+    "self-assessment",
+    "driving",
+    "licence",
+    "passport",
+    "visa",
+    "benefits",
+    "universal-credit",
+    "pension",
+    "childcare",
+    "student-finance",
+    "company",
+    "register",
+    "apply",
+    "renew",
+    "change",
+    "report",
+    "check",
+    "rates",
+    "allowance",
+    "employer",
+    "national-insurance",
+    "mot",
+    "council-tax",
+]
+
+feedback_templates = [
+    "I can't find how to {action} my {thing}",
+    "the page about {thing} is out of date",
+    "the {thing} service keeps crashing when I try to {action}",
+    "link to {action} {thing} is broken",
+    "how long does it take to {action} a {thing}",
+    "this is useless",
+    "no",
+    "very helpful thank you",
+    "I was charged twice to {action} my {thing}",
+    "the form to {action} {thing} won't let me upload documents",
+]
+
+feedback_actions = ["apply for", "renew", "change", "pay", "cancel", "check", "report"]
+feedback_things = [
+    "passport",
+    "driving licence",
+    "tax return",
+    "VAT registration",
+    "universal credit claim",
+    "pension",
+    "student loan",
+    "visa",
+    "company details",
+    "car tax",
+]
+
+
+def generate_url_tree(n_pages: int, rng: np.random.Generator) -> list[str]:
+    """Generate GOV.UK style page paths, arranged as a tree so that some pages are
+    children of others
+
+    Args:
+        n_pages (int): number of distinct page paths
+        rng (np.random.Generator): random number generator
+
+    Returns:
+        list[str]: page paths
+    """
+    pages = []
+    seen = set()
+    while len(pages) < n_pages:
+        section = url_sections[rng.integers(len(url_sections))]
+        depth = rng.integers(1, 4)
+        words = rng.choice(url_words, size=depth)
+        # Add a numeric suffix at the leaf so large trees have enough distinct pages
+        leaf = (
+            f"{words[-1]}-{rng.integers(n_pages)}" if rng.random() < 0.7 else words[-1]
+        )
+        path = "/".join([section, *words[:-1], leaf])
+        if path not in seen:
+            seen.add(path)
+            pages.append(path)
+    return pages
+
+
+def generate_topic_centroids(
+    n_topics: int, size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Generate random unit-norm topic centroids
+
+    Args:
+        n_topics (int): number of topics
+        size (int): vector size
+        rng (np.random.Generator): random number generator
+
+    Returns:
+        np.ndarray: float32 array of shape (n_topics, size)
+    """
+    centroids = rng.standard_normal((n_topics, size), dtype=np.float32)
+    return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+
+def generate_vectors(
+    centroids: np.ndarray,
+    topics: np.ndarray,
+    noise: float,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Generate random unit-norm vectors clustered around topic centroids. The expected
+    cosine similarity of a vector with its centroid is 1 / sqrt(1 + noise ** 2).
+
+    Args:
+        centroids (np.ndarray): unit-norm topic centroids
+        topics (np.ndarray): topic index of each vector
+        noise (float): size of the random component relative to the centroid
+        rng (np.random.Generator): random number generator
+
+    Returns:
+        np.ndarray: float32 array of shape (len(topics), size)
+    """
+    size = centroids.shape[1]
+    random_component = rng.standard_normal((len(topics), size), dtype=np.float32)
+    random_component *= noise / np.sqrt(size)
+    vectors = centroids[topics] + random_component
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def generate_feedback(
+    n_records: int,
+    size: int = 768,
+    n_topics: int = 200,
+    noise: float = 0.85,
+    end_date: datetime.date | None = None,
+    n_days: int = 365,
+    chunk_size: int = 10000,
+    seed: int = 42,
+) -> Iterator[list[dict]]:
+    """Generate synthetic feedback records in chunks, with the columns returned by
+    query_all_feedback and a clustered, unit-norm embedding for each record
+
+    Args:
+        n_records (int): number of records
+        size (int, optional): vector size. Defaults to 768.
+        n_topics (int, optional): number of embedding clusters. Defaults to 200.
+        noise (float, optional): spread of each cluster. Defaults to 0.85.
+        end_date (datetime.date, optional): latest created date. Defaults to today.
+        n_days (int, optional): number of days records are spread over. Defaults to 365.
+        chunk_size (int, optional): number of records per chunk. Defaults to 10000.
+        seed (int, optional): random seed. Defaults to 42.
+
+    Yields:
+        list[dict]: a chunk of feedback records
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.date.today()
+    centroids = generate_topic_centroids(n_topics, size, rng)
+    pages = generate_url_tree(max(10, n_records // 20), rng)
+
+    for start in range(0, n_records, chunk_size):
+        n_chunk = min(chunk_size, n_records - start)
+        topics = rng.integers(n_topics, size=n_chunk)
+        vectors = generate_vectors(centroids, topics, noise, rng)
+        # Page, organisation and content type follow the topic, so filters and
+        # semantic search select overlapping records as they do on real feedback
+        page_index = (topics * 7919 + rng.integers(50, size=n_chunk)) % len(pages)
+        organisation_index = topics % len(organisations)
+        days_ago = rng.integers(n_days, size=n_chunk)
+        urgency = rng.choice(
+            [-1, 0, 1, 2, 3], size=n_chunk, p=[0.1, 0.1, 0.4, 0.3, 0.1]
+        )
+        spam = rng.random(n_chunk)
+
+        records = []
+        for i in range(n_chunk):
+            url = pages[page_index[i]]
+            feedback = feedback_templates[rng.integers(len(feedback_templates))]
+            feedback = feedback.format(
+                action=feedback_actions[topics[i] % len(feedback_actions)],
+                thing=feedback_things[topics[i] % len(feedback_things)],
+            )
+            organisation = organisations[organisation_index[i]]
+            records.append(
+                {
+                    "feedback_type": "problem_report"
+                    if rng.random() < 0.8
+                    else "smart_survey",
+                    "created": (
+                        end_date - datetime.timedelta(days=int(days_ago[i]))
+                    ).isoformat(),
+                    "url": url,
+                    "full_url": f"https://www.gov.uk{url}",
+                    "feedback_record_id": str(start + i + 1),
+                    "feedback": feedback,
+                    "urgency": int(urgency[i]),
+                    "department": [organisation],
+                    "primary_department": organisation,
+                    "document_type": document_types[topics[i] % len(document_types)],
+                    "embeddings": vectors[i].tolist(),
+                    "sentiment": "negative" if spam[i] < 0.6 else "positive",
+                    "spam_classification": "spam" if spam[i] > 0.95 else "not spam",
+                    "spam_probability": float(spam[i]),
+                    "publishing_app": "publisher",
+                    "locale": "en",
+                    "page_title": url.rsplit("/", 1)[-1].replace("-", " ").title(),
+                    "taxons": [],
+                }
+            )
+        yield records
+
+
+def generate_queries(
+    n_queries: int,
+    size: int = 768,
+    n_topics: int = 200,
+    noise: float = 0.85,
+    seed: int = 42,
+) -> np.ndarray:
+    """Generate query vectors from the same topics as generate_feedback with the same seed
+
+    Args:
+        n_queries (int): number of queries
+        size (int, optional): vector size. Defaults to 768.
+        n_topics (int, optional): number of embedding clusters. Defaults to 200.
+        noise (float, optional): spread of each cluster. Defaults to 0.85.
+        seed (int, optional): random seed, matching generate_feedback. Defaults to 42.
+
+    Returns:
+        np.ndarray: float32 array of shape (n_queries, size)
+    """
+    centroids = generate_topic_centroids(n_topics, size, np.random.default_rng(seed))
+    rng = np.random.default_rng(seed + 1)
+    topics = rng.integers(n_topics, size=n_queries)
+    return generate_vectors(centroids, topics, noise, rng)
+
+
+def to_publishing_view_rows(records: list[dict]) -> list[dict]:
+    """Convert feedback records to the columns of the publishing view, so they can be
+    written to Parquet for the DuckDB query backend
+
+    Args:
+        records (list[dict]): records from generate_feedback
+
+    Returns:
+        list[dict]: rows with the publishing view's column names
+    """
+    return [
+        {
+            "type": record["feedback_type"],
+            "created": datetime.datetime.fromisoformat(record["created"]),
+            "subject_page_path": record["url"],
+            "feedback_record_id": int(record["feedback_record_id"]),
+            "response_value": record["feedback"],
+            "organisation": record["department"],
+            "primary_organisation": record["primary_department"],
+            "document_type": record["document_type"],
+            "embeddings": record["embeddings"],
+            "sentiment": record["sentiment"],
+            "spam_classification": record["spam_classification"],
+            "spam_probability": record["spam_probability"],
+            "publishing_app": record["publishing_app"],
+            "locale": record["locale"],
+            "title": record["page_title"],
+            "taxons": record["taxons"],
+        }
+        for record in records
+    ]
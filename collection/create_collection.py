@@ -7,10 +7,17 @@ from qdrant_client.http.models import Distance
 from src.collection_utils.set_collection import (
     create_collection,
     create_vectors_from_data,
+    get_labelled_points_from_collection,
+    get_quantization_config,
+    merge_labelled_records,
     upsert_to_collection_from_vectors,
     restore_collection_from_snapshot,
 )
-from src.sql_queries import query_labelled_feedback, query_all_feedback
+from src.sql_queries import (
+    query_all_feedback,
+    query_labelled_feedback,
+    query_labelled_ids,
+)
 from src.utils.bigquery import query_bigquery
 from src.utils.utils import load_qdrant_client
 
@@ -53,14 +60,38 @@ parser.add_argument(
     help="Set to True to enable restoring from a snapshot. Defaults to False.",
 )
 
+# Add arg for building the evaluation collection from the main collection
+parser.add_argument(
+    "-fm",
+    "--eval-from-main",
+    action="store_true",  # This will set the value to True when the flag is used
+    default=False,  # Default value is False
+    dest="eval_from_main",
+    help="Set to True to build the evaluation collection from the main collection, reading only labelled ids from BigQuery. Defaults to False.",
+)
+
+# Add arg for quantizing the vectors in the collection(s)
+parser.add_argument(
+    "-q",
+    "--quantization",
+    choices=["scalar", "binary"],
+    default=None,  # Default value is None, storing only float32 vectors
+    dest="quantization",
+    help="Quantize vectors with scalar (int8) or binary quantization, kept in RAM with the original vectors on disk. Defaults to None.",
+)
+
 args = parser.parse_args()
 
 client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+quantization_config = get_quantization_config(args.quantization)
 
 all_query_read = query_all_feedback.replace("@PUBLISHING_VIEW", str(PUBLISHING_VIEW))
 eval_query_read = query_labelled_feedback.replace(
     "@LABELLED_FEEDBACK_TABLE", str(LABELLED_FEEDBACK_TABLE)
 ).replace("@PUBLISHING_VIEW", str(PUBLISHING_VIEW))
+labelled_ids_query_read = query_labelled_ids.replace(
+    "@LABELLED_FEEDBACK_TABLE", str(LABELLED_FEEDBACK_TABLE)
+)
 
 # If eval_only, only populate the evaluation collection. Otherwise populate both
 if args.eval_only:
@@ -72,6 +103,9 @@ else:
         (EVAL_COLLECTION_NAME, eval_query_read),
     ]
 
+# Documents read for the main collection in this run, reused for the evaluation collection
+main_docs = None
+
 for name, query in collections:
     print(f"Running for collection {name}...")
     if args.restore_from_snapshot:
@@ -93,19 +127,62 @@ for name, query in collections:
         print(
             "Creating collection from vectors: restore from snapshot not requested, or snapshots not present"
         )
-        print("Reading data from BigQuery...")
-        docs = query_bigquery(
-            PUBLISHING_PROJECT_ID,
-            query,
-        )
-
-        print(f"Creating collection {name} with {len(docs)} documents...")
-        create_collection(client, name, size=size, distance_metric=distance_metric)
-
-        # Convert data into PointStructs for upsertion
-        points_to_upsert = create_vectors_from_data(
-            docs, id_key="feedback_record_id", embedding_key="embeddings"
-        )
+        if name == EVAL_COLLECTION_NAME and args.eval_from_main:
+            print("Reading labelled ids from BigQuery...")
+            labelled_records = query_bigquery(
+                PUBLISHING_PROJECT_ID,
+                labelled_ids_query_read,
+            )
+            if main_docs is not None:
+                print(
+                    f"Copying labelled documents from the {COLLECTION_NAME} extract..."
+                )
+                docs = merge_labelled_records(
+                    main_docs, labelled_records, id_key="feedback_record_id"
+                )
+                points_to_upsert = create_vectors_from_data(
+                    docs, id_key="feedback_record_id", embedding_key="embeddings"
+                )
+            else:
+                print(f"Copying labelled points from collection {COLLECTION_NAME}...")
+                points_to_upsert = get_labelled_points_from_collection(
+                    client,
+                    COLLECTION_NAME,
+                    labelled_records,
+                    id_key="feedback_record_id",
+                )
+            print(
+                f"Creating collection {name} with {len(points_to_upsert)} documents..."
+            )
+            create_collection(
+                client,
+                name,
+                size=size,
+                distance_metric=distance_metric,
+                quantization_config=quantization_config,
+            )
+        else:
+            print("Reading data from BigQuery...")
+            docs = query_bigquery(
+                PUBLISHING_PROJECT_ID,
+                query,
+            )
+            if name == COLLECTION_NAME:
+                main_docs = docs
+
+            print(f"Creating collection {name} with {len(docs)} documents...")
+            create_collection(
+                client,
+                name,
+                size=size,
+                distance_metric=distance_metric,
+                quantization_config=quantization_config,
+            )
+
+            # Convert data into PointStructs for upsertion
+            points_to_upsert = create_vectors_from_data(
+                docs, id_key="feedback_record_id", embedding_key="embeddings"
+            )
         upsert_to_collection_from_vectors(client, name, data=points_to_upsert)
         print(
             f"Collection {name} created and upserted with {len(points_to_upsert)} points"
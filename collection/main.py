@@ -31,6 +31,26 @@ def parse_arguments():
         dest="restore_from_snapshot",
         help="Set to True to enable restoring from a snapshot. Defaults to False.",
     )
+
+    # Add arg for building the evaluation collection from the main collection
+    parser.add_argument(
+        "-fm",
+        "--eval-from-main",
+        action="store_true",  # This will set the value to True when the flag is used
+        default=False,  # Default value is False
+        dest="eval_from_main",
+        help="Set to True to build the evaluation collection from the main collection. Defaults to False.",
+    )
+
+    # Add arg for quantizing the vectors in the collection(s)
+    parser.add_argument(
+        "-q",
+        "--quantization",
+        choices=["scalar", "binary"],
+        default=None,  # Default value is None, storing only float32 vectors
+        dest="quantization",
+        help="Quantize vectors with scalar (int8) or binary quantization. Defaults to None.",
+    )
     return parser.parse_args()
 
 
@@ -50,6 +70,11 @@ def main():
         if args.eval_only:
             cmd.append("-ev")
 
+    if args.eval_from_main:
+        create_collection_cmd.append("-fm")
+    if args.quantization:
+        create_collection_cmd.extend(["-q", args.quantization])
+
     # Execute the commands
     subprocess.run(create_collection_cmd)
     subprocess.run(delete_snapshots_cmd)
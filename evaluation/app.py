@@ -1,15 +1,24 @@
 from dotenv import load_dotenv
 import os
-import pickle
+import time
 import streamlit as st
-import subprocess
 import plotly.graph_objs as go
-from src.collection_utils.evaluate_collection import (
-    create_precision_boxplot_data,
-    create_recall_boxplot_data,
-    create_precision_line_data,
-    create_recall_line_data,
+from src.collection_utils.evaluation_job import (
+    is_running,
+    read_log_tail,
+    read_progress,
+    start_evaluation_job,
 )
+from src.collection_utils.evaluation_results import (
+    PLOT_DATA_PATH,
+    RESULTS_PATH,
+    is_current,
+    plot_data_is_current,
+    read_plot_data,
+    read_table,
+    write_plot_data,
+)
+from src.collection_utils.search_config_benchmark import SEARCH_CONFIG_BENCHMARK_PATH
 
 load_dotenv()
 
@@ -21,60 +30,154 @@ PUBLISHING_PROJECT_ID = os.getenv("PUBLISHING_PROJECT_ID")
 EVALUATION_TABLE = os.getenv("EVALUATION_TABLE")
 EVALUATION_TABLE = f"`{EVALUATION_TABLE}`"
 
+BOX_COLOR = "#19d3f3"
+SELECTED_BOX_COLOR = "#00cc96"
+
+
+# Run the evaluation in the background rather than blocking the page, and show its
+# progress until the results file exists
+def show_evaluation_job():
+    progress = read_progress()
+    if not is_running(progress):
+        # A job that exited while still running has failed without recording it
+        if progress is not None and progress["status"] != "done":
+            st.error(f"Evaluation failed: {progress['message']}")
+            st.code(read_log_tail())
+            if not st.button("Retry"):
+                st.stop()
+        # A job that finished without leaving current results would do the same again,
+        # so only run it again when asked
+        elif progress is not None:
+            st.warning(
+                "The last evaluation finished, but its results are out of date or "
+                "missing"
+            )
+            st.code(read_log_tail())
+            if not st.button("Retry"):
+                st.stop()
+        print("Running evaluation/create_eval_json.py in the background ...")
+        start_evaluation_job(["--save_outputs", "True"])
+        progress = read_progress()
 
-# Check if the pickle files exist via a cached function
-def check_pickle_files():
-    data_path = "data"
-    required_files = [
-        "regex_ids.pkl",
-        "precision_values.pkl",
-        "recall_values.pkl",
-        "f2_scores.pkl",
-    ]
-    files_exist = os.path.isdir(data_path) and all(
-        os.path.exists(os.path.join(data_path, file)) for file in required_files
+    st.title("Precision and Recall Calculator")
+    n_done, n_total = progress["n_done"], progress["n_total"]
+    st.progress(
+        n_done / n_total if n_total else 0.0,
+        text=f"{progress['message']}: {n_done}/{n_total} labels"
+        if n_total
+        else progress["message"],
     )
-    return files_exist
-
-
-# Create the pickle files (no caching so it checks every time)
-def create_files():
-    print("Running evaluation/create_eval_json.py ...")
-    subprocess.run(
-        ["python", "evaluation/create_eval_json.py", "--save_outputs", "True"]
+    time.sleep(2)
+    st.rerun()
+
+
+# Build the figures once per plot data file, from the precomputed statistics, with
+# empty traces for highlighting the selected threshold
+@st.cache_resource
+def load_figures(file_path, modified_time):
+    plot_data = read_plot_data(file_path)
+    thresholds = plot_data["thresholds"]
+
+    line_figure = go.Figure()
+    for metric, name in [
+        ("precision", "Precision"),
+        ("recall", "Recall"),
+        ("f2", "F2 score"),
+    ]:
+        line_figure.add_trace(
+            go.Scatter(
+                x=thresholds, y=plot_data["line"][metric], mode="lines", name=name
+            )
+        )
+    for metric, color in [("precision", "red"), ("recall", "blue"), ("f2", "green")]:
+        line_figure.add_trace(
+            go.Scatter(
+                x=[],
+                y=[],
+                mode="markers",
+                marker=dict(color=color, size=10),
+                name="Selected",
+                uid=f"selected_{metric}",
+                showlegend=False,
+            )
+        )
+    line_figure.update_layout(
+        title="Threshold vs. Precision/Recall/F2 Score",
+        xaxis_title="Threshold",
+        yaxis_title="Precision/Recall/F2 Score",
     )
 
+    box_figures = {}
+    for metric, name in [("precision", "Precision"), ("recall", "Recall")]:
+        box_figure = go.Figure()
+        for threshold, stats in zip(thresholds, plot_data["box"][metric]):
+            if stats is None:
+                continue
+            box_figure.add_trace(
+                go.Box(
+                    x=[f"Threshold: {threshold}"],
+                    name=f"Threshold: {threshold}",
+                    meta=threshold,
+                    q1=[stats["q1"]],
+                    median=[stats["median"]],
+                    q3=[stats["q3"]],
+                    lowerfence=[stats["lowerfence"]],
+                    upperfence=[stats["upperfence"]],
+                    mean=[stats["mean"]],
+                    marker=dict(color=BOX_COLOR, opacity=0.5),
+                )
+            )
+        box_figure.update_layout(
+            title=f"Threshold vs. {name} Score",
+            yaxis_title=f"{name} Score",
+            showlegend=False,
+        )
+        box_figures[metric] = box_figure
 
-# Check if the pickle files exists
-if not check_pickle_files():
-    create_files()
-
+    return plot_data, line_figure, box_figures["precision"], box_figures["recall"]
 
-# Load the pickle files via a cached function
-@st.cache_data
-def load_pickle_data(file_path):
-    with open(file_path, "rb") as file:
-        data = pickle.load(file)
-    return data
 
+# Copy a cached figure and colour the box for the selected threshold
+def highlight_box_figure(box_figure, selected_threshold):
+    figure = go.Figure(box_figure)
+    for trace in figure.data:
+        selected = trace.meta == selected_threshold
+        trace.marker.color = SELECTED_BOX_COLOR if selected else BOX_COLOR
+        trace.marker.opacity = 1 if selected else 0.5
+    return figure
 
-# Load the pickle files
-# TODO: can I parameterise the list of files so I don't type here and in the check_pickle_files function?
-regex_ids = load_pickle_data("data/regex_ids.pkl")  # TODO: Do I need this?
-recall_values = load_pickle_data("data/recall_values.pkl")
-precision_values = load_pickle_data("data/precision_values.pkl")
-f2scores = load_pickle_data("data/f2_scores.pkl")
 
-# Create the data for the box plots and line plots
-precision_boxplot_data = create_precision_boxplot_data(precision_values)
-recall_boxplot_data = create_recall_boxplot_data(recall_values)
-precision_line_data = create_precision_line_data(precision_values)
-recall_line_data = create_recall_line_data(recall_values)
-f2scores_line_data = create_recall_line_data(f2scores)
+# Load the search configuration benchmark as columns, labelling each configuration
+@st.cache_data
+def load_benchmark_data(file_path, modified_time):
+    benchmark = read_table(file_path).to_pydict()
+    benchmark["config"] = [
+        f"m={m}, {'exact' if exact else f'ef={ef}'}, quantization={q}, "
+        f"payload index={'on' if index else 'off'}"
+        for m, exact, ef, q, index in zip(
+            benchmark["m"],
+            benchmark["exact"],
+            benchmark["hnsw_ef"],
+            benchmark["quantization"],
+            benchmark["payload_index"],
+        )
+    ]
+    return benchmark
 
 
 # Streamlit app
 def main():
+    # Check the results file exists and has the current schema, and that the plot data
+    # was computed from it
+    if not is_current(RESULTS_PATH):
+        show_evaluation_job()
+    if not plot_data_is_current():
+        write_plot_data()
+
+    plot_data, line_figure, precision_box_figure, recall_box_figure = load_figures(
+        PLOT_DATA_PATH, os.path.getmtime(PLOT_DATA_PATH)
+    )
+
     st.title("Precision and Recall Calculator")
 
     # Streamlit slider for selecting threshold
@@ -82,17 +185,11 @@ def main():
         "Select Threshold", min_value=0.0, max_value=1.0, step=0.1
     )
 
-    # Get the precision, recall, and f2 scores as lists
-    thresholds = list(precision_line_data.keys())
-    precision_scores = list(precision_line_data.values())
-    recall_scores = list(recall_line_data.values())
-    f2scores = list(f2scores_line_data.values())
-
-    # Index the score lists for the selected threshold
-    selected_index = thresholds.index(selected_threshold)
-    selected_precision = precision_scores[selected_index]
-    selected_recall = recall_scores[selected_index]
-    selected_f2 = f2scores[selected_index]
+    # Index the scores for the selected threshold
+    selected_index = plot_data["thresholds"].index(selected_threshold)
+    selected_precision = plot_data["line"]["precision"][selected_index]
+    selected_recall = plot_data["line"]["recall"][selected_index]
+    selected_f2 = plot_data["line"]["f2"][selected_index]
 
     # Display the selected scores as metrics
     col1, col2, col3 = st.columns(3)
@@ -103,132 +200,48 @@ def main():
     with col3:
         st.metric("F2 score", selected_f2)
 
-    # Plot
-    fig = go.Figure()
-
-    # Add line plot traces for thresholds vs. scores
-    fig.add_trace(
-        go.Scatter(x=thresholds, y=precision_scores, mode="lines", name="Precision")
-    )
-    fig.add_trace(
-        go.Scatter(x=thresholds, y=recall_scores, mode="lines", name="Recall")
-    )
-    fig.add_trace(go.Scatter(x=thresholds, y=f2scores, mode="lines", name="F2 score"))
-
-    # Add a point to highlight the selected threshold and precision score
-    fig.add_trace(
-        go.Scatter(
-            x=[selected_threshold],
-            y=[selected_precision],
-            mode="markers",
-            marker=dict(color="red", size=10),
-            name="Selected",
-            showlegend=False,
-        )
-    )
-
-    # Add a point to highlight the selected threshold and recall score
-    fig.add_trace(
-        go.Scatter(
-            x=[selected_threshold],
-            y=[selected_recall],
-            mode="markers",
-            marker=dict(color="blue", size=10),
-            name="Selected",
-            showlegend=False,
-        )
-    )
-
-    # Add a point to highlight the selected threshold and f2 score
-    fig.add_trace(
-        go.Scatter(
-            x=[selected_threshold],
-            y=[selected_f2],
-            mode="markers",
-            marker=dict(color="green", size=10),
-            name="Selected",
-            showlegend=False,
+    # Copy the cached line plot and move the highlight points to the selected threshold
+    fig = go.Figure(line_figure)
+    for metric, score in [
+        ("precision", selected_precision),
+        ("recall", selected_recall),
+        ("f2", selected_f2),
+    ]:
+        fig.update_traces(
+            x=[selected_threshold], y=[score], selector=dict(uid=f"selected_{metric}")
         )
-    )
-
-    # Update layout to add titles and make it clearer
-    fig.update_layout(
-        title="Threshold vs. Precision/Recall/F2 Score",
-        xaxis_title="Threshold",
-        yaxis_title="Precision/Recall/F2 Score",
-    )
-
-    # Show the plot
     st.plotly_chart(fig)
 
-    # Box plot
-    fig2 = go.Figure()
-
-    # Add box plot for precision scores
-    for item in precision_boxplot_data.items():
-        if item[0] == selected_threshold:
-            fig2.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#00cc96", opacity=1),
-                )
-            )
-        else:
-            fig2.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#19d3f3", opacity=0.5),
-                )
-            )
-    # Update layout to add titles and make it clearer
-    fig2.update_layout(
-        title="Threshold vs. Precision Score",
-        # xaxis_title="Threshold",
-        yaxis_title="Precision Score",
-    )
-
-    # Hide the legend
-    fig2.update_layout(showlegend=False)
-
-    # Show the plot
-    st.plotly_chart(fig2)
-
-    # Box plot
-    fig3 = go.Figure()
+    # Box plots, highlighting the selected threshold
+    st.plotly_chart(highlight_box_figure(precision_box_figure, selected_threshold))
+    st.plotly_chart(highlight_box_figure(recall_box_figure, selected_threshold))
 
-    # Add box plot for recall scores
-    for item in recall_boxplot_data.items():
-        if item[0] == selected_threshold:
-            fig3.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#00cc96", opacity=1),
-                )
-            )
-        else:
-            fig3.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#19d3f3", opacity=0.5),
-                )
+    # Search configuration benchmark, from evaluation/benchmark_search_configs.py
+    if is_current(SEARCH_CONFIG_BENCHMARK_PATH):
+        st.header("Search configuration benchmark")
+        benchmark = load_benchmark_data(
+            SEARCH_CONFIG_BENCHMARK_PATH,
+            os.path.getmtime(SEARCH_CONFIG_BENCHMARK_PATH),
+        )
+        st.dataframe(benchmark)
+
+        # Scatter plot of latency against f2 score, one point per configuration
+        fig4 = go.Figure()
+        fig4.add_trace(
+            go.Scatter(
+                x=benchmark["p50_ms"],
+                y=benchmark["f2"],
+                mode="markers",
+                text=benchmark["config"],
+                marker=dict(color="#19d3f3", size=10),
             )
-
-    # Update layout to add titles and make it clearer
-    fig3.update_layout(
-        title="Threshold vs. Recall Score",
-        # xaxis_title="Threshold",
-        yaxis_title="Recall Score",
-    )
-
-    # Hide the legend
-    fig3.update_layout(showlegend=False)
-
-    # Show the plot
-    st.plotly_chart(fig3)
+        )
+        fig4.update_layout(
+            title="Median latency vs. F2 Score",
+            xaxis_title="p50 latency (ms)",
+            yaxis_title="F2 Score",
+        )
+        st.plotly_chart(fig4)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+from src.utils.utils import load_qdrant_client
+from src.utils.utils import load_model
+from src.collection_utils.evaluate_collection import encode_labels
+from src.collection_utils.evaluation_results import (
+    LABEL_MATCHES_PATH,
+    LABELS_PATH,
+    is_current,
+    read_label_matches,
+    write_table,
+)
+from src.collection_utils.query_collection import get_search_params
+from src.collection_utils.search_config_benchmark import (
+    SEARCH_CONFIG_BENCHMARK_PATH,
+    get_search_config_grid,
+    score_label_searches,
+    search_config_benchmark_schema,
+    set_payload_indexes,
+    time_label_searches,
+)
+from src.collection_utils.latency import summarise_latencies
+from src.collection_utils.set_collection import copy_collection, get_quantization_config
+
+from qdrant_client.http.models import HnswConfigDiff
+from dotenv import load_dotenv
+import pyarrow as pa
+import numpy as np
+import json
+import os
+import argparse
+import subprocess
+
+load_dotenv()
+
+# Load env variables
+QDRANT_HOST = os.getenv("QDRANT_HOST")
+QDRANT_PORT = os.getenv("QDRANT_PORT")
+COLLECTION_NAME = os.getenv("EVAL_COLLECTION_NAME")
+HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
+
+# Load config
+with open(".config/config.json", "r") as file:
+    config = json.load(file)
+
+# The filter the app applies to every search by default
+DEFAULT_FILTER = {"spam_classification": ["spam", "not spam", ""]}
+
+
+def main(
+    hnsw_ms: list[int],
+    hnsw_efs: list[int],
+    quantizations: list[str],
+    payload_indexes: list[bool],
+    n_labels: int = 200,
+    seed: int = 42,
+):
+    """
+    Search the evaluation labels with every combination of search settings, recording
+    latency, throughput and search quality at similarity_threshold_1 for each, and save
+    the results as a Parquet file for evaluation/app.py
+
+    Each m and quantization combination is benchmarked on a copy of the evaluation
+    collection, so the collection itself is never re-indexed.
+
+    Args:
+        hnsw_ms (list[int]): HNSW m values
+        hnsw_efs (list[int]): HNSW ef values
+        quantizations (list[str]): "none", "scalar" or "binary"
+        payload_indexes (list[bool]): whether to index the filtered payload fields
+        n_labels (int): the number of labels to search with, sampled at random
+        seed (int): random seed for sampling labels
+
+    Requirements:
+        Parquet files for unique labels and regex_ids. A Qdrant client and an encoder model.
+    """
+    if not is_current(LABELS_PATH) or not is_current(LABEL_MATCHES_PATH):
+        # run the evaluation/output_pkl.py script
+        print("Running evaluation/output_pkl.py ...")
+        subprocess.run(
+            ["python", "-u", "evaluation/output_pkl.py", "--save_outputs", "True"]
+        )
+
+    # Load unique labels and regex_ids, and sample the labels to search with
+    unique_labels, regex_ids = read_label_matches()
+    rng = np.random.default_rng(seed)
+    n_labels = min(n_labels, len(unique_labels))
+    labels = [
+        unique_labels[i]
+        for i in sorted(rng.choice(len(unique_labels), n_labels, replace=False))
+    ]
+
+    qdrant = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+    model = load_model(HF_MODEL_NAME)
+    query_embeddings = encode_labels(model, labels)
+
+    score_threshold = float(config["similarity_threshold_1"])
+    benchmark_collection_name = f"{COLLECTION_NAME}_benchmark"
+    print(f"Benchmarking {n_labels} labels at threshold {score_threshold}")
+
+    rows = []
+    collection_settings = None
+    exact_results = None
+    for settings in get_search_config_grid(
+        hnsw_ms,
+        hnsw_efs,
+        [None if q == "none" else q for q in quantizations],
+        payload_indexes,
+    ):
+        if (settings["m"], settings["quantization"]) != collection_settings:
+            collection_settings = (settings["m"], settings["quantization"])
+            copy_collection(
+                qdrant,
+                COLLECTION_NAME,
+                benchmark_collection_name,
+                hnsw_config=HnswConfigDiff(m=settings["m"]),
+                quantization_config=get_quantization_config(settings["quantization"]),
+            )
+        set_payload_indexes(
+            qdrant, benchmark_collection_name, enabled=settings["payload_index"]
+        )
+
+        search_params = get_search_params(
+            rescore=config["quantization_rescore"],
+            oversampling=config["quantization_oversampling"],
+            hnsw_ef=settings["hnsw_ef"],
+            exact=settings["exact"],
+            # Exact rows are the baseline, so search the original vectors
+            ignore_quantization=settings["exact"],
+        )
+
+        # Warm up, so the first timed searches don't pay for loading the index
+        time_label_searches(
+            qdrant,
+            benchmark_collection_name,
+            query_embeddings[:10],
+            score_threshold,
+            search_params,
+            DEFAULT_FILTER,
+        )
+        latencies, results = time_label_searches(
+            qdrant,
+            benchmark_collection_name,
+            query_embeddings,
+            score_threshold,
+            search_params,
+            DEFAULT_FILTER,
+        )
+        if settings["exact"]:
+            exact_results = results
+
+        latency_summary = summarise_latencies(latencies)
+        row = {
+            **settings,
+            "quantization": settings["quantization"] or "none",
+            "n_queries": latency_summary["n"],
+            "p50_ms": latency_summary["p50_ms"],
+            "p99_ms": latency_summary["p99_ms"],
+            "queries_per_second": len(latencies) / sum(latencies),
+            "mean_results": float(np.mean([len(result) for result in results])),
+            **score_label_searches(
+                labels, regex_ids, results, score_threshold, exact_results
+            ),
+        }
+        rows.append(row)
+        print(
+            f"{settings}: p50 {row['p50_ms']:.1f}ms, p99 {row['p99_ms']:.1f}ms, "
+            f"{row['queries_per_second']:.1f} queries/s, f2 {row['f2']:.3f}, "
+            f"recall {row['recall']:.3f}"
+        )
+
+    qdrant.delete_collection(benchmark_collection_name)
+
+    write_table(
+        pa.Table.from_pylist(rows, schema=search_config_benchmark_schema),
+        SEARCH_CONFIG_BENCHMARK_PATH,
+    )
+    print(f"Results saved to {SEARCH_CONFIG_BENCHMARK_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hnsw_m", type=int, nargs="+", default=[16])
+    parser.add_argument("--hnsw_ef", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument(
+        "--quantization",
+        nargs="+",
+        choices=["none", "scalar", "binary"],
+        default=["none", "scalar"],
+    )
+    parser.add_argument("--no_payload_index_comparison", action="store_true")
+    parser.add_argument("--n_labels", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    main(
+        hnsw_ms=args.hnsw_m,
+        hnsw_efs=args.hnsw_ef,
+        quantizations=args.quantization,
+        payload_indexes=[True] if args.no_payload_index_comparison else [False, True],
+        n_labels=args.n_labels,
+        seed=args.seed,
+    )
@@ -1,10 +1,41 @@
 from src.utils.utils import load_qdrant_client
 from src.utils.utils import load_model
-from src.collection_utils.evaluate_collection import process_labels
+from src.collection_utils.evaluate_collection import (
+    compare_mean_values,
+    encode_labels,
+    process_labels,
+    process_ranking_metrics,
+    summarise_ranking_metrics,
+)
+from src.collection_utils.evaluation_cache import (
+    get_collection_version,
+    process_labels_with_cache,
+)
+from src.collection_utils.evaluation_results import (
+    LABEL_MATCHES_PATH,
+    LABELS_PATH,
+    is_current,
+    read_label_matches,
+    write_plot_data,
+    write_results,
+)
+from src.collection_utils.evaluation_job import write_progress
+from src.collection_utils.exact_search import (
+    calculate_ann_divergence,
+    calculate_ann_recall_at_k,
+    exact_process_labels,
+    exact_ranking_metrics,
+    get_collection_vectors,
+)
+from src.collection_utils.query_collection import (
+    get_search_params,
+    get_semantically_similar_results_batch,
+)
 
 from dotenv import load_dotenv
+import numpy as np
+import json
 import os
-import pickle
 import argparse
 import subprocess
 
@@ -19,30 +50,85 @@ PUBLISHING_PROJECT_ID = os.getenv("PUBLISHING_PROJECT_ID")
 EVALUATION_TABLE = os.getenv("EVALUATION_TABLE")
 EVALUATION_TABLE = f"`{EVALUATION_TABLE}`"
 
+# Load config
+with open(".config/config.json", "r") as file:
+    config = json.load(file)
 
-def main(save_outputs: bool = False):
+
+def evaluate_labels(
+    unique_labels: list[str],
+    regex_ids: dict,
+    compute,
+    context: dict,
+    use_cache: bool,
+):
+    """
+    Compute precision, recall and f2 scores for every label, reusing cached results for
+    labels whose ids and context are unchanged if use_cache is True
+
+    Args:
+        unique_labels (list[str]): the labels
+        regex_ids (dict): the ids of the records matching each label
+        compute (Callable): computes the results for a list of labels
+        context (dict): everything else the results depend on
+        use_cache (bool): whether to use the per-label results cache
+
+    Returns:
+        tuple[list, list, list]: precision values, recall values and f2 scores
+    """
+    if use_cache:
+        return process_labels_with_cache(unique_labels, regex_ids, context, compute)
+    return compute(unique_labels)
+
+
+def main(
+    save_outputs: bool = False,
+    compare_quantization: bool = False,
+    search_batch_size: int = 64,
+    n_workers: int = 4,
+    exact: bool = False,
+    compare_ann: bool = False,
+    use_cache: bool = True,
+    ranking_metrics: bool = False,
+    progress_path: str | None = None,
+):
     """
-    Main function to get data for analysis and save the outputs as pickle files
+    Main function to get data for analysis and save the outputs as a Parquet file
+
+    Args:
+        save_outputs (bool): whether to save the outputs as a Parquet file
+        compare_quantization (bool): whether to also evaluate with quantization ignored,
+            and report the change in mean precision, recall and f2 score at each threshold
+        search_batch_size (int): the number of label searches sent per Qdrant request
+        n_workers (int): the number of concurrent Qdrant requests
+        exact (bool): whether to score every label against every record in memory,
+            instead of searching the collection
+        compare_ann (bool): with exact, whether to also search the collection and report
+            how far its approximate results diverge from exact search
+        use_cache (bool): whether to reuse results for labels whose ids, collection
+            version, model, thresholds and search are unchanged since the last run
+        ranking_metrics (bool): whether to also calculate recall@k, nDCG@k and MAP
+        progress_path (str, optional): where to record progress, for the evaluation app
+            to show while this runs in the background
 
     Requirements:
-        Pickle files for unique labels and regex_ids. A Qdrant client and an encoder model.
+        Parquet files for unique labels and regex_ids. A Qdrant client and an encoder model.
     """
-    if not os.path.exists("data/unique_labels.pkl") or not os.path.exists(
-        "data/regex_ids.pkl"
-    ):
+
+    def report_progress(n_done=0, n_total=0, message="Evaluating labels"):
+        if progress_path:
+            write_progress("running", n_done, n_total, message, path=progress_path)
+
+    if not is_current(LABELS_PATH) or not is_current(LABEL_MATCHES_PATH):
+        report_progress(message="Matching labels")
         # run the evaluation/output_pkl.py script
         print("Running evaluation/output_pkl.py ...")
         subprocess.run(
             ["python", "-u", "evaluation/output_pkl.py", "--save_outputs", "True"]
         )
 
-    # Load regex_ids
-    with open("data/regex_ids.pkl", "rb") as f:
-        regex_ids = pickle.load(f)
-
-    # Load unique labels
-    with open("data/unique_labels.pkl", "rb") as f:
-        unique_labels = pickle.load(f)
+    # Load unique labels and regex_ids
+    unique_labels, regex_ids = read_label_matches()
 
     # Load Qdrant client and encoder model
     try:
@@ -51,80 +137,230 @@ def main(save_outputs: bool = False):
     except Exception as e:
         print(f"Error: {e}")
 
-    # Process labels
-    precision_values, recall_values, f2_scores = process_labels(
-        unique_labels=unique_labels,
-        regex_ids=regex_ids,
-        model=model,
-        client=qdrant,
-        collection_name=COLLECTION_NAME,
+    # Search params as used by the app. These have no effect if the collection is not quantized
+    search_params = get_search_params(
+        rescore=config["quantization_rescore"],
+        oversampling=config["quantization_oversampling"],
     )
 
-    # # Loop over unique labels and similarity thresholds and return vals
-    # precision_values = []
-    # recall_values = []
-    # f2_scores = []
-    # batch_size = 100
-    # num_batches = len(unique_labels) // batch_size + 1
-
-    # for batch_idx in range(num_batches):
-    #     start_idx = batch_idx * batch_size
-    #     end_idx = min((batch_idx + 1) * batch_size, len(unique_labels))
-    #     batch_labels = unique_labels[start_idx:end_idx]
-
-    #     for unique_label in batch_labels:
-    #         label_precision = {}
-    #         label_recall = {}
-    #         label_f2_scores = {}
-
-    #         for threshold in np.arange(0, 1.1, 0.1):
-    #             try:
-    #                 precision, recall, f2_score = calculate_metrics(
-    #                     unique_label=unique_label,
-    #                     regex_ids=regex_ids,
-    #                     model=model,
-    #                     client=qdrant,
-    #                     similarity_threshold=threshold,
-    #                     collection_name=COLLECTION_NAME,
-    #                 )
-    #                 label_precision[threshold] = precision
-    #                 label_recall[threshold] = recall
-    #                 label_f2_scores[threshold] = f2_score
-    #             except Exception as e:
-    #                 print(
-    #                     f"Error processing {unique_label} at threshold {threshold}: {e}"
-    #                 )
-
-    #         precision_values.append({unique_label: label_precision})
-    #         recall_values.append({unique_label: label_recall})
-    #         f2_scores.append({unique_label: label_f2_scores})
-    #     print(f"Metrics calculated for labels index {start_idx} to {end_idx}")
+    # Everything the results depend on, other than the label and its ids
+    thresholds = np.arange(0, 1.1, 0.1)
+    context = {
+        "collection_version": get_collection_version(qdrant, COLLECTION_NAME),
+        "model": HF_MODEL_NAME,
+        "thresholds": [round(threshold, 4) for threshold in thresholds.tolist()],
+    }
+
+    ann_divergence = None
+    ranking_summary = None
+    report_progress()
+    if exact:
+        # Score every label against every record, with the vectors held in memory
+        ids, vectors = get_collection_vectors(qdrant, COLLECTION_NAME)
+        precision_values, recall_values, f2_scores = evaluate_labels(
+            unique_labels,
+            regex_ids,
+            lambda labels: exact_process_labels(
+                unique_labels=labels,
+                regex_ids=regex_ids,
+                query_embeddings=encode_labels(model, labels),
+                ids=ids,
+                vectors=vectors,
+                thresholds=thresholds,
+            ),
+            {**context, "search": "exact"},
+            use_cache,
+        )
+
+        if ranking_metrics or compare_ann:
+            query_embeddings = encode_labels(model, unique_labels)
+
+        if ranking_metrics:
+            ranking_summary = summarise_ranking_metrics(
+                exact_ranking_metrics(
+                    unique_labels, regex_ids, query_embeddings, ids, vectors
+                )
+            )
+
+        if compare_ann:
+            print("Comparing approximate search with exact search...")
+            ann_results = get_semantically_similar_results_batch(
+                qdrant,
+                COLLECTION_NAME,
+                query_embeddings,
+                score_threshold=None,
+                search_params=search_params,
+                batch_size=search_batch_size,
+            )
+            ann_divergence = calculate_ann_divergence(
+                ann_results, query_embeddings, ids, vectors
+            )
+            for threshold, divergence in ann_divergence.items():
+                print(
+                    f"  {threshold:.1f}: ANN recall {divergence['ann_recall']:.4f}, "
+                    f"{divergence['queries_with_missed_results']} labels with missed results"
+                )
+            ann_recall_at_k = calculate_ann_recall_at_k(
+                ann_results, query_embeddings, ids, vectors
+            )
+            for metric, value in ann_recall_at_k.items():
+                print(f"  {metric}: {value:.4f}")
+            if ranking_summary is not None:
+                ranking_summary.update(ann_recall_at_k)
+    else:
+        # Process labels
+        precision_values, recall_values, f2_scores = evaluate_labels(
+            unique_labels,
+            regex_ids,
+            lambda labels: process_labels(
+                unique_labels=labels,
+                regex_ids=regex_ids,
+                model=model,
+                client=qdrant,
+                collection_name=COLLECTION_NAME,
+                search_params=search_params,
+                thresholds=thresholds,
+                search_batch_size=search_batch_size,
+                n_workers=n_workers,
+                progress_callback=report_progress,
+            ),
+            {**context, "search": repr(search_params)},
+            use_cache,
+        )
+
+        if ranking_metrics:
+            ranking_summary = summarise_ranking_metrics(
+                process_ranking_metrics(
+                    unique_labels,
+                    regex_ids,
+                    model,
+                    qdrant,
+                    COLLECTION_NAME,
+                    search_params=search_params,
+                    search_batch_size=search_batch_size,
+                )
+            )
+
+    if ranking_summary is not None:
+        print("Ranking metrics:")
+        for metric, value in ranking_summary.items():
+            print(f"  {metric}: {value:.4f}")
+
+    # Compare against the original vectors, to check quantization doesn't cost accuracy
+    quantization_comparison = None
+    if compare_quantization:
+        print("Evaluating with quantization ignored...")
+        report_progress(message="Evaluating with quantization ignored")
+        baseline_search_params = get_search_params(ignore_quantization=True)
+        baseline_values = evaluate_labels(
+            unique_labels,
+            regex_ids,
+            lambda labels: process_labels(
+                unique_labels=labels,
+                regex_ids=regex_ids,
+                model=model,
+                client=qdrant,
+                collection_name=COLLECTION_NAME,
+                search_params=baseline_search_params,
+                thresholds=thresholds,
+                search_batch_size=search_batch_size,
+                n_workers=n_workers,
+            ),
+            {**context, "search": repr(baseline_search_params)},
+            use_cache,
+        )
+        quantization_comparison = {
+            metric: compare_mean_values(baseline, candidate)
+            for metric, baseline, candidate in zip(
+                ["precision", "recall", "f2_score"],
+                baseline_values,
+                [precision_values, recall_values, f2_scores],
+            )
+        }
+        for metric, changes in quantization_comparison.items():
+            print(f"Change in mean {metric} with quantization:")
+            for threshold, change in changes.items():
+                print(f"  {threshold:.1f}: {change:+.4f}")
 
     # Print first 10 values
     print(precision_values[:10])
     print(recall_values[:10])
     print(f2_scores[:10])
 
-    # pickle precision and recall values if argument is True
+    # Save precision, recall and f2 scores if argument is True
     if save_outputs:
-        with open("data/precision_values.pkl", "wb") as f:
-            pickle.dump(precision_values, f)
+        write_results(precision_values, recall_values, f2_scores)
+        write_plot_data()
+
+        print("Precision, recall and f2 scores saved")
+
+        if quantization_comparison is not None:
+            with open("data/quantization_comparison.json", "w") as f:
+                json.dump(
+                    {
+                        metric: {
+                            str(round(threshold, 2)): change
+                            for threshold, change in changes.items()
+                        }
+                        for metric, changes in quantization_comparison.items()
+                    },
+                    f,
+                    indent=4,
+                )
 
-        print("Precision values saved")
+            print("Quantization comparison saved")
 
-        with open("data/recall_values.pkl", "wb") as f:
-            pickle.dump(recall_values, f)
+        if ann_divergence is not None:
+            with open("data/ann_divergence.json", "w") as f:
+                json.dump(
+                    {
+                        str(round(threshold, 2)): divergence
+                        for threshold, divergence in ann_divergence.items()
+                    },
+                    f,
+                    indent=4,
+                )
 
-        print("Recall values saved")
+            print("ANN divergence saved")
 
-        with open("data/f2_scores.pkl", "wb") as f:
-            pickle.dump(f2_scores, f)
+        if ranking_summary is not None:
+            with open("data/ranking_metrics.json", "w") as f:
+                json.dump(ranking_summary, f, indent=4)
 
-        print("F2 scores saved")
+            print("Ranking metrics saved")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--save_outputs", type=bool, default=False)
+    parser.add_argument("--compare_quantization", action="store_true")
+    parser.add_argument("--search_batch_size", type=int, default=64)
+    parser.add_argument("--n_workers", type=int, default=4)
+    parser.add_argument("--exact", action="store_true")
+    parser.add_argument("--compare_ann", action="store_true")
+    parser.add_argument("--no_cache", action="store_true")
+    parser.add_argument("--ranking_metrics", action="store_true")
+    parser.add_argument("--progress_file", default=None)
     args = parser.parse_args()
-    main(save_outputs=args.save_outputs)
+    if args.compare_quantization and args.exact:
+        # Exact search scores the original vectors, so the comparison would measure
+        # exact against approximate search rather than quantization
+        parser.error("--compare_quantization can't be used with --exact")
+    try:
+        main(
+            save_outputs=args.save_outputs,
+            compare_quantization=args.compare_quantization,
+            search_batch_size=args.search_batch_size,
+            n_workers=args.n_workers,
+            exact=args.exact,
+            compare_ann=args.compare_ann,
+            use_cache=not args.no_cache,
+            ranking_metrics=args.ranking_metrics,
+            progress_path=args.progress_file,
+        )
+    except Exception as e:
+        if args.progress_file:
+            write_progress("failed", message=repr(e), path=args.progress_file)
+        raise
+    if args.progress_file:
+        write_progress("done", message="Finished", path=args.progress_file)
@@ -0,0 +1,97 @@
+from src.utils.label_propagation import evaluate_knn_labelling, get_labelled_vectors
+
+from qdrant_client import QdrantClient
+from dotenv import load_dotenv
+import json
+import os
+import argparse
+
+load_dotenv()
+
+# Load env variables
+QDRANT_HOST = os.getenv("QDRANT_HOST")
+QDRANT_PORT = os.getenv("QDRANT_PORT")
+COLLECTION_NAME = os.getenv("EVAL_COLLECTION_NAME")
+
+LABEL_PROPAGATION_REPORT_PATH = "data/label_propagation_report.json"
+
+
+def main(
+    ks: list[int],
+    min_agreements: list[float],
+    min_similarity: float,
+    holdout_fraction: float = 0.2,
+    seed: int = 42,
+    save_outputs: bool = False,
+):
+    """
+    Hold out some of the LLM labelled records of the evaluation collection and label
+    them from their nearest neighbours in the rest, reporting for each setting the share
+    of LLM calls saved and the agreement with the LLM's labels lost
+
+    Args:
+        ks (list[int]): numbers of neighbours to vote
+        min_agreements (list[float]): minimum shares of the vote for the winning labels
+        min_similarity (float): minimum mean similarity of the neighbours
+        holdout_fraction (float): share of the labelled records to hold out
+        seed (int): random seed for the holdout
+        save_outputs (bool): whether to save the report as JSON
+
+    Requirements:
+        A Qdrant client with the evaluation collection.
+    """
+    client = QdrantClient(QDRANT_HOST, port=QDRANT_PORT)
+    _, vectors, label_sets, urgency = get_labelled_vectors(client, COLLECTION_NAME)
+
+    rows = []
+    for k in ks:
+        for min_agreement in min_agreements:
+            row = {
+                "k": k,
+                "min_agreement": min_agreement,
+                "min_similarity": min_similarity,
+                **evaluate_knn_labelling(
+                    vectors,
+                    label_sets,
+                    urgency,
+                    holdout_fraction=holdout_fraction,
+                    seed=seed,
+                    k=k,
+                    min_agreement=min_agreement,
+                    min_similarity=min_similarity,
+                ),
+            }
+            rows.append(row)
+            print(
+                f"k={k}, min_agreement={min_agreement}: {row['calls_saved']:.1%} of "
+                f"LLM calls saved, {row['agreement_lost']:.1%} agreement lost "
+                f"(label agreement {row['label_agreement']}, urgency agreement "
+                f"{row['urgency_agreement']})"
+            )
+
+    if save_outputs:
+        os.makedirs(os.path.dirname(LABEL_PROPAGATION_REPORT_PATH), exist_ok=True)
+        with open(LABEL_PROPAGATION_REPORT_PATH, "w") as f:
+            json.dump(rows, f, indent=4)
+        print(f"Report saved to {LABEL_PROPAGATION_REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument(
+        "--min_agreement", type=float, nargs="+", default=[0.7, 0.8, 0.9, 1.0]
+    )
+    parser.add_argument("--min_similarity", type=float, default=0.5)
+    parser.add_argument("--holdout_fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save_outputs", action="store_true")
+    args = parser.parse_args()
+    main(
+        ks=args.k,
+        min_agreements=args.min_agreement,
+        min_similarity=args.min_similarity,
+        holdout_fraction=args.holdout_fraction,
+        seed=args.seed,
+        save_outputs=args.save_outputs,
+    )
@@ -4,9 +4,9 @@ from src.collection_utils.evaluate_collection import (
     get_all_regex_counts,
     get_all_regex_ids,
 )
+from src.collection_utils.evaluation_results import write_label_matches
 import os
 from dotenv import load_dotenv
-import pickle
 import argparse
 
 load_dotenv()
@@ -18,7 +18,8 @@ EVALUATION_TABLE = f"`{EVALUATION_TABLE}`"
 
 def main(save_outputs: bool = False):
     """
-    Main function to get data for evaluation and save the outputs as pickle files
+    Main function to get data for evaluation and save the unique labels and the ids
+    matching each label as Parquet files
 
     Requirements:
     A labelled BQ table with records and labels
@@ -41,15 +42,9 @@ def main(save_outputs: bool = False):
     regex_ids = get_all_regex_ids(data)
 
     if save_outputs:
-        # Save regex_counts as a pickle file
-        with open("data/regex_counts.pkl", "wb") as f:
-            pickle.dump(regex_counts, f)
-        # Save regex_ids as a pickle file
-        with open("data/regex_ids.pkl", "wb") as f:
-            pickle.dump(regex_ids, f)
-        # Save unique_labels as a pickle file
-        with open("data/unique_labels.pkl", "wb") as f:
-            pickle.dump(unique_labels, f)
+        # Save unique labels, regex counts and regex ids as Parquet files
+        write_label_matches(unique_labels, regex_ids, regex_counts)
+        print("Labels and label matches saved")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,10 @@
 import os
-import pickle
 from src.collection_utils.evaluate_collection import (
     assess_retrieval_accuracy,
     get_data_for_evaluation,
     assess_scroll_retrieval,
 )
+from src.collection_utils.evaluation_results import read_label_matches
 from src.utils.utils import load_qdrant_client, load_config
 from dotenv import load_dotenv
 
@@ -35,8 +35,7 @@ def main():
     )
 
     # Load the regex ids
-    with open("data/regex_ids.pkl", "rb") as f:
-        regex_ids = pickle.load(f)
+    _, regex_ids = read_label_matches()
 
     # Assess the retrieval accuracy, return result ids
     ss_results = assess_retrieval_accuracy(
@@ -1,12 +1,13 @@
 import os
-import pickle
 from src.collection_utils.evaluate_collection import (
     assess_retrieval_accuracy,
     assess_scroll_retrieval,
     get_all_regex_counts,
     get_all_regex_ids,
     get_data_for_evaluation,
+    get_unique_labels,
 )
+from src.collection_utils.evaluation_results import write_label_matches
 from src.utils.utils import load_config, load_qdrant_client
 
 from dotenv import load_dotenv
@@ -42,12 +43,8 @@ print("data retrieved")
 regex_counts = get_all_regex_counts(data)
 regex_ids = get_all_regex_ids(data)
 
-# Save regex_counts as a pickle file
-with open("regex_counts.pkl", "wb") as f:
-    pickle.dump(regex_counts, f)
-
-with open("regex_ids.pkl", "wb") as f:
-    pickle.dump(regex_ids, f)
+# Save the labels, regex counts and regex ids as Parquet files
+write_label_matches(get_unique_labels(data), regex_ids, regex_counts)
 
 print("regex counts retrieved")
 
@@ -1,16 +1,25 @@
-from collections import defaultdict
 import regex as re
 from qdrant_client import QdrantClient
+from qdrant_client.http.models import SearchParams
 import numpy as np
 
+from src.collection_utils.evaluation_results import (
+    flatten_values,
+    get_boxplot_data,
+    mean_by_threshold,
+)
+from src.collection_utils.label_index import get_label_matches
 from src.collection_utils.query_collection import (
     filter_search,
     get_semantically_similar_results,
+    get_semantically_similar_results_batch,
 )
 from src.sql_queries import query_evaluation_data
 from src.utils.bigquery import query_bigquery
 from src.utils.utils import load_model
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import BoundedSemaphore
+from time import perf_counter
 
 
 def calculate_precision(retrieved_records: list, relevant_records: list) -> float:
@@ -155,7 +164,8 @@ def get_regex_comparison(label: str, all_labels: str) -> int:
 
 def get_all_regex_counts(data: list[dict]) -> dict:
     """
-    Get the regex counts for all labels.
+    Get the regex counts for all labels. Labels are matched as literal substrings,
+    ignoring case, in one pass over the distinct labels.
 
     Args:
         data (list[dict]): The list of id, labels, and urgency.
@@ -163,12 +173,8 @@ def get_all_regex_counts(data: list[dict]) -> dict:
     Returns:
         list[dict]: The list of regex counts.
     """
-    all_labels = get_all_labels(data)  # Get single string of all labels
     unique_labels = get_unique_labels(data)  # Get list of unique labels
-    regex_counts = {}  # Initialise dict to store label and regex counts
-    for unique_label in unique_labels:  # Loop through unique labels
-        count = get_regex_comparison(unique_label, all_labels)  # Get regex count
-        regex_counts[unique_label] = count  # Store in dict
+    _, regex_counts = get_label_matches(data, unique_labels)  # Match all labels at once
     return regex_counts  # Return dict
 
 
@@ -192,7 +198,8 @@ def get_regex_ids(label: str, data: list[dict]) -> list[str]:
 
 def get_all_regex_ids(data: list[dict]) -> dict:
     """
-    Get the regex IDs for all labels.
+    Get the regex IDs for all labels. Labels are matched as literal substrings,
+    ignoring case, in one pass over the distinct labels.
 
     Args:
         data (list[dict]): The list of id, labels, and urgency.
@@ -201,10 +208,7 @@ def get_all_regex_ids(data: list[dict]) -> dict:
         list[dict]: The list of regex IDs.
     """
     unique_labels = get_unique_labels(data)  # Get list of unique labels
-    regex_ids = {}  # Initialise dict to store label and regex IDs
-    for unique_label in unique_labels:  # Loop through unique labels
-        ids = get_regex_ids(unique_label, data)  # Get regex IDs
-        regex_ids[unique_label] = ids  # Store in dict
+    regex_ids, _ = get_label_matches(data, unique_labels)  # Match all labels at once
     return regex_ids  # Return dict
 
 
@@ -240,26 +244,23 @@ def assess_retrieval_accuracy(
     # Test using only unique labels[0]
     unique_labels = ["application"]
 
-    # Retrieve top K results for each label
-    for unique_label in unique_labels:
+    # Embed all labels at once, and retrieve the top K results for each label in batches
+    query_embeddings = encode_labels(model, unique_labels)
+    try:
+        all_results = get_semantically_similar_results_batch(
+            client=client,
+            collection_name=collection_name,
+            query_embeddings=query_embeddings,
+            score_threshold=score_threshold,
+        )
+    except Exception as e:
+        print(f"get_semantically_similar_results_batch error: {e}")
+        return []
+
+    for unique_label, results in zip(unique_labels, all_results):
         # Get the count of records from the regex counts
         relevant_records = regex_ids[unique_label]
 
-        # Embed the label
-        query_embedding = model.encode(unique_label)
-
-        # Retrieve the top K results for the label
-        try:
-            results = get_semantically_similar_results(
-                client=client,
-                collection_name=collection_name,
-                query_embedding=query_embedding,
-                score_threshold=score_threshold,
-            )
-        except Exception as e:
-            print(f"get_semantically_similar_results error: {e}")
-            continue
-
         result_ids = [str(result.id) for result in results]
 
         # Calculate precision, recall, F1, & F2 score
@@ -346,18 +347,8 @@ def calculate_mean_values(data_list: list[dict]) -> dict:
 
     Returns:
         dict: Dictionary of mean values for each threshold"""
-    sums_counts = defaultdict(lambda: {"sum": 0, "count": 0})
-
-    for item in data_list:
-        for _, values in item.items():
-            for threshold, value in values.items():
-                sums_counts[threshold]["sum"] += value
-                sums_counts[threshold]["count"] += 1
-
-    mean_values = {
-        test: info["sum"] / info["count"] for test, info in sums_counts.items()
-    }
-    return mean_values
+    _, thresholds, values = flatten_values(data_list)
+    return mean_by_threshold(thresholds, values)
 
 
 def get_threshold_values(data: list[dict], input_threshold: float = 0.0) -> list:
@@ -378,6 +369,28 @@ def get_threshold_values(data: list[dict], input_threshold: float = 0.0) -> list
     return threshold_list
 
 
+def compare_mean_values(
+    baseline_values: list[dict], candidate_values: list[dict]
+) -> dict:
+    """
+    Calculate the change in the mean value at each threshold between two evaluation
+    runs, e.g. quantized search against unquantized search
+
+    Args:
+        baseline_values (list): list of dictionaries from the baseline run
+        candidate_values (list): list of dictionaries from the candidate run
+
+    Returns:
+        dict: Dictionary of the change in mean value for each threshold"""
+    baseline_means = calculate_mean_values(baseline_values)
+    candidate_means = calculate_mean_values(candidate_values)
+    return {
+        threshold: candidate_means[threshold] - baseline_means[threshold]
+        for threshold in baseline_means
+        if threshold in candidate_means
+    }
+
+
 def create_precision_boxplot_data(precision_values: list[dict]) -> dict:
     """
     Create data for precision boxplot
@@ -387,25 +400,8 @@ def create_precision_boxplot_data(precision_values: list[dict]) -> dict:
 
     Returns:
         dict: Dictionary of precision values"""
-    # Drop the label from the dict
-    precision_values = [list(item.values())[0] for item in precision_values]
-
-    # Initialise empty dic
-    precision_plotting_values = {}
-
-    # Loop over threshold values and store the precision values in dict
-    for i in np.arange(0, 1.1, 0.1):
-        threshold_list = get_threshold_values(
-            precision_values,
-            input_threshold=i,
-        )
-        precision_plotting_values[i] = threshold_list
-
-    # Round the keys to 2 decimal places
-    rounded_precision_values = {
-        round(key, 2): value for key, value in precision_plotting_values.items()
-    }
-    return rounded_precision_values
+    _, thresholds, values = flatten_values(precision_values)
+    return get_boxplot_data(thresholds, values)
 
 
 def create_recall_boxplot_data(recall_values: list[dict]) -> dict:
@@ -417,25 +413,8 @@ def create_recall_boxplot_data(recall_values: list[dict]) -> dict:
 
     Returns:
         dict: Dictionary of recall values"""
-    # Drop the label from the dict
-    recall_values = [list(item.values())[0] for item in recall_values]
-
-    # Initialise empty dict
-    recall_plotting_values = {}
-
-    # Loop over threshold values and store the recall values in dict
-    for i in np.arange(0, 1.1, 0.1):
-        threshold_list = get_threshold_values(
-            recall_values,
-            input_threshold=i,
-        )
-        recall_plotting_values[i] = threshold_list
-
-    # Round the keys to 2 decimal places
-    rounded_precision_values = {
-        round(key, 2): value for key, value in recall_plotting_values.items()
-    }
-    return rounded_precision_values
+    _, thresholds, values = flatten_values(recall_values)
+    return get_boxplot_data(thresholds, values)
 
 
 def create_precision_line_data(precision_values: list[dict]) -> dict:
@@ -490,6 +469,174 @@ def create_f2_line_data(f2_values: list[dict]) -> dict:
     return mean_f2_values
 
 
+def sweep_thresholds(
+    scores: np.ndarray,
+    is_relevant: np.ndarray,
+    n_relevant: int,
+    thresholds: np.ndarray,
+) -> tuple[dict, dict, dict]:
+    """
+    Calculate precision, recall and f2 score at every threshold from a single search.
+    Results are sorted by score once, then the number retrieved and the number of true
+    positives at each threshold are read from the cumulative sum of relevant results.
+
+    Args:
+        scores (np.ndarray): similarity score of each search result
+        is_relevant (np.ndarray): whether each search result is a relevant record
+        n_relevant (int): the number of relevant records
+        thresholds (np.ndarray): the similarity thresholds
+
+    Returns:
+        dict: Precision for each threshold
+        dict: Recall for each threshold
+        dict: F2 score for each threshold
+    """
+    order = np.argsort(-np.asarray(scores, dtype=float), kind="stable")
+    sorted_scores = np.asarray(scores, dtype=float)[order]
+    true_positives = np.concatenate(
+        [[0], np.cumsum(np.asarray(is_relevant, dtype=bool)[order])]
+    )
+
+    # Number of results with a score of at least each threshold, as Qdrant returns
+    n_retrieved = np.searchsorted(-sorted_scores, -np.asarray(thresholds), "right")
+    tp = true_positives[n_retrieved]
+
+    precision = np.divide(
+        tp, n_retrieved, out=np.zeros(len(n_retrieved)), where=n_retrieved > 0
+    )
+    recall = tp / n_relevant if n_relevant else np.zeros(len(n_retrieved))
+    f2_denominator = 4 * precision + recall
+    f2_score = np.divide(
+        5 * precision * recall,
+        f2_denominator,
+        out=np.zeros(len(n_retrieved)),
+        where=f2_denominator > 0,
+    )
+
+    return (
+        dict(zip(thresholds, precision.tolist())),
+        dict(zip(thresholds, recall.tolist())),
+        dict(zip(thresholds, f2_score.tolist())),
+    )
+
+
+def calculate_threshold_metrics(
+    results: list,
+    relevant_records: list,
+    thresholds: np.ndarray,
+) -> tuple[dict, dict, dict]:
+    """
+    Calculate precision, recall and f2 score at every threshold from the results of one
+    search at the lowest threshold
+
+    Args:
+        results (list): The search results, with ids and scores
+        relevant_records (list): The ids of the relevant records
+        thresholds (np.ndarray): The similarity thresholds
+
+    Returns:
+        dict: Precision for each threshold
+        dict: Recall for each threshold
+        dict: F2 score for each threshold
+    """
+    relevant_ids = set(relevant_records)
+    scores = np.array([result.score for result in results], dtype=float)
+    is_relevant = np.array(
+        [str(result.id) in relevant_ids for result in results], dtype=bool
+    )
+    return sweep_thresholds(scores, is_relevant, len(relevant_records), thresholds)
+
+
+def calculate_ranking_metrics(
+    scores: np.ndarray,
+    is_relevant: np.ndarray,
+    n_relevant: int,
+    ks: tuple[int, ...] = (10, 50, 100),
+) -> dict:
+    """
+    Calculate recall@k and nDCG@k for each k, and average precision, from the scores
+    of the ranked results of one search
+
+    Args:
+        scores (np.ndarray): similarity score of each search result
+        is_relevant (np.ndarray): whether each search result is a relevant record
+        n_relevant (int): the number of relevant records
+        ks (tuple[int, ...], optional): the cut-offs. Defaults to (10, 50, 100).
+
+    Returns:
+        dict: recall@k and ndcg@k for each k, and average_precision
+    """
+    order = np.argsort(-np.asarray(scores, dtype=float), kind="stable")
+    relevant = np.asarray(is_relevant, dtype=bool)[order]
+    n_results = len(relevant)
+    hits = np.cumsum(relevant)
+    discounts = 1 / np.log2(np.arange(2, n_results + 2))
+    dcg = np.cumsum(relevant * discounts)
+
+    metrics = {}
+    for k in ks:
+        depth = min(k, n_results)
+        hits_at_k = hits[depth - 1] if depth else 0
+        metrics[f"recall@{k}"] = float(hits_at_k / n_relevant) if n_relevant else 0.0
+        # The ideal ranking has every relevant record at the top
+        ideal_dcg = np.sum(1 / np.log2(np.arange(2, min(k, n_relevant) + 2)))
+        metrics[f"ndcg@{k}"] = (
+            float(dcg[depth - 1] / ideal_dcg) if depth and ideal_dcg > 0 else 0.0
+        )
+
+    # Relevant records that were not retrieved count as misses
+    precision_at_hits = hits[relevant] / (np.flatnonzero(relevant) + 1)
+    metrics["average_precision"] = (
+        float(precision_at_hits.sum() / n_relevant) if n_relevant else 0.0
+    )
+    return metrics
+
+
+def summarise_ranking_metrics(ranking_values: list[dict]) -> dict:
+    """
+    Calculate the mean of each ranking metric over labels, e.g. mean average precision
+
+    Args:
+        ranking_values (list[dict]): the ranking metrics for each label
+
+    Returns:
+        dict: the mean of each metric, with average_precision as map
+    """
+    metrics = [values for item in ranking_values for values in item.values()]
+    if not metrics:
+        return {}
+    names = list(metrics[0])
+    means = np.nanmean(
+        np.array(
+            [
+                [np.nan if m[name] is None else m[name] for name in names]
+                for m in metrics
+            ],
+            dtype=float,
+        ),
+        axis=0,
+    )
+    return {
+        ("map" if name == "average_precision" else name): float(mean)
+        for name, mean in zip(names, means)
+    }
+
+
+def encode_labels(model: object, labels: list[str], batch_size: int = 256):
+    """
+    Embed all labels with one call to the model, which batches them internally
+
+    Args:
+        model (Any): The model object
+        labels (list[str]): The labels
+        batch_size (int, optional): The number of labels per model batch. Defaults to 256.
+
+    Returns:
+        np.ndarray: The embedding of each label, in order
+    """
+    return model.encode(labels, batch_size=batch_size)
+
+
 def calculate_metrics(
     unique_label: str,
     regex_ids: dict,
@@ -497,6 +644,7 @@ def calculate_metrics(
     client: object,
     similarity_threshold: float,
     collection_name: str,
+    search_params: SearchParams | None = None,
 ):
     """
     Calculate precision, recall and f2 score for a given label
@@ -508,6 +656,7 @@ def calculate_metrics(
         client (Any): The client object
         similarity_threshold (float): The similarity threshold
         collection_name (str): The name of the collection
+        search_params (SearchParams, optional): e.g. quantization params. Defaults to None.
 
     Returns:
         float: Precision
@@ -527,6 +676,7 @@ def calculate_metrics(
             collection_name,
             query_embedding,
             similarity_threshold,
+            search_params=search_params,
         )
 
     except Exception as e:
@@ -543,87 +693,223 @@ def calculate_metrics(
     return precision, recall, f2_score
 
 
-def process_labels(unique_labels, regex_ids, model, client, collection_name):
+def format_progress(n_done: int, n_total: int, start_time: float) -> str:
+    """
+    Format progress through a run, with the elapsed time and an estimate of the time left
+
+    Args:
+        n_done (int): the number of items done
+        n_total (int): the total number of items
+        start_time (float): time.perf_counter() at the start of the run
+
+    Returns:
+        str: the progress message
+    """
+    elapsed = perf_counter() - start_time
+    eta = elapsed / n_done * (n_total - n_done) if n_done else float("nan")
+    return f"{n_done}/{n_total} ({n_done / n_total:.0%}), {elapsed:.0f}s elapsed, ETA {eta:.0f}s"
+
+
+def process_label_batch(
+    batch_labels: list[str],
+    batch_embeddings,
+    regex_ids: dict,
+    client: QdrantClient,
+    collection_name: str,
+    thresholds: np.ndarray,
+    search_params: SearchParams | None,
+    search_semaphore: BoundedSemaphore,
+) -> list[tuple[dict, dict, dict]]:
+    """
+    Search for a batch of labels in one request and calculate their metrics
+
+    Args:
+        batch_labels (list[str]): The labels
+        batch_embeddings (np.ndarray): The embedding of each label
+        regex_ids (dict): The dictionary of regex IDs
+        client (QdrantClient): The client object
+        collection_name (str): The name of the collection
+        thresholds (np.ndarray): The similarity thresholds
+        search_params (SearchParams | None): e.g. quantization params
+        search_semaphore (BoundedSemaphore): bounds the number of requests in flight
+
+    Returns:
+        list[tuple[dict, dict, dict]]: precision, recall and f2 score for each label
+    """
+    try:
+        with search_semaphore:
+            batch_results = get_semantically_similar_results_batch(
+                client,
+                collection_name,
+                batch_embeddings,
+                float(np.min(thresholds)),
+                search_params=search_params,
+                batch_size=len(batch_labels),
+            )
+    except Exception as e:
+        print(f"get_semantically_similar_results_batch error: {e}")
+        batch_results = [None] * len(batch_labels)
+
+    batch_metrics = []
+    for unique_label, results in zip(batch_labels, batch_results):
+        if results is None:
+            batch_metrics.append(
+                (
+                    dict.fromkeys(thresholds),
+                    dict.fromkeys(thresholds),
+                    dict.fromkeys(thresholds),
+                )
+            )
+        else:
+            batch_metrics.append(
+                calculate_threshold_metrics(
+                    results, regex_ids[unique_label], thresholds
+                )
+            )
+    return batch_metrics
+
+
+def process_labels(
+    unique_labels,
+    regex_ids,
+    model,
+    client,
+    collection_name,
+    search_params=None,
+    thresholds=np.arange(0, 1.1, 0.1),
+    encode_batch_size=256,
+    search_batch_size=64,
+    n_workers=4,
+    max_in_flight=None,
+    progress_callback=None,
+):
+    """
+    Calculate precision, recall and f2 score for every label and threshold. Labels are
+    embedded at once, then searched in batches by a pool of worker threads sharing the
+    model's embeddings and the client.
+
+    Args:
+        unique_labels (list[str]): The unique labels
+        regex_ids (dict): The dictionary of regex IDs
+        model (Any): The model object
+        client (Any): The client object
+        collection_name (str): The name of the collection
+        search_params (SearchParams, optional): e.g. quantization params. Defaults to None.
+        thresholds (np.ndarray, optional): The similarity thresholds. Defaults to
+            np.arange(0, 1.1, 0.1).
+        encode_batch_size (int, optional): Labels per model batch. Defaults to 256.
+        search_batch_size (int, optional): Label searches per request. Defaults to 64.
+        n_workers (int, optional): Number of worker threads. Defaults to 4.
+        max_in_flight (int, optional): Maximum number of requests to Qdrant at once.
+            Defaults to n_workers.
+        progress_callback (Callable, optional): called with the number of labels done
+            and the total after each batch. Defaults to None.
+
+    Returns:
+        list[dict]: precision values for each label, in the order of unique_labels
+        list[dict]: recall values for each label, in the order of unique_labels
+        list[dict]: f2 scores for each label, in the order of unique_labels
+    """
+    # Embed all labels at once
+    query_embeddings = encode_labels(model, unique_labels, batch_size=encode_batch_size)
+
+    search_semaphore = BoundedSemaphore(max_in_flight or n_workers)
+    batch_starts = list(range(0, len(unique_labels), search_batch_size))
+    batch_metrics = [None] * len(batch_starts)
+
+    # Search for search_batch_size labels per request, at the lowest threshold
+    start_time = perf_counter()
+    n_done = 0
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            executor.submit(
+                process_label_batch,
+                unique_labels[start_idx : start_idx + search_batch_size],
+                query_embeddings[start_idx : start_idx + search_batch_size],
+                regex_ids,
+                client,
+                collection_name,
+                thresholds,
+                search_params,
+                search_semaphore,
+            ): batch_idx
+            for batch_idx, start_idx in enumerate(batch_starts)
+        }
+        for future in as_completed(futures):
+            batch_idx = futures[future]
+            batch_metrics[batch_idx] = future.result()
+            n_done += len(batch_metrics[batch_idx])
+            print(
+                "Metrics calculated for labels: "
+                + format_progress(n_done, len(unique_labels), start_time)
+            )
+            if progress_callback is not None:
+                progress_callback(n_done, len(unique_labels))
+
+    # Collect results in the order of the labels, whatever order batches finished in
     precision_values = []
     recall_values = []
     f2_scores = []
-    batch_size = 100
-    num_batches = len(unique_labels) // batch_size + 1
-
-    for batch_idx in range(num_batches):
-        start_idx = batch_idx * batch_size
-        end_idx = min((batch_idx + 1) * batch_size, len(unique_labels))
-        batch_labels = unique_labels[start_idx:end_idx]
-
-        for unique_label in batch_labels:
-            label_precision = {}
-            label_recall = {}
-            label_f2_scores = {}
-
-            for threshold in np.arange(0, 1.1, 0.1):
-                try:
-                    precision, recall, f2_score = calculate_metrics(
-                        unique_label=unique_label,
-                        regex_ids=regex_ids,
-                        model=model,
-                        client=client,
-                        similarity_threshold=threshold,
-                        collection_name=collection_name,
-                    )
-                    label_precision[threshold] = precision
-                    label_recall[threshold] = recall
-                    label_f2_scores[threshold] = f2_score
-                except Exception as e:
-                    print(
-                        f"Error processing {unique_label} at threshold {threshold}: {e}"
-                    )
-                    sleep(0.01)  # Sleep for 10ms to avoid rate limiting
-
-            precision_values.append({unique_label: label_precision})
-            recall_values.append({unique_label: label_recall})
-            f2_scores.append({unique_label: label_f2_scores})
-        print(f"Metrics calculated for labels: {start_idx} to {end_idx}")
+    for start_idx, metrics in zip(batch_starts, batch_metrics):
+        batch_labels = unique_labels[start_idx : start_idx + search_batch_size]
+        for unique_label, (precision, recall, f2_score) in zip(batch_labels, metrics):
+            precision_values.append({unique_label: precision})
+            recall_values.append({unique_label: recall})
+            f2_scores.append({unique_label: f2_score})
 
     return precision_values, recall_values, f2_scores
 
 
-# def process_single_label(unique_label, regex_ids, model, client, collection_name):
-#     label_precision = {}
-#     label_recall = {}
-#     label_f2_scores = {}
-
-#     for threshold in np.arange(0, 1.1, 0.1):
-#         try:
-#             precision, recall, f2_score = calculate_metrics(
-#                 unique_label=unique_label,
-#                 regex_ids=regex_ids,
-#                 model=model,
-#                 client=client,
-#                 similarity_threshold=threshold,
-#                 collection_name=collection_name,
-#             )
-#             label_precision[threshold] = precision
-#             label_recall[threshold] = recall
-#             label_f2_scores[threshold] = f2_score
-#         except Exception as e:
-#             print(f"Error processing {unique_label} at threshold {threshold}: {e}")
-
-#     return {
-#         "precision": {unique_label: label_precision},
-#         "recall": {unique_label: label_recall},
-#         "f2_scores": {unique_label: label_f2_scores},
-#     }
-
-
-# async def process_labels(unique_labels, regex_ids, model, client, collection_name):
-#     tasks = [
-#         process_single_label(label, regex_ids, model, client, collection_name)
-#         for label in unique_labels
-#     ]
-#     results = await asyncio.gather(*tasks)
-
-#     precision_values = [result["precision"] for result in results]
-#     recall_values = [result["recall"] for result in results]
-#     f2_scores = [result["f2_scores"] for result in results]
-
-#     return precision_values, recall_values, f2_scores
+def process_ranking_metrics(
+    unique_labels,
+    regex_ids,
+    model,
+    client,
+    collection_name,
+    ks=(10, 50, 100),
+    search_params=None,
+    search_batch_size=64,
+):
+    """
+    Calculate ranking metrics for every label, searching without a score threshold so
+    every record is ranked
+
+    Args:
+        unique_labels (list[str]): The unique labels
+        regex_ids (dict): The dictionary of regex IDs
+        model (Any): The model object
+        client (Any): The client object
+        collection_name (str): The name of the collection
+        ks (tuple[int, ...], optional): the cut-offs. Defaults to (10, 50, 100).
+        search_params (SearchParams, optional): e.g. quantization params. Defaults to None.
+        search_batch_size (int, optional): Label searches per request. Defaults to 64.
+
+    Returns:
+        list[dict]: ranking metrics for each label, in the order of unique_labels
+    """
+    query_embeddings = encode_labels(model, unique_labels)
+    ranking_values = []
+    for start_idx in range(0, len(unique_labels), search_batch_size):
+        batch_labels = unique_labels[start_idx : start_idx + search_batch_size]
+        batch_results = get_semantically_similar_results_batch(
+            client,
+            collection_name,
+            query_embeddings[start_idx : start_idx + search_batch_size],
+            None,
+            search_params=search_params,
+            batch_size=search_batch_size,
+        )
+        for unique_label, results in zip(batch_labels, batch_results):
+            relevant_ids = set(regex_ids[unique_label])
+            scores = np.array([result.score for result in results], dtype=float)
+            is_relevant = np.array(
+                [str(result.id) in relevant_ids for result in results], dtype=bool
+            )
+            ranking_values.append(
+                {
+                    unique_label: calculate_ranking_metrics(
+                        scores, is_relevant, len(regex_ids[unique_label]), ks
+                    )
+                }
+            )
+    return ranking_values
@@ -0,0 +1,200 @@
+import hashlib
+import json
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+from qdrant_client import QdrantClient
+
+from src.collection_utils.evaluation_results import (
+    flatten_values,
+    is_current,
+    read_table,
+    results_schema,
+    write_table,
+)
+
+EVALUATION_CACHE_PATH = "data/evaluation_cache.parquet"
+
+cache_schema = pa.schema(
+    [("key", pa.string()), ("context", pa.string()), *results_schema]
+)
+
+
+def get_collection_version(
+    client: QdrantClient, collection_name: str, chunk_size: int = 1000
+) -> str:
+    """Fingerprint a collection from its config and the ids, vectors and payloads of
+    all of its points, so that changing any point changes the version. The points are
+    scrolled and hashed a chunk at a time.
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        chunk_size (int, optional): number of points to scroll at a time. Defaults to
+            1000.
+
+    Returns:
+        str: the collection version
+    """
+    info = client.get_collection(collection_name)
+    fingerprint = hashlib.sha256()
+    fingerprint.update(f"{info.points_count}|{info.config.params}".encode())
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name,
+            limit=chunk_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for record in records:
+            fingerprint.update(str(record.id).encode())
+            fingerprint.update(np.asarray(record.vector, dtype=np.float32).tobytes())
+            fingerprint.update(
+                json.dumps(record.payload, sort_keys=True, default=str).encode()
+            )
+        if offset is None:
+            break
+    return fingerprint.hexdigest()[:16]
+
+
+def get_label_key(label: str, relevant_records: list, context: dict) -> str:
+    """Get the cache key for a label's results
+
+    Args:
+        label (str): the label
+        relevant_records (list): the ids of the records matching the label
+        context (dict): everything else the results depend on, e.g. the collection
+            version, model name, threshold grid and search params
+
+    Returns:
+        str: the cache key
+    """
+    ids_hash = hashlib.sha256(
+        "\n".join(sorted(str(id) for id in relevant_records)).encode()
+    ).hexdigest()
+    key = json.dumps([label, ids_hash, context], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def read_cache(path: str) -> dict:
+    """Read cached results
+
+    Args:
+        path (str): the path of the cache file
+
+    Returns:
+        dict: the label, context and precision, recall and f2 score dicts for each
+            cache key
+    """
+    if not is_current(path):
+        return {}
+    table = read_table(path)
+    cache = {}
+    for key, context, label, threshold, precision, recall, f2 in zip(
+        *[table[column].to_pylist() for column in cache_schema.names]
+    ):
+        entry = cache.setdefault(key, (label, context, ({}, {}, {})))
+        entry[2][0][threshold] = precision
+        entry[2][1][threshold] = recall
+        entry[2][2][threshold] = f2
+    return cache
+
+
+def write_cache(cache: dict, path: str):
+    """Write cached results
+
+    Args:
+        cache (dict): the label, context and precision, recall and f2 score dicts for
+            each cache key
+        path (str): the path of the cache file
+    """
+    columns = {name: [] for name in cache_schema.names}
+    for key, (label, context, (precision, recall, f2)) in cache.items():
+        _, thresholds, precision_values = flatten_values([{label: precision}])
+        _, _, recall_values = flatten_values([{label: recall}])
+        _, _, f2_values = flatten_values([{label: f2}])
+        columns["key"].extend([key] * len(thresholds))
+        columns["context"].extend([context] * len(thresholds))
+        columns["label"].extend([label] * len(thresholds))
+        columns["threshold"].extend(thresholds)
+        columns["precision"].extend(precision_values)
+        columns["recall"].extend(recall_values)
+        columns["f2"].extend(f2_values)
+    write_table(pa.table(columns, schema=cache_schema), path)
+
+
+def process_labels_with_cache(
+    unique_labels: list[str],
+    regex_ids: dict,
+    context: dict,
+    compute: Callable[[list[str]], tuple[list, list, list]],
+    path: str = EVALUATION_CACHE_PATH,
+) -> tuple[list[dict], list[dict], list[dict]]:
+    """Get precision, recall and f2 scores for every label, computing only the labels
+    that are not cached for this context. Results for other contexts are kept only if
+    they are for the same collection version, so the cache does not grow with every
+    rebuild of the collection.
+
+    Args:
+        unique_labels (list[str]): the labels
+        regex_ids (dict): the ids of the records matching each label
+        context (dict): everything else the results depend on, e.g. the collection
+            version, model name, threshold grid and search params
+        compute (Callable): computes the results for a list of labels, e.g.
+            process_labels with everything but the labels bound
+        path (str, optional): the path of the cache file. Defaults to
+            EVALUATION_CACHE_PATH.
+
+    Returns:
+        list[dict]: precision values for each label, in the order of unique_labels
+        list[dict]: recall values for each label, in the order of unique_labels
+        list[dict]: f2 scores for each label, in the order of unique_labels
+    """
+    context_json = json.dumps(context, sort_keys=True, default=str)
+    keys = {
+        label: get_label_key(label, regex_ids[label], context)
+        for label in unique_labels
+    }
+    cache = read_cache(path)
+    missing_labels = [label for label in unique_labels if keys[label] not in cache]
+    print(
+        f"{len(unique_labels) - len(missing_labels)} labels cached, "
+        f"computing {len(missing_labels)}"
+    )
+
+    computed = {}
+    if missing_labels:
+        for precision, recall, f2_score in zip(*compute(missing_labels)):
+            label = next(iter(precision))
+            computed[label] = (precision[label], recall[label], f2_score[label])
+
+    # Keep results for other contexts on the same collection, e.g. other search params
+    new_cache = {
+        key: entry
+        for key, entry in cache.items()
+        if entry[1] != context_json
+        and json.loads(entry[1]).get("collection_version")
+        == context.get("collection_version")
+    }
+
+    precision_values = []
+    recall_values = []
+    f2_scores = []
+    for label in unique_labels:
+        if label in computed:
+            values = computed[label]
+            # Don't cache labels whose search failed, so they are retried
+            if not any(value is None for value in values[0].values()):
+                new_cache[keys[label]] = (label, context_json, values)
+        else:
+            values = cache[keys[label]][2]
+            new_cache[keys[label]] = (label, context_json, values)
+        precision_values.append({label: values[0]})
+        recall_values.append({label: values[1]})
+        f2_scores.append({label: values[2]})
+
+    write_cache(new_cache, path)
+    return precision_values, recall_values, f2_scores
@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+EVALUATION_PROGRESS_PATH = "data/evaluation_progress.json"
+EVALUATION_LOG_PATH = "data/evaluation_job.log"
+
+
+def write_progress(
+    status: str,
+    n_done: int = 0,
+    n_total: int = 0,
+    message: str = "",
+    path: str = EVALUATION_PROGRESS_PATH,
+    pid: int | None = None,
+):
+    """Record the progress of an evaluation job, replacing the file atomically so it is
+    never read half written
+
+    Args:
+        status (str): "running", "done" or "failed"
+        n_done (int, optional): the number of labels evaluated. Defaults to 0.
+        n_total (int, optional): the number of labels to evaluate. Defaults to 0.
+        message (str, optional): the current stage, or the error. Defaults to "".
+        path (str, optional): the path of the progress file. Defaults to
+            EVALUATION_PROGRESS_PATH.
+        pid (int, optional): the process id of the job. Defaults to the current process.
+    """
+    progress = {
+        "status": status,
+        "n_done": n_done,
+        "n_total": n_total,
+        "message": message,
+        "pid": pid or os.getpid(),
+        "updated_time": time.time(),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def read_progress(path: str = EVALUATION_PROGRESS_PATH) -> dict | None:
+    """Read the progress of the last evaluation job
+
+    Args:
+        path (str, optional): the path of the progress file. Defaults to
+            EVALUATION_PROGRESS_PATH.
+
+    Returns:
+        dict | None: the progress, or None if no job has been started
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_running(progress: dict | None) -> bool:
+    """Check whether a job is still running, treating a job whose process has exited
+    without recording that it finished as not running
+
+    Args:
+        progress (dict | None): the progress from read_progress
+
+    Returns:
+        bool: whether the job is running
+    """
+    if progress is None or progress["status"] != "running":
+        return False
+    try:
+        os.kill(progress["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def start_evaluation_job(
+    args: list[str],
+    progress_path: str = EVALUATION_PROGRESS_PATH,
+    log_path: str = EVALUATION_LOG_PATH,
+) -> subprocess.Popen:
+    """Run evaluation/create_eval_json.py in the background, recording its progress and
+    writing its output to a log file
+
+    Args:
+        args (list[str]): arguments for the script, e.g. ["--save_outputs", "True"]
+        progress_path (str, optional): the path of the progress file. Defaults to
+            EVALUATION_PROGRESS_PATH.
+        log_path (str, optional): the path of the log file. Defaults to
+            EVALUATION_LOG_PATH.
+
+    Returns:
+        subprocess.Popen: the job
+    """
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, "w") as log_file:
+        job = subprocess.Popen(
+            [
+                sys.executable,
+                "-u",
+                "evaluation/create_eval_json.py",
+                *args,
+                "--progress_file",
+                progress_path,
+            ],
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            # Keep running if the app that started it is restarted
+            start_new_session=True,
+        )
+    write_progress("running", message="Starting", path=progress_path, pid=job.pid)
+    return job
+
+
+def read_log_tail(path: str = EVALUATION_LOG_PATH, n_lines: int = 20) -> str:
+    """Read the last lines of a job's log
+
+    Args:
+        path (str, optional): the path of the log file. Defaults to EVALUATION_LOG_PATH.
+        n_lines (int, optional): the number of lines. Defaults to 20.
+
+    Returns:
+        str: the last lines of the log
+    """
+    if not os.path.exists(path):
+        return ""
+    with open(path) as f:
+        return "".join(f.readlines()[-n_lines:])
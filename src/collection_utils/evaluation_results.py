@@ -0,0 +1,396 @@
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Bump when the columns of the result files change, so stale files are recreated
+RESULTS_SCHEMA_VERSION = "1"
+
+RESULTS_PATH = "data/evaluation_results.parquet"
+LABELS_PATH = "data/labels.parquet"
+LABEL_MATCHES_PATH = "data/label_matches.parquet"
+PLOT_DATA_PATH = "data/evaluation_plot_data.json"
+
+results_schema = pa.schema(
+    [
+        ("label", pa.string()),
+        ("threshold", pa.float64()),
+        ("precision", pa.float64()),
+        ("recall", pa.float64()),
+        ("f2", pa.float64()),
+    ]
+)
+
+
+def flatten_values(values: list[dict]) -> tuple[list, np.ndarray, np.ndarray]:
+    """Flatten [{label: {threshold: value}}] into one row per label and threshold
+
+    Args:
+        values (list[dict]): e.g. precision values from process_labels
+
+    Returns:
+        list: the label of each row
+        np.ndarray: the threshold of each row
+        np.ndarray: the value of each row, NaN where it is missing
+    """
+    labels = []
+    thresholds = []
+    row_values = []
+    for item in values:
+        for label, label_values in item.items():
+            for threshold, value in label_values.items():
+                labels.append(label)
+                thresholds.append(threshold)
+                row_values.append(np.nan if value is None else value)
+    return labels, np.array(thresholds, dtype=float), np.array(row_values, dtype=float)
+
+
+def group_by_threshold(
+    thresholds: np.ndarray, values: np.ndarray
+) -> tuple[np.ndarray, list[np.ndarray]]:
+    """Group values by threshold
+
+    Args:
+        thresholds (np.ndarray): the threshold of each row
+        values (np.ndarray): the value of each row
+
+    Returns:
+        np.ndarray: the distinct thresholds, in ascending order
+        list[np.ndarray]: the values for each threshold
+    """
+    unique_thresholds, inverse = np.unique(thresholds, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.cumsum(np.bincount(inverse, minlength=len(unique_thresholds)))[:-1]
+    return unique_thresholds, np.split(values[order], splits)
+
+
+def mean_by_threshold(thresholds: np.ndarray, values: np.ndarray) -> dict:
+    """Calculate the mean value for each threshold, ignoring missing values
+
+    Args:
+        thresholds (np.ndarray): the threshold of each row
+        values (np.ndarray): the value of each row
+
+    Returns:
+        dict: the mean value for each threshold
+    """
+    unique_thresholds, inverse = np.unique(thresholds, return_inverse=True)
+    present = ~np.isnan(values)
+    sums = np.bincount(
+        inverse[present], weights=values[present], minlength=len(unique_thresholds)
+    )
+    counts = np.bincount(inverse[present], minlength=len(unique_thresholds))
+    means = np.divide(sums, counts, out=np.full(len(sums), np.nan), where=counts > 0)
+    return dict(zip(unique_thresholds.tolist(), means.tolist()))
+
+
+def get_boxplot_data(thresholds: np.ndarray, values: np.ndarray) -> dict:
+    """Get the values at each threshold for a boxplot, keyed by the threshold rounded
+    to 2 decimal places
+
+    Args:
+        thresholds (np.ndarray): the threshold of each row
+        values (np.ndarray): the value of each row
+
+    Returns:
+        dict: the values for each threshold
+    """
+    unique_thresholds, groups = group_by_threshold(thresholds, values)
+    return {
+        round(threshold, 2): group.tolist()
+        for threshold, group in zip(unique_thresholds.tolist(), groups)
+    }
+
+
+def get_line_data(thresholds: np.ndarray, values: np.ndarray) -> dict:
+    """Get the mean value at each threshold for a line plot, with the thresholds and
+    means rounded to 2 decimal places
+
+    Args:
+        thresholds (np.ndarray): the threshold of each row
+        values (np.ndarray): the value of each row
+
+    Returns:
+        dict: the mean value for each threshold
+    """
+    return {
+        round(threshold, 2): round(mean, 2)
+        for threshold, mean in mean_by_threshold(thresholds, values).items()
+    }
+
+
+def get_box_stats(thresholds: np.ndarray, values: np.ndarray) -> dict:
+    """Get the statistics plotted by a box plot at each threshold, keyed by the threshold
+    rounded to 2 decimal places, ignoring missing values. The whiskers extend to the
+    furthest values within 1.5 times the interquartile range, as Plotly draws them.
+
+    Args:
+        thresholds (np.ndarray): the threshold of each row
+        values (np.ndarray): the value of each row
+
+    Returns:
+        dict: q1, median, q3, lowerfence, upperfence and mean for each threshold
+    """
+    unique_thresholds, groups = group_by_threshold(thresholds, values)
+    box_stats = {}
+    for threshold, group in zip(unique_thresholds.tolist(), groups):
+        group = group[~np.isnan(group)]
+        if len(group) == 0:
+            continue
+        q1, median, q3 = np.percentile(group, [25, 50, 75])
+        iqr = q3 - q1
+        box_stats[round(threshold, 2)] = {
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "lowerfence": float(group[group >= q1 - 1.5 * iqr].min()),
+            "upperfence": float(group[group <= q3 + 1.5 * iqr].max()),
+            "mean": float(group.mean()),
+        }
+    return box_stats
+
+
+def to_results_table(
+    precision_values: list[dict], recall_values: list[dict], f2_scores: list[dict]
+) -> pa.Table:
+    """Convert the output of process_labels to a table with one row per label and
+    threshold
+
+    Args:
+        precision_values (list[dict]): precision values for each label
+        recall_values (list[dict]): recall values for each label
+        f2_scores (list[dict]): f2 scores for each label
+
+    Returns:
+        pa.Table: columns label, threshold, precision, recall and f2
+    """
+    labels, thresholds, precision = flatten_values(precision_values)
+    _, _, recall = flatten_values(recall_values)
+    _, _, f2 = flatten_values(f2_scores)
+    return pa.table(
+        {
+            "label": labels,
+            "threshold": thresholds,
+            "precision": pa.array(precision, from_pandas=True),
+            "recall": pa.array(recall, from_pandas=True),
+            "f2": pa.array(f2, from_pandas=True),
+        },
+        schema=results_schema,
+    )
+
+
+def write_table(table: pa.Table, path: str):
+    """Write a table to Parquet with the schema version in its metadata, replacing the
+    file atomically
+
+    Args:
+        table (pa.Table): the table
+        path (str): the path of the Parquet file
+    """
+    metadata = {**(table.schema.metadata or {})}
+    metadata[b"schema_version"] = RESULTS_SCHEMA_VERSION.encode()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_table(path: str, columns: list[str] | None = None) -> pa.Table:
+    """Read a table written by write_table, memory-mapped
+
+    Args:
+        path (str): the path of the Parquet file
+        columns (list[str], optional): the columns to read. Defaults to all columns.
+
+    Raises:
+        ValueError: if the file was written with a different schema version
+
+    Returns:
+        pa.Table: the table
+    """
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    version = (table.schema.metadata or {}).get(b"schema_version", b"").decode()
+    if version != RESULTS_SCHEMA_VERSION:
+        raise ValueError(
+            f"{path} has schema version '{version}', expected '{RESULTS_SCHEMA_VERSION}'"
+        )
+    return table
+
+
+def is_current(path: str) -> bool:
+    """Check a result file exists and has the current schema version
+
+    Args:
+        path (str): the path of the Parquet file
+
+    Returns:
+        bool: whether the file can be read
+    """
+    if not os.path.exists(path):
+        return False
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(b"schema_version", b"").decode() == RESULTS_SCHEMA_VERSION
+
+
+def write_results(
+    precision_values: list[dict],
+    recall_values: list[dict],
+    f2_scores: list[dict],
+    path: str = RESULTS_PATH,
+):
+    """Write the output of process_labels to Parquet
+
+    Args:
+        precision_values (list[dict]): precision values for each label
+        recall_values (list[dict]): recall values for each label
+        f2_scores (list[dict]): f2 scores for each label
+        path (str, optional): the path of the Parquet file. Defaults to RESULTS_PATH.
+    """
+    write_table(to_results_table(precision_values, recall_values, f2_scores), path)
+
+
+def write_label_matches(
+    unique_labels: list[str],
+    regex_ids: dict,
+    regex_counts: dict,
+    labels_path: str = LABELS_PATH,
+    matches_path: str = LABEL_MATCHES_PATH,
+):
+    """Write the unique labels with their match counts, and the ids matching each label,
+    to Parquet
+
+    Args:
+        unique_labels (list[str]): the unique labels
+        regex_ids (dict): the ids of the records matching each label
+        regex_counts (dict): the label and number of matches for each label
+        labels_path (str, optional): path of the labels file. Defaults to LABELS_PATH.
+        matches_path (str, optional): path of the matches file. Defaults to
+            LABEL_MATCHES_PATH.
+    """
+    write_table(
+        pa.table(
+            {
+                "label": unique_labels,
+                "n_matches": [
+                    regex_counts[label]["n_matches"] for label in unique_labels
+                ],
+            },
+            schema=pa.schema([("label", pa.string()), ("n_matches", pa.int64())]),
+        ),
+        labels_path,
+    )
+    write_table(
+        pa.table(
+            {
+                "label": [label for label, ids in regex_ids.items() for _ in ids],
+                "id": [str(id) for ids in regex_ids.values() for id in ids],
+            },
+            schema=pa.schema([("label", pa.string()), ("id", pa.string())]),
+        ),
+        matches_path,
+    )
+
+
+def read_label_matches(
+    labels_path: str = LABELS_PATH, matches_path: str = LABEL_MATCHES_PATH
+) -> tuple[list[str], dict]:
+    """Read the unique labels and the ids matching each label
+
+    Args:
+        labels_path (str, optional): path of the labels file. Defaults to LABELS_PATH.
+        matches_path (str, optional): path of the matches file. Defaults to
+            LABEL_MATCHES_PATH.
+
+    Returns:
+        list[str]: the unique labels
+        dict: the ids of the records matching each label, in record order
+    """
+    unique_labels = read_table(labels_path, columns=["label"])["label"].to_pylist()
+    matches = read_table(matches_path)
+    regex_ids = {label: [] for label in unique_labels}
+    for label, id in zip(matches["label"].to_pylist(), matches["id"].to_pylist()):
+        regex_ids.setdefault(label, []).append(id)
+    return unique_labels, regex_ids
+
+
+def write_plot_data(results_path: str = RESULTS_PATH, path: str = PLOT_DATA_PATH):
+    """Precompute the data plotted by the evaluation app from a results file and save it
+    as JSON, so the app does not read or aggregate every label's results
+
+    Args:
+        results_path (str, optional): the path of the results file. Defaults to
+            RESULTS_PATH.
+        path (str, optional): the path of the JSON file. Defaults to PLOT_DATA_PATH.
+    """
+    table = read_table(results_path, columns=["threshold", "precision", "recall", "f2"])
+    thresholds = table["threshold"].to_numpy()
+    precision = table["precision"].to_numpy(zero_copy_only=False)
+    recall = table["recall"].to_numpy(zero_copy_only=False)
+    f2 = table["f2"].to_numpy(zero_copy_only=False)
+
+    line_data = {
+        "precision": get_line_data(thresholds, precision),
+        "recall": get_line_data(thresholds, recall),
+        "f2": get_line_data(thresholds, f2),
+    }
+    box_data = {
+        "precision": get_box_stats(thresholds, precision),
+        "recall": get_box_stats(thresholds, recall),
+    }
+    plot_data = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "results_modified_time": os.path.getmtime(results_path),
+        "thresholds": list(line_data["f2"]),
+        # JSON keys are strings, so store values as lists in the order of thresholds
+        "line": {metric: list(values.values()) for metric, values in line_data.items()},
+        "box": {
+            metric: [stats.get(threshold) for threshold in line_data["f2"]]
+            for metric, stats in box_data.items()
+        },
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(plot_data, f)
+    os.replace(tmp_path, path)
+
+
+def read_plot_data(path: str = PLOT_DATA_PATH) -> dict | None:
+    """Read the plot data saved by write_plot_data
+
+    Args:
+        path (str, optional): the path of the JSON file. Defaults to PLOT_DATA_PATH.
+
+    Returns:
+        dict | None: thresholds, line data and box plot statistics, or None if the file
+            does not exist or has a different schema version
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        plot_data = json.load(f)
+    if plot_data.get("schema_version") != RESULTS_SCHEMA_VERSION:
+        return None
+    return plot_data
+
+
+def plot_data_is_current(
+    results_path: str = RESULTS_PATH, path: str = PLOT_DATA_PATH
+) -> bool:
+    """Check the plot data was computed from the current results file
+
+    Args:
+        results_path (str, optional): the path of the results file. Defaults to
+            RESULTS_PATH.
+        path (str, optional): the path of the JSON file. Defaults to PLOT_DATA_PATH.
+
+    Returns:
+        bool: whether the plot data can be used
+    """
+    plot_data = read_plot_data(path)
+    return (
+        plot_data is not None
+        and is_current(results_path)
+        and plot_data["results_modified_time"] == os.path.getmtime(results_path)
+    )
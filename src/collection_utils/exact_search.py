@@ -0,0 +1,363 @@
+import os
+from typing import Iterator
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from src.collection_utils.evaluate_collection import (
+    calculate_ranking_metrics,
+    sweep_thresholds,
+)
+from src.collection_utils.evaluation_cache import get_collection_version
+
+
+def get_vector_paths(cache_dir: str, collection_name: str) -> tuple[str, str]:
+    """Get the paths of the cached ids and vectors for a collection
+
+    Args:
+        cache_dir (str): directory the vectors are cached in
+        collection_name (str): name of the collection
+
+    Returns:
+        str: path of the ids file
+        str: path of the vectors file
+    """
+    return (
+        os.path.join(cache_dir, f"{collection_name}_ids.npy"),
+        os.path.join(cache_dir, f"{collection_name}_vectors.npy"),
+    )
+
+
+def get_version_path(cache_dir: str, collection_name: str) -> str:
+    """Get the path of the version of the collection the cached vectors were exported
+    from, see get_collection_version
+
+    Args:
+        cache_dir (str): directory the vectors are cached in
+        collection_name (str): name of the collection
+
+    Returns:
+        str: path of the version file
+    """
+    return os.path.join(cache_dir, f"{collection_name}_version.txt")
+
+
+def export_vectors(
+    client: QdrantClient,
+    collection_name: str,
+    cache_dir: str = "data/exact_search",
+    chunk_size: int = 1000,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Scroll every vector in a collection into a float32 .npy file, with the point ids
+    in a second file, normalising the vectors so dot products are cosine similarities
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        cache_dir (str, optional): directory to write to. Defaults to "data/exact_search".
+        chunk_size (int, optional): number of points per scroll request. Defaults to 1000.
+
+    Returns:
+        np.ndarray: point ids as strings
+        np.ndarray: memory-mapped float32 vectors of shape (n_points, size)
+    """
+    ids_path, vectors_path = get_vector_paths(cache_dir, collection_name)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    version = get_collection_version(client, collection_name)
+    n_points = client.count(collection_name, exact=True).count
+    size = client.get_collection(collection_name).config.params.vectors.size
+
+    # Write to a temporary file first so an interrupted export is never loaded
+    tmp_vectors_path = f"{vectors_path}.tmp"
+    vectors = np.lib.format.open_memmap(
+        tmp_vectors_path, mode="w+", dtype=np.float32, shape=(n_points, size)
+    )
+    ids = []
+    offset = None
+    while len(ids) < n_points:
+        records, offset = client.scroll(
+            collection_name,
+            limit=chunk_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=True,
+        )
+        if not records:
+            break
+        chunk = np.array([record.vector for record in records], dtype=np.float32)
+        chunk /= np.maximum(np.linalg.norm(chunk, axis=1, keepdims=True), 1e-12)
+        vectors[len(ids) : len(ids) + len(records)] = chunk
+        ids.extend(str(record.id) for record in records)
+        if offset is None:
+            break
+    vectors.flush()
+    del vectors
+
+    np.save(ids_path, np.array(ids))
+    os.replace(tmp_vectors_path, vectors_path)
+    with open(get_version_path(cache_dir, collection_name), "w") as f:
+        f.write(version)
+    print(f"Exported {len(ids)} vectors from {collection_name} to {vectors_path}")
+
+    return load_vectors(cache_dir, collection_name)
+
+
+def load_vectors(
+    cache_dir: str, collection_name: str
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Load cached ids and memory-mapped vectors for a collection
+
+    Args:
+        cache_dir (str): directory the vectors are cached in
+        collection_name (str): name of the collection
+
+    Returns:
+        tuple[np.ndarray, np.ndarray] | None: ids and vectors, or None if not cached
+    """
+    ids_path, vectors_path = get_vector_paths(cache_dir, collection_name)
+    if not os.path.exists(ids_path) or not os.path.exists(vectors_path):
+        return None
+    ids = np.load(ids_path, allow_pickle=False)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    return ids, vectors
+
+
+def get_collection_vectors(
+    client: QdrantClient,
+    collection_name: str,
+    cache_dir: str = "data/exact_search",
+    refresh: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the ids and vectors of a collection, from the cache if it was exported from
+    the same version of the collection, otherwise by exporting them. Rebuilding or
+    re-embedding the collection changes its version, even with the same point count.
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        cache_dir (str, optional): directory the vectors are cached in. Defaults to
+            "data/exact_search".
+        refresh (bool, optional): export the vectors even if cached. Defaults to False.
+
+    Returns:
+        np.ndarray: point ids as strings
+        np.ndarray: memory-mapped float32 vectors of shape (n_points, size)
+    """
+    cached = None if refresh else load_vectors(cache_dir, collection_name)
+    version_path = get_version_path(cache_dir, collection_name)
+    if cached is not None and os.path.exists(version_path):
+        with open(version_path) as f:
+            cached_version = f.read()
+        if cached_version == get_collection_version(client, collection_name):
+            print(f"Loaded {len(cached[0])} cached vectors for {collection_name}")
+            return cached
+    return export_vectors(client, collection_name, cache_dir)
+
+
+def get_score_chunks(
+    query_embeddings, vectors: np.ndarray, chunk_size: int = 256
+) -> Iterator[np.ndarray]:
+    """Calculate the cosine similarity of every query with every vector, chunk_size
+    queries at a time to bound memory
+
+    Args:
+        query_embeddings (np.ndarray): query vectors of shape (n_queries, size)
+        vectors (np.ndarray): normalised vectors of shape (n_points, size)
+        chunk_size (int, optional): number of queries per chunk. Defaults to 256.
+
+    Yields:
+        np.ndarray: scores of shape (chunk_size, n_points)
+    """
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    queries = queries / np.maximum(
+        np.linalg.norm(queries, axis=1, keepdims=True), 1e-12
+    )
+    for start in range(0, len(queries), chunk_size):
+        yield queries[start : start + chunk_size] @ vectors.T
+
+
+def exact_process_labels(
+    unique_labels: list[str],
+    regex_ids: dict,
+    query_embeddings,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    thresholds: np.ndarray = np.arange(0, 1.1, 0.1),
+    chunk_size: int = 256,
+) -> tuple[list[dict], list[dict], list[dict]]:
+    """Calculate precision, recall and f2 score for every label and threshold with exact
+    search, returning the same structure as process_labels
+
+    Args:
+        unique_labels (list[str]): the labels
+        regex_ids (dict): the ids of the relevant records for each label
+        query_embeddings (np.ndarray): the embedding of each label
+        ids (np.ndarray): point ids as strings
+        vectors (np.ndarray): normalised vectors of shape (n_points, size)
+        thresholds (np.ndarray, optional): the similarity thresholds. Defaults to
+            np.arange(0, 1.1, 0.1).
+        chunk_size (int, optional): number of labels scored at a time. Defaults to 256.
+
+    Returns:
+        list[dict]: precision values for each label
+        list[dict]: recall values for each label
+        list[dict]: f2 scores for each label
+    """
+    precision_values = []
+    recall_values = []
+    f2_scores = []
+
+    labels = iter(unique_labels)
+    for scores in get_score_chunks(query_embeddings, vectors, chunk_size):
+        for label_scores, unique_label in zip(scores, labels):
+            relevant_records = regex_ids[unique_label]
+            is_relevant = np.isin(ids, relevant_records)
+            precision, recall, f2_score = sweep_thresholds(
+                label_scores, is_relevant, len(relevant_records), thresholds
+            )
+            precision_values.append({unique_label: precision})
+            recall_values.append({unique_label: recall})
+            f2_scores.append({unique_label: f2_score})
+
+    return precision_values, recall_values, f2_scores
+
+
+def calculate_ann_divergence(
+    ann_results: list[list],
+    query_embeddings,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    thresholds: np.ndarray = np.arange(0, 1.1, 0.1),
+    chunk_size: int = 256,
+) -> dict:
+    """Measure how far approximate (HNSW) search results diverge from exact search, as
+    the share of the exact results at each threshold that approximate search returned
+
+    Args:
+        ann_results (list[list]): approximate search results for each query, searched at
+            the lowest threshold
+        query_embeddings (np.ndarray): the query vectors
+        ids (np.ndarray): point ids as strings
+        vectors (np.ndarray): normalised vectors of shape (n_points, size)
+        thresholds (np.ndarray, optional): the similarity thresholds. Defaults to
+            np.arange(0, 1.1, 0.1).
+        chunk_size (int, optional): number of queries scored at a time. Defaults to 256.
+
+    Returns:
+        dict: for each threshold, the mean recall of approximate search against exact
+            search, and the number of queries where approximate search missed results
+    """
+    recall_sums = np.zeros(len(thresholds))
+    counts = np.zeros(len(thresholds))
+    missed = np.zeros(len(thresholds), dtype=int)
+
+    results = iter(ann_results)
+    for scores in get_score_chunks(query_embeddings, vectors, chunk_size):
+        for label_scores, label_results in zip(scores, results):
+            ann_scores = {str(result.id): result.score for result in label_results}
+            found = np.isin(ids, list(ann_scores))
+            for i, threshold in enumerate(thresholds):
+                exact_mask = label_scores >= threshold
+                n_exact = int(exact_mask.sum())
+                if n_exact == 0:
+                    continue
+                n_found = int((exact_mask & found).sum())
+                recall_sums[i] += n_found / n_exact
+                counts[i] += 1
+                missed[i] += n_found < n_exact
+
+    return {
+        threshold: {
+            "ann_recall": float(recall_sums[i] / counts[i]) if counts[i] else 1.0,
+            "queries_with_missed_results": int(missed[i]),
+        }
+        for i, threshold in enumerate(thresholds)
+    }
+
+
+def exact_ranking_metrics(
+    unique_labels: list[str],
+    regex_ids: dict,
+    query_embeddings,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    ks: tuple[int, ...] = (10, 50, 100),
+    chunk_size: int = 256,
+) -> list[dict]:
+    """Calculate ranking metrics for every label with exact search
+
+    Args:
+        unique_labels (list[str]): the labels
+        regex_ids (dict): the ids of the relevant records for each label
+        query_embeddings (np.ndarray): the embedding of each label
+        ids (np.ndarray): point ids as strings
+        vectors (np.ndarray): normalised vectors of shape (n_points, size)
+        ks (tuple[int, ...], optional): the cut-offs. Defaults to (10, 50, 100).
+        chunk_size (int, optional): number of labels scored at a time. Defaults to 256.
+
+    Returns:
+        list[dict]: ranking metrics for each label
+    """
+    ranking_values = []
+    labels = iter(unique_labels)
+    for scores in get_score_chunks(query_embeddings, vectors, chunk_size):
+        for label_scores, unique_label in zip(scores, labels):
+            relevant_records = regex_ids[unique_label]
+            is_relevant = np.isin(ids, relevant_records)
+            ranking_values.append(
+                {
+                    unique_label: calculate_ranking_metrics(
+                        label_scores, is_relevant, len(relevant_records), ks
+                    )
+                }
+            )
+    return ranking_values
+
+
+def calculate_ann_recall_at_k(
+    ann_results: list[list],
+    query_embeddings,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    ks: tuple[int, ...] = (10, 50, 100),
+    chunk_size: int = 256,
+) -> dict:
+    """Calculate the mean share of the exact top k results that approximate (HNSW)
+    search returned in its top k, for each k
+
+    Args:
+        ann_results (list[list]): approximate search results for each query, ranked
+        query_embeddings (np.ndarray): the query vectors
+        ids (np.ndarray): point ids as strings
+        vectors (np.ndarray): normalised vectors of shape (n_points, size)
+        ks (tuple[int, ...], optional): the cut-offs. Defaults to (10, 50, 100).
+        chunk_size (int, optional): number of queries scored at a time. Defaults to 256.
+
+    Returns:
+        dict: the mean ANN recall@k for each k, or an empty dict if there are no points
+    """
+    if len(ids) == 0:
+        return {}
+    max_k = min(max(ks), len(ids))
+    recall_sums = np.zeros(len(ks))
+    n_queries = 0
+
+    results = iter(ann_results)
+    for scores in get_score_chunks(query_embeddings, vectors, chunk_size):
+        # Top max_k exact results of each query, in descending order of score
+        top = np.argpartition(-scores, max_k - 1, axis=1)[:, :max_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+        for exact_top, label_results in zip(top, results):
+            ann_ids = [str(result.id) for result in label_results]
+            for i, k in enumerate(ks):
+                depth = min(k, len(ids))
+                exact_ids = set(ids[exact_top[:depth]])
+                recall_sums[i] += len(exact_ids.intersection(ann_ids[:depth])) / depth
+            n_queries += 1
+
+    return {
+        f"ann_recall@{k}": float(recall_sums[i] / n_queries) if n_queries else 1.0
+        for i, k in enumerate(ks)
+    }
@@ -0,0 +1,60 @@
+import datetime
+
+from src.common import renaming_dict, urgency_translate
+
+
+def format_search_results(
+    results: list[dict],
+    similarity_threshold: float,
+    start_date: datetime.date,
+    end_date: datetime.date,
+) -> list[dict]:
+    """Rename, filter and sort search results for display in the app
+
+    Args:
+        results (list[dict]): search results, each with a payload and optionally a score
+        similarity_threshold (float): the minimum similarity score to keep
+        start_date (datetime.date): the earliest date to keep
+        end_date (datetime.date): the latest date to keep
+
+    Returns:
+        list[dict]: results with display names, sorted by similarity score then date
+    """
+    inverted_urgency_translate = {v: k for k, v in urgency_translate.items()}
+
+    filtered_list = []
+    # Extract and append key-value pairs
+    for result in results:
+        payload = result["payload"]
+        if any(key in renaming_dict for key in payload):
+            for key, value in renaming_dict.items():
+                result[value] = payload[key]
+
+        result_ordered = {key: result[key] for key in renaming_dict.values()}
+        result_ordered["Similarity score"] = (
+            result["score"] if "score" in result else float(1)
+        )
+
+        result_ordered["created_date"] = datetime.datetime.strptime(
+            result_ordered[renaming_dict["created"]], "%Y-%m-%d"
+        ).date()
+
+        # Reformat urgency to human readable
+        numeric_urgency = str(result_ordered["Urgency"])
+        if numeric_urgency in inverted_urgency_translate:
+            result_ordered["Urgency"] = inverted_urgency_translate[numeric_urgency]
+
+        # Filter on date and similarity score
+        if (
+            result_ordered["Similarity score"] > similarity_threshold
+            and start_date <= result_ordered["created_date"] <= end_date
+        ):
+            filtered_list.append(result_ordered)
+
+    # Sort descending by similairty score, then date, to get the most similar results first, then the most recent where similarity is the same
+    filtered_sorted_list = sorted(
+        filtered_list,
+        key=lambda d: (d["Similarity score"], d["created_date"]),
+        reverse=True,
+    )
+    return filtered_sorted_list
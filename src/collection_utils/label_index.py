@@ -0,0 +1,126 @@
+from collections import Counter, defaultdict, deque
+
+
+class AhoCorasick:
+    """Aho–Corasick automaton to find which of many literal patterns occur in a text in
+    a single pass over the text"""
+
+    def __init__(self, patterns: list[str]):
+        """
+        Build the automaton
+
+        Args:
+            patterns (list[str]): the patterns to search for
+        """
+        self.patterns = patterns
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        # Build a trie of the patterns
+        for pattern_idx, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(pattern_idx)
+
+        # Add failure links breadth first, so each state also outputs the patterns
+        # that end at its longest proper suffix in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] = (
+                    self.output[next_state] + self.output[self.fail[next_state]]
+                )
+
+    def find_all(self, text: str) -> set[int]:
+        """
+        Find the patterns that occur in a text
+
+        Args:
+            text (str): the text to search
+
+        Returns:
+            set[int]: indices of the patterns found
+        """
+        found = set(self.output[0])
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found.update(self.output[state])
+        return found
+
+
+def get_label_terms(data: list[dict]) -> tuple[dict, Counter]:
+    """
+    Split the labels of every record into lower case terms, as they appear in the labels
+    string between commas
+
+    Args:
+        data (list[dict]): The list of id, labels, and urgency.
+
+    Returns:
+        dict: The indices of the records containing each term
+        Counter: The number of times each term appears across all records
+    """
+    term_records = defaultdict(list)
+    term_counts = Counter()
+    for record_idx, record in enumerate(data):
+        terms = record["labels"].lower().split(",")
+        term_counts.update(terms)
+        for term in set(terms):
+            term_records[term].append(record_idx)
+    return term_records, term_counts
+
+
+def get_label_matches(data: list[dict], unique_labels: list[str]) -> tuple[dict, dict]:
+    """
+    Get the ids of the records whose labels contain each label, and the number of
+    times each label appears across all labels, ignoring case. Each label is matched
+    as a literal substring against the distinct terms of the labels, rather than as a
+    regex against every record.
+
+    Args:
+        data (list[dict]): The list of id, labels, and urgency.
+        unique_labels (list[str]): The labels to match.
+
+    Returns:
+        dict: The ids of the matching records for each label, in record order
+        dict: The label and number of matches for each label
+    """
+    term_records, term_counts = get_label_terms(data)
+    terms = list(term_records)
+    patterns = [label.lower() for label in unique_labels]
+
+    # Find the labels that occur in each term, with one pass over each distinct term
+    automaton = AhoCorasick(patterns)
+    label_terms = defaultdict(list)
+    for term in terms:
+        for label_idx in automaton.find_all(term):
+            label_terms[label_idx].append(term)
+
+    regex_ids = {}
+    regex_counts = {}
+    for label_idx, label in enumerate(unique_labels):
+        pattern = patterns[label_idx]
+        record_indices = set()
+        n_matches = 0
+        for term in label_terms[label_idx]:
+            record_indices.update(term_records[term])
+            n_matches += term.count(pattern) * term_counts[term]
+        regex_ids[label] = [data[idx]["id"] for idx in sorted(record_indices)]
+        regex_counts[label] = {"label": label, "n_matches": n_matches}
+    return regex_ids, regex_counts
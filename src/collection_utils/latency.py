@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def summarise_latencies(latencies: list[float]) -> dict:
+    """Summarise latencies in seconds as percentiles in milliseconds
+
+    Args:
+        latencies (list[float]): latencies in seconds
+
+    Returns:
+        dict: p50, p95, p99 and mean latency in milliseconds, and the number of calls
+    """
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "n": len(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
@@ -1,6 +1,48 @@
 from qdrant_client import QdrantClient
 
-from qdrant_client.http.models import FieldCondition, Filter, MatchAny
+from qdrant_client.http.models import (
+    FieldCondition,
+    Filter,
+    MatchAny,
+    QuantizationSearchParams,
+    SearchParams,
+    SearchRequest,
+)
+
+
+def get_search_params(
+    rescore: bool = True,
+    oversampling: float | None = None,
+    ignore_quantization: bool = False,
+    hnsw_ef: int | None = None,
+    exact: bool = False,
+) -> SearchParams:
+    """Get search params for a collection that may be quantized
+
+    Args:
+        rescore (bool, optional): rescore the top results with the original vectors.
+            Defaults to True.
+        oversampling (float, optional): fetch oversampling * limit candidates with the
+            quantized vectors before rescoring. Defaults to None.
+        ignore_quantization (bool, optional): search the original vectors only, e.g. for
+            a baseline to compare quantized search against. Defaults to False.
+        hnsw_ef (int, optional): size of the HNSW candidate list, trading latency for
+            recall. Defaults to None, using the collection's ef_construct.
+        exact (bool, optional): search every vector instead of the HNSW index. Defaults
+            to False.
+
+    Returns:
+        SearchParams: the search params
+    """
+    return SearchParams(
+        hnsw_ef=hnsw_ef,
+        exact=exact,
+        quantization=QuantizationSearchParams(
+            ignore=ignore_quantization,
+            rescore=rescore,
+            oversampling=oversampling,
+        ),
+    )
 
 
 def get_semantically_similar_results(
@@ -9,6 +51,7 @@ def get_semantically_similar_results(
     query_embedding,
     score_threshold: float,
     filter_dict={},
+    search_params: SearchParams | None = None,
 ):
     """Retrieve top k results from collection
 
@@ -18,6 +61,8 @@ def get_semantically_similar_results(
         query_embedding (list): The query vector.
         score_threshold (float): The minimum score to return.
         filter_dict (dict, optional): The keys and values to filter on. Defaults to {}.
+        search_params (SearchParams, optional): e.g. quantization params from
+            get_search_params. Defaults to None.
 
     Returns:
         list: the results of the search
@@ -36,6 +81,7 @@ def get_semantically_similar_results(
             query_vector=query_embedding,
             query_filter=filter,
             score_threshold=score_threshold,
+            search_params=search_params,
             limit=10000000,
             timeout=10000,
         )
@@ -44,6 +90,7 @@ def get_semantically_similar_results(
             collection_name=collection_name,
             query_vector=query_embedding,
             score_threshold=score_threshold,
+            search_params=search_params,
             limit=10000000,
             timeout=10000,
         )
@@ -51,6 +98,53 @@ def get_semantically_similar_results(
     return search_result
 
 
+def get_semantically_similar_results_batch(
+    client: QdrantClient,
+    collection_name: str,
+    query_embeddings,
+    score_threshold: float | None,
+    search_params: SearchParams | None = None,
+    batch_size: int = 64,
+    with_payload: bool = False,
+    limit: int = 10000000,
+) -> list[list]:
+    """Retrieve results for many query vectors, sending batch_size searches per request
+
+    Args:
+        client (QdrantClient): The  Qdrant client.
+        collection_name (str): The name of the collection.
+        query_embeddings (list): The query vectors.
+        score_threshold (float | None): The minimum score to return, or None for all.
+        search_params (SearchParams, optional): e.g. quantization params from
+            get_search_params. Defaults to None.
+        batch_size (int, optional): The number of searches per request. Defaults to 64.
+        with_payload (bool, optional): Whether to return payloads. Defaults to False.
+        limit (int, optional): The maximum number of results per query. Defaults to
+            10000000.
+
+    Returns:
+        list: the results of the search for each query vector, in order
+    """
+    search_results = []
+    for start in range(0, len(query_embeddings), batch_size):
+        requests = [
+            SearchRequest(
+                vector=[float(value) for value in query_embedding],
+                score_threshold=score_threshold,
+                params=search_params,
+                limit=limit,
+                with_payload=with_payload,
+            )
+            for query_embedding in query_embeddings[start : start + batch_size]
+        ]
+        search_results.extend(
+            client.search_batch(
+                collection_name=collection_name, requests=requests, timeout=10000
+            )
+        )
+    return search_results
+
+
 def filter_search(client: QdrantClient, collection_name: str, filter_dict: dict):
     """Query collection using filter alone
 
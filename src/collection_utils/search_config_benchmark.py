@@ -0,0 +1,188 @@
+import itertools
+from time import perf_counter
+
+import numpy as np
+import pyarrow as pa
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PayloadSchemaType, SearchParams
+
+from src.collection_utils.evaluate_collection import calculate_threshold_metrics
+from src.collection_utils.query_collection import get_semantically_similar_results
+
+SEARCH_CONFIG_BENCHMARK_PATH = "data/search_config_benchmark.parquet"
+
+# The fields the app filters on
+PAYLOAD_INDEX_FIELDS = {
+    "url": PayloadSchemaType.KEYWORD,
+    "primary_department": PayloadSchemaType.KEYWORD,
+    "document_type": PayloadSchemaType.KEYWORD,
+    "spam_classification": PayloadSchemaType.KEYWORD,
+    "urgency": PayloadSchemaType.INTEGER,
+}
+
+search_config_benchmark_schema = pa.schema(
+    [
+        ("m", pa.int64()),
+        ("quantization", pa.string()),
+        ("payload_index", pa.bool_()),
+        ("exact", pa.bool_()),
+        ("hnsw_ef", pa.int64()),
+        ("n_queries", pa.int64()),
+        ("p50_ms", pa.float64()),
+        ("p99_ms", pa.float64()),
+        ("queries_per_second", pa.float64()),
+        ("mean_results", pa.float64()),
+        ("precision", pa.float64()),
+        ("recall", pa.float64()),
+        ("f2", pa.float64()),
+        ("exact_overlap", pa.float64()),
+    ]
+)
+
+
+def get_search_config_grid(
+    hnsw_ms: list[int],
+    hnsw_efs: list[int],
+    quantizations: list[str | None],
+    payload_indexes: list[bool],
+) -> list[dict]:
+    """Get every combination of search settings, ordered so that settings which need
+    the collection rebuilt (m and quantization) change least often, and exact search
+    comes first for each collection so approximate search can be compared against it
+
+    Args:
+        hnsw_ms (list[int]): HNSW m values, the number of edges per node
+        hnsw_efs (list[int]): HNSW ef values, the size of the search candidate list
+        quantizations (list[str | None]): quantization types, see
+            get_quantization_config
+        payload_indexes (list[bool]): whether to index the filtered payload fields
+
+    Returns:
+        list[dict]: the m, quantization, payload_index, exact and hnsw_ef of each
+            combination
+    """
+    grid = []
+    for m, quantization, payload_index in itertools.product(
+        hnsw_ms, quantizations, payload_indexes
+    ):
+        settings = {
+            "m": m,
+            "quantization": quantization,
+            "payload_index": payload_index,
+        }
+        grid.append({**settings, "exact": True, "hnsw_ef": None})
+        for hnsw_ef in hnsw_efs:
+            grid.append({**settings, "exact": False, "hnsw_ef": hnsw_ef})
+    return grid
+
+
+def set_payload_indexes(
+    client: QdrantClient,
+    collection_name: str,
+    enabled: bool,
+    fields: dict = PAYLOAD_INDEX_FIELDS,
+):
+    """Create or delete the payload indexes on the filtered fields
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        enabled (bool): create the indexes if True, otherwise delete them
+        fields (dict, optional): the schema type of each field. Defaults to
+            PAYLOAD_INDEX_FIELDS.
+    """
+    indexed = client.get_collection(collection_name).payload_schema
+    for field_name, field_schema in fields.items():
+        if enabled and field_name not in indexed:
+            client.create_payload_index(
+                collection_name, field_name, field_schema=field_schema, wait=True
+            )
+        elif not enabled and field_name in indexed:
+            client.delete_payload_index(collection_name, field_name, wait=True)
+
+
+def time_label_searches(
+    client: QdrantClient,
+    collection_name: str,
+    query_embeddings,
+    score_threshold: float,
+    search_params: SearchParams | None = None,
+    filter_dict: dict = {},
+) -> tuple[list[float], list[list]]:
+    """Search for each label one at a time, as the app does, timing each search
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        query_embeddings (np.ndarray): the embedding of each label
+        score_threshold (float): the minimum score to return
+        search_params (SearchParams, optional): the search params. Defaults to None.
+        filter_dict (dict, optional): the keys and values to filter on. Defaults to {}.
+
+    Returns:
+        list[float]: the latency of each search in seconds
+        list[list]: the results of each search
+    """
+    latencies = []
+    results = []
+    for query_embedding in query_embeddings:
+        start = perf_counter()
+        results.append(
+            get_semantically_similar_results(
+                client=client,
+                collection_name=collection_name,
+                query_embedding=np.asarray(query_embedding).tolist(),
+                score_threshold=score_threshold,
+                filter_dict=filter_dict,
+                search_params=search_params,
+            )
+        )
+        latencies.append(perf_counter() - start)
+    return latencies, results
+
+
+def score_label_searches(
+    unique_labels: list[str],
+    regex_ids: dict,
+    results: list[list],
+    score_threshold: float,
+    exact_results: list[list] | None = None,
+) -> dict:
+    """Calculate the mean precision, recall and f2 score of the searches for each label,
+    and the mean share of the exact search results that each search returned
+
+    Args:
+        unique_labels (list[str]): the labels
+        regex_ids (dict): the ids of the relevant records for each label
+        results (list[list]): the results of the search for each label
+        score_threshold (float): the threshold the searches were run at
+        exact_results (list[list], optional): the results of exact search for each
+            label. Defaults to None.
+
+    Returns:
+        dict: mean precision, recall, f2 and exact_overlap, NaN where there are no
+            values to average
+    """
+    thresholds = np.array([score_threshold])
+    metrics = {"precision": [], "recall": [], "f2": []}
+    for unique_label, label_results in zip(unique_labels, results):
+        label_metrics = calculate_threshold_metrics(
+            label_results, regex_ids[unique_label], thresholds
+        )
+        for name, values in zip(metrics, label_metrics):
+            metrics[name].append(values[score_threshold])
+
+    overlaps = []
+    for label_results, label_exact_results in zip(results, exact_results or []):
+        exact_ids = {result.id for result in label_exact_results}
+        if exact_ids:
+            found_ids = {result.id for result in label_results}
+            overlaps.append(len(exact_ids & found_ids) / len(exact_ids))
+
+    def _mean(values):
+        return float(np.mean(values)) if values else np.nan
+
+    return {
+        **{name: _mean(values) for name, values in metrics.items()},
+        "exact_overlap": _mean(overlaps),
+    }
@@ -1,7 +1,21 @@
+import time
 from datetime import datetime
 
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, PointStruct, VectorParams
+from qdrant_client.local.qdrant_local import QdrantLocal
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CollectionStatus,
+    Distance,
+    HnswConfigDiff,
+    OptimizersConfigDiff,
+    PointStruct,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+)
 
 
 def create_vectors_from_data(documents: list[dict], id_key: str, embedding_key: str):
@@ -35,11 +49,124 @@ def create_vectors_from_data(documents: list[dict], id_key: str, embedding_key:
     return embedding_vectors
 
 
+def merge_labelled_records(
+    documents: list[dict],
+    labelled_records: list[dict],
+    id_key: str = "feedback_record_id",
+) -> list[dict]:
+    """Merge labels and urgency into the documents that have been labelled
+
+    Args:
+        documents (list[dict]): a list of documents in dicts, e.g. the main extract
+        labelled_records (list[dict]): a list of dicts with id_key, labels and urgency
+        id_key (str): name of the key containing the unique feedback id
+
+    Returns:
+        list[dict]: the labelled subset of documents, with labels and urgency merged in
+    """
+    labelled = {str(record[id_key]): record for record in labelled_records}
+    merged_documents = []
+    for document in documents:
+        labelled_record = labelled.get(str(document[id_key]))
+        if labelled_record is not None:
+            merged_documents.append(
+                {
+                    **document,
+                    "labels": labelled_record["labels"],
+                    "urgency": labelled_record["urgency"],
+                }
+            )
+
+    return merged_documents
+
+
+def get_labelled_points_from_collection(
+    client: QdrantClient,
+    collection_name: str,
+    labelled_records: list[dict],
+    id_key: str = "feedback_record_id",
+    chunk_size: int = 500,
+) -> list[PointStruct]:
+    """Copy labelled points out of an existing collection, merging in labels and urgency
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection to copy points from
+        labelled_records (list[dict]): a list of dicts with id_key, labels and urgency
+        id_key (str): name of the key containing the unique feedback id
+        chunk_size (int, optional): number of points to retrieve per request. Defaults to 500.
+
+    Returns:
+        list[PointStruct]: list of vectors ready for upsert to collection
+    """
+    labelled = {int(record[id_key]): record for record in labelled_records}
+    point_ids = list(labelled)
+
+    embedding_vectors = []
+    for i in range(0, len(point_ids), chunk_size):
+        records = client.retrieve(
+            collection_name=collection_name,
+            ids=point_ids[i : i + chunk_size],
+            with_payload=True,
+            with_vectors=True,
+        )
+        for record in records:
+            labelled_record = labelled[int(record.id)]
+            payload = {
+                **record.payload,
+                "labels": labelled_record["labels"],
+                "urgency": labelled_record["urgency"],
+            }
+            point = PointStruct(id=record.id, vector=record.vector, payload=payload)
+            embedding_vectors.append(point)
+
+    print(
+        f"{len(embedding_vectors)} of {len(point_ids)} labelled points found in collection {collection_name}"
+    )
+    return embedding_vectors
+
+
+def get_quantization_config(
+    quantization: str | None,
+    always_ram: bool = True,
+    quantile: float = 0.99,
+) -> ScalarQuantization | BinaryQuantization | None:
+    """Get the quantization config for a collection
+
+    Args:
+        quantization (str | None): "scalar" for int8, "binary", or None for no quantization
+        always_ram (bool, optional): keep quantized vectors in RAM, with the original
+            vectors on disk. Defaults to True.
+        quantile (float, optional): quantile of vector values used to set the int8 range
+            for scalar quantization. Defaults to 0.99.
+
+    Returns:
+        ScalarQuantization | BinaryQuantization | None: the quantization config
+    """
+    if quantization is None:
+        return None
+    elif quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=quantile, always_ram=always_ram
+            )
+        )
+    elif quantization == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=always_ram)
+        )
+    else:
+        raise ValueError(f"Unknown quantization {quantization}, use scalar or binary")
+
+
 def create_collection(
     client: QdrantClient,
     collection_name: str,
     size=768,
     distance_metric=Distance.DOT,
+    quantization_config: ScalarQuantization | BinaryQuantization | None = None,
+    hnsw_config: HnswConfigDiff | None = None,
+    optimizers_config: OptimizersConfigDiff | None = None,
 ):
     """Create and upsert to a Qdrant collection
 
@@ -49,12 +176,27 @@ def create_collection(
         collection_name (str): name of the collection
         size (int, optional): _description_. Defaults to 768.
         distance_metric (_type_, optional): _description_. Defaults to Distance.DOT.
+        quantization_config (ScalarQuantization | BinaryQuantization, optional): see
+            get_quantization_config. Defaults to None, storing only float32 vectors.
+        hnsw_config (HnswConfigDiff, optional): HNSW index params, e.g. m. Defaults to
+            None, using Qdrant's defaults.
+        optimizers_config (OptimizersConfigDiff, optional): optimizer params, e.g. the
+            indexing threshold. Defaults to None, using Qdrant's defaults.
     """
 
     client.recreate_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=size, distance=distance_metric),
+        # With quantization, search uses the quantized vectors in RAM, so the original
+        # vectors only need to be read from disk for rescoring
+        vectors_config=VectorParams(
+            size=size,
+            distance=distance_metric,
+            on_disk=quantization_config is not None,
+        ),
         on_disk_payload=True,
+        quantization_config=quantization_config,
+        hnsw_config=hnsw_config,
+        optimizers_config=optimizers_config,
     )
     print(f"Collection {collection_name} created")
 
@@ -95,6 +237,85 @@ def upsert_to_collection_from_vectors(
                 print(f"Error upserting to collection {collection_name} twice: {e}")
 
 
+def copy_collection(
+    client: QdrantClient,
+    source_collection_name: str,
+    target_collection_name: str,
+    hnsw_config: HnswConfigDiff | None = None,
+    quantization_config: ScalarQuantization | BinaryQuantization | None = None,
+    chunk_size: int = 500,
+    timeout: float = 600,
+):
+    """Copy the points of a collection into a new collection with different index
+    params, waiting until every vector in the new collection is in its HNSW index
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        source_collection_name (str): name of the collection to copy
+        target_collection_name (str): name of the new collection, replaced if it exists
+        hnsw_config (HnswConfigDiff, optional): HNSW index params. Defaults to None.
+        quantization_config (ScalarQuantization | BinaryQuantization, optional): see
+            get_quantization_config. Defaults to None.
+        chunk_size (int, optional): number of points per scroll and upsert. Defaults
+            to 500.
+        timeout (float, optional): seconds to wait for indexing. Defaults to 600.
+
+    Raises:
+        TimeoutError: if the new collection is still indexing after timeout seconds
+    """
+    vectors_config = client.get_collection(source_collection_name).config.params.vectors
+    create_collection(
+        client,
+        target_collection_name,
+        size=vectors_config.size,
+        distance_metric=vectors_config.distance,
+        quantization_config=quantization_config,
+        hnsw_config=hnsw_config,
+        # Index every segment: below Qdrant's default threshold of 20MB of vectors a
+        # segment is searched in full, so a small copy would never use its HNSW index.
+        # A threshold of 0 disables indexing, so use the smallest non-zero one (1kB).
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=1),
+    )
+
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            source_collection_name,
+            limit=chunk_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if records:
+            client.upsert(
+                collection_name=target_collection_name,
+                wait=True,
+                points=[
+                    PointStruct(
+                        id=record.id, vector=record.vector, payload=record.payload
+                    )
+                    for record in records
+                ],
+            )
+        if offset is None:
+            break
+
+    # The HNSW index is built in the background after upserting. Local mode has no
+    # index to wait for.
+    is_local = isinstance(client._client, QdrantLocal)
+    start = time.monotonic()
+    while True:
+        info = client.get_collection(target_collection_name)
+        if info.status == CollectionStatus.GREEN and (
+            is_local or (info.indexed_vectors_count or 0) >= (info.points_count or 0)
+        ):
+            break
+        if time.monotonic() - start > timeout:
+            raise TimeoutError(f"Collection {target_collection_name} is still indexing")
+        time.sleep(1)
+    print(f"Copied {source_collection_name} to {target_collection_name}")
+
+
 def get_latest_snapshot_location(snapshots: list) -> str:
     """
     Finds the location of the latest snapshot from a list of snapshot descriptions.
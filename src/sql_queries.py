@@ -29,6 +29,16 @@ ORDER BY feedback_record_id
 """
 
 
+query_labelled_ids = """
+SELECT
+    CAST(labels.id AS STRING) AS feedback_record_id,
+    labels.labels,
+    IFNULL(CAST(labels.urgency AS INT), -1) as urgency
+FROM @LABELLED_FEEDBACK_TABLE labels
+ORDER BY feedback_record_id
+"""
+
+
 query_distinct_page_paths = """
 SELECT DISTINCT subject_page_path FROM @PUBLISHING_VIEW
 """
@@ -1,16 +1,48 @@
 import asyncio
+import functools
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Iterable, Iterator
 
-from openai import AsyncOpenAI
+import tiktoken
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
 
+from src.utils.label_cache import (
+    LABEL_CACHE_PATH,
+    get_text_key,
+    open_label_cache,
+    read_cached_labels,
+    write_cached_labels,
+)
+from src.utils.jsonl import read_jsonl
+from src.utils.label_propagation import ExampleSelector
 
-async def create_openai_labelled_data(
-    labelled_examples: str,
-    new_example: str,
-    open_api_key: str,
-) -> dict:
-    client = AsyncOpenAI(api_key=open_api_key)
+# Errors worth retrying: rate limits, timeouts, dropped connections and server errors
+RETRYABLE_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
+
+MODEL = "gpt-3.5-turbo-0125"
 
-    system_prompt = """
+# Completion tokens to allow for each labelled record in a packed request, which are
+# usually around 30
+COMPLETION_TOKENS_PER_RECORD = 60
+
+SYSTEM_PROMPT = """
         You are an expert tasked with categorising user feedback for the UK government, submitted through the website www.gov.uk. Your input is a JSON containing two key pieces of information: a unique identifier (id) and the user feedback (feedback).
 
         Your objective is to analyze the feedback and assign an appropriate label or labels that accurately categorise the feedback. These labels should reflect the concrete issues encountered or digital services mentioned in the feedback rather than reflect the subjective opinions or emotions mentioned in the feedback.
@@ -38,7 +70,18 @@ async def create_openai_labelled_data(
         Remember, your analysis and categorisation play a vital role in improving government digital services and ensuring that they meet the needs of the public efficiently and effectively.
         """
 
-    user_prompt = f"""
+
+def get_user_prompt(labelled_examples: str, new_example: str) -> str:
+    """Get the prompt asking for one record to be labelled
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_example (str): JSON of the record to label
+
+    Returns:
+        str: the user prompt
+    """
+    return f"""
         Before you label the following record, let's reflect on the examples provided and apply similar reasoning to ensure consistency and accuracy in our categorisation. Consider the nature of the feedback, its relevance to government services, and the immediacy with which the issue it raises should be addressed.
 
         This thoughtful approach will guide you in determining the most appropriate labels and the urgency.
@@ -54,53 +97,902 @@ async def create_openai_labelled_data(
         Your output should include only the keys "id", "labels", and "urgency", and their respective values. Reflect on the content of the feedback, its implications for government services, and the potential impact on users to make your assessment. Always return your analysis in valid JSON format.
     """
 
+
+def get_completion_body(labelled_examples: str, new_example: str) -> dict:
+    """Get the chat completion request to label one record, shared by synchronous and
+    batch labelling
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_example (str): JSON of the record to label
+
+    Returns:
+        dict: the messages, model and completion params
+    """
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": get_user_prompt(labelled_examples, new_example),
+            },
+        ],
+        "max_tokens": 250,
+        "temperature": 0.75,
+        "model": MODEL,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def get_packed_user_prompt(labelled_examples: str, new_examples: list[str]) -> str:
+    """Get the prompt asking for several records to be labelled in one request
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (list[str]): JSON of each record to label
+
+    Returns:
+        str: the user prompt
+    """
+    records = "\n\n        ".join(new_examples)
+    return f"""
+        Before you label the following records, let's reflect on the examples provided and apply similar reasoning to ensure consistency and accuracy in our categorisation. Consider the nature of the feedback, its relevance to government services, and the immediacy with which the issue it raises should be addressed.
+
+        This thoughtful approach will guide you in determining the most appropriate labels and the urgency.
+
+        Here are the examples for reference:
+        {labelled_examples}
+
+        Based on these examples, let's proceed to categorise the new pieces of feedback. Label each one on its own merits. Remember, we are focusing on identifying the most fitting labels and assessing the urgency accurately, all while ensuring our output is in valid JSON format.
+
+        Here are the {len(new_examples)} pieces of feedback you need to label:
+        {records}
+
+        Your output should be a JSON object with the single key "records", a list with one item for each piece of feedback, in the order given. Each item should include only the keys "id", "labels", and "urgency", and their respective values, with the id copied exactly. Reflect on the content of the feedback, its implications for government services, and the potential impact on users to make your assessment. Always return your analysis in valid JSON format.
+    """
+
+
+def get_packed_completion_body(
+    labelled_examples: str,
+    new_examples: list[str],
+    completion_tokens_per_record: int = COMPLETION_TOKENS_PER_RECORD,
+) -> dict:
+    """Get the chat completion request to label several records at once
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (list[str]): JSON of each record to label
+        completion_tokens_per_record (int, optional): the completion tokens to allow
+            for each record. Defaults to COMPLETION_TOKENS_PER_RECORD.
+
+    Returns:
+        dict: the messages, model and completion params
+    """
+    body = get_completion_body(labelled_examples, "")
+    body["messages"][1]["content"] = get_packed_user_prompt(
+        labelled_examples, new_examples
+    )
+    body["max_tokens"] = completion_tokens_per_record * len(new_examples) + 20
+    return body
+
+
+@functools.lru_cache
+def get_token_counter(model: str = MODEL) -> Callable[[str], int]:
+    """Get a function counting the tokens of a text for a model. The tokeniser is
+    downloaded on first use, so without network access the tokens are estimated as
+    four characters each instead.
+
+    Args:
+        model (str, optional): the model. Defaults to MODEL.
+
+    Returns:
+        Callable[[str], int]: the function
+    """
     try:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        completion = await client.chat.completions.create(
-            messages=messages,  # type: ignore
-            max_tokens=250,
-            temperature=0.75,
-            model="gpt-3.5-turbo-0125",
-            response_format={"type": "json_object"},
-        )
-        open_labelled_records = completion.choices[0].message.content
-        prompt_tokens = completion.usage.prompt_tokens
-        completion_tokens = completion.usage.completion_tokens
-        return {
-            "open_labelled_records": open_labelled_records,
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-        }  # type: ignore
+        encoding = tiktoken.encoding_for_model(model)
     except Exception as e:
-        print(f"OpenAI request failed: {e}")
+        print(f"Couldn't load the tokeniser for {model}, estimating tokens: {e}")
+        return lambda text: len(text) // 4
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def get_prompt_version(labelled_examples: str) -> str:
+    """Fingerprint everything the labels depend on besides the record: the prompts,
+    labelled examples, model and completion params
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+
+    Returns:
+        str: the prompt version
+    """
+    body = json.dumps(get_completion_body(labelled_examples, ""), sort_keys=True)
+    return hashlib.sha256(body.encode()).hexdigest()[:16]
+
+
+def is_valid_labelled_record(record) -> bool:
+    """Check a labelled record has at least one label and an urgency from 1 to 3"""
+    if not isinstance(record, dict):
+        return False
+    labels = record.get("labels")
+    urgency = record.get("urgency")
+    return (
+        isinstance(labels, list)
+        and len(labels) > 0
+        and all(isinstance(label, str) and label for label in labels)
+        and not isinstance(urgency, bool)
+        and urgency in (1, 2, 3)
+    )
+
+
+def parse_labelled_record(content: str | None) -> dict | None:
+    """Parse the content of a response labelling one record
+
+    Args:
+        content (str | None): the response content
+
+    Returns:
+        dict | None: the labelled record, or None if it isn't valid
+    """
+    try:
+        record = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    return record if is_valid_labelled_record(record) else None
+
+
+def iter_packs(
+    examples: Iterable[tuple[int, str]],
+    fixed_tokens: int,
+    count_tokens: Callable[[str], int],
+    max_prompt_tokens: int = 8000,
+    max_records: int = 20,
+    completion_tokens_per_record: int = COMPLETION_TOKENS_PER_RECORD,
+    max_completion_tokens: int = 4096,
+) -> Iterator[list[tuple[int, str]]]:
+    """Group records into packs to label in one request each, adding records to a pack
+    until the next would take it over the prompt token budget, the model's completion
+    token limit or max_records. A record over the budget on its own gets its own pack.
+
+    Args:
+        examples (Iterable[tuple[int, str]]): the index and JSON of each record
+        fixed_tokens (int): the tokens of the prompt without any records
+        count_tokens (Callable[[str], int]): counts the tokens of a text
+        max_prompt_tokens (int, optional): the prompt token budget. Defaults to 8000.
+        max_records (int, optional): the maximum records per pack. Defaults to 20.
+        completion_tokens_per_record (int, optional): the completion tokens to allow
+            for each record. Defaults to COMPLETION_TOKENS_PER_RECORD.
+        max_completion_tokens (int, optional): the model's maximum completion tokens.
+            Defaults to 4096.
+
+    Yields:
+        list[tuple[int, str]]: the index and JSON of each record in the pack
+    """
+    max_records = min(
+        max_records, max_completion_tokens // completion_tokens_per_record
+    )
+    pack = []
+    n_tokens = fixed_tokens
+    for i, new_example in examples:
+        # Records are separated by a blank line
+        record_tokens = count_tokens(new_example) + 2
+        if pack and (
+            len(pack) == max_records or n_tokens + record_tokens > max_prompt_tokens
+        ):
+            yield pack
+            pack = []
+            n_tokens = fixed_tokens
+        pack.append((i, new_example))
+        n_tokens += record_tokens
+    if pack:
+        yield pack
+
+
+def validate_packed_labels(content: str | None, ids: list) -> dict:
+    """Match the labelled records in a packed response to the ids of the records that
+    were sent, keeping only records with a known id, at least one label and an urgency
+    from 1 to 3
+
+    Args:
+        content (str | None): the response content
+        ids (list): the id of each record sent
+
+    Returns:
+        dict: the labelled record as a JSON string for each valid id, keyed by its
+            position in ids
+    """
+    try:
+        output = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    records = output.get("records") if isinstance(output, dict) else output
+    if not isinstance(records, list):
+        return {}
+
+    # Ids may come back as strings when they were sent as numbers, or vice versa
+    positions = {str(record_id): i for i, record_id in enumerate(ids)}
+    labelled = {}
+    for record in records:
+        if not is_valid_labelled_record(record):
+            continue
+        i = positions.get(str(record.get("id")))
+        if i is None or i in labelled:
+            continue
+        labelled[i] = json.dumps(
+            {
+                "id": ids[i],
+                "labels": record["labels"],
+                "urgency": int(record["urgency"]),
+            }
+        )
+    return labelled
+
+
+class RateLimiter:
+    """Token buckets limiting the requests and tokens sent per minute by concurrent
+    coroutines, which also pause together when the API says to back off"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """
+        Create the limiter, allowing up to a second's worth of requests and tokens in a
+        burst
+
+        Args:
+            requests_per_minute (float): the maximum requests per minute
+            tokens_per_minute (float): the maximum tokens per minute
+        """
+        self.request_rate = requests_per_minute / 60
+        self.token_rate = tokens_per_minute / 60
+        self.request_capacity = max(1.0, self.request_rate)
+        self.token_capacity = self.token_rate
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+        self.resume_time = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        """Add the requests and tokens accrued since the last refill"""
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.requests = min(
+            self.request_capacity, self.requests + elapsed * self.request_rate
+        )
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """
+        Stop every coroutine from sending requests for a number of seconds, e.g. for the
+        Retry-After of a rate limit error
+
+        Args:
+            seconds (float): the number of seconds to pause for
+        """
+        self.resume_time = max(self.resume_time, time.monotonic() + seconds)
+
+    async def acquire(self, n_tokens: int = 0):
+        """
+        Wait until a request using n_tokens can be sent. A request using more tokens
+        than the burst capacity is sent once the bucket is full, and the tokens it used
+        are paid back before any other request is sent.
+
+        Args:
+            n_tokens (int, optional): the estimated tokens of the request. Defaults to 0.
+        """
+        async with self.lock:
+            while True:
+                pause = self.resume_time - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self.refill()
+                needed_tokens = min(n_tokens, self.token_capacity)
+                if self.requests >= 1 and self.tokens >= needed_tokens:
+                    self.requests -= 1
+                    self.tokens -= n_tokens
+                    return
+                await asyncio.sleep(
+                    max(
+                        (1 - self.requests) / self.request_rate,
+                        (needed_tokens - self.tokens) / self.token_rate,
+                    )
+                )
+
+
+def get_openai_client(open_api_key: str | None = None) -> AsyncOpenAI:
+    """Get a client to share across requests, so they reuse its connection pool.
+    Retries are left to create_openai_labelled_data, which shares backoff across
+    requests through the rate limiter.
+
+    Args:
+        open_api_key (str, optional): the OpenAI API key. Defaults to OPENAI_API_KEY.
 
+    Returns:
+        AsyncOpenAI: the client
+    """
+    return AsyncOpenAI(api_key=open_api_key, max_retries=0)
+
+
+def estimate_tokens(messages: list[dict], max_tokens: int) -> int:
+    """Estimate the tokens a request counts against the tokens per minute limit, as
+    about four characters per prompt token plus the maximum completion tokens
+
+    Args:
+        messages (list[dict]): the messages of the request
+        max_tokens (int): the maximum completion tokens
+
+    Returns:
+        int: the estimated tokens
+    """
+    return sum(len(message["content"]) for message in messages) // 4 + max_tokens
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """Get the number of seconds the API asked us to wait before retrying
+
+    Args:
+        error (Exception): the error from the API
+
+    Returns:
+        float | None: the seconds to wait, or None if the API didn't say
+    """
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
 
-async def get_response(
-    i: str, labelled_examples: str, new_example: str, open_api_key: str
+
+async def request_completion(
+    client: AsyncOpenAI,
+    body: dict,
+    rate_limiter: RateLimiter | None = None,
+    max_retries: int = 5,
+    initial_backoff: float = 1.0,
 ) -> dict:
-    response = await create_openai_labelled_data(
-        labelled_examples=labelled_examples,
-        new_example=new_example,
-        open_api_key=open_api_key,
+    """Send a chat completion request, retrying rate limit, timeout, connection and
+    server errors with exponential backoff, or after the Retry-After the API sends
+
+    Args:
+        client (AsyncOpenAI): a client shared across requests, see get_openai_client
+        body (dict): the request, see get_completion_body
+        rate_limiter (RateLimiter, optional): a limiter shared across requests.
+            Defaults to None.
+        max_retries (int, optional): the maximum number of retries. Defaults to 5.
+        initial_backoff (float, optional): seconds to wait before the first retry,
+            doubling for each retry after. Defaults to 1.0.
+
+    Returns:
+        dict: the response content, the prompt and completion tokens, and the error if
+            the request failed
+    """
+    n_tokens = estimate_tokens(body["messages"], body["max_tokens"])
+
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire(n_tokens)
+        try:
+            completion = await client.chat.completions.create(**body)
+            return {
+                "open_labelled_records": completion.choices[0].message.content,
+                "prompt_tokens": completion.usage.prompt_tokens,
+                "completion_tokens": completion.usage.completion_tokens,
+                "error": None,
+            }
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                error = e
+                break
+            retry_after = get_retry_after(e)
+            if retry_after is None:
+                wait = initial_backoff * 2**attempt * (1 + random.random())
+            else:
+                wait = retry_after
+            if rate_limiter is not None and isinstance(e, RateLimitError):
+                # Every request is over the limit, not just this one
+                rate_limiter.pause(wait)
+            print(f"OpenAI request failed, retrying in {wait:.1f}s: {e}")
+            await asyncio.sleep(wait)
+        except Exception as e:
+            error = e
+            break
+
+    print(f"OpenAI request failed: {error}")
+    return {
+        "open_labelled_records": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "error": repr(error),
+    }
+
+
+async def create_openai_labelled_data(
+    labelled_examples: str,
+    new_example: str,
+    open_api_key: str | None = None,
+    client: AsyncOpenAI | None = None,
+    rate_limiter: RateLimiter | None = None,
+    max_retries: int = 5,
+    initial_backoff: float = 1.0,
+) -> dict:
+    """Label a record, retrying rate limit, timeout, connection and server errors with
+    exponential backoff, or after the Retry-After the API sends
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_example (str): JSON of the record to label
+        open_api_key (str, optional): the OpenAI API key, if client is not given
+        client (AsyncOpenAI, optional): a client shared across requests, see
+            get_openai_client. Defaults to a new client.
+        rate_limiter (RateLimiter, optional): a limiter shared across requests.
+            Defaults to None.
+        max_retries (int, optional): the maximum number of retries. Defaults to 5.
+        initial_backoff (float, optional): seconds to wait before the first retry,
+            doubling for each retry after. Defaults to 1.0.
+
+    Returns:
+        dict: the labelled record as a JSON string, the prompt and completion tokens,
+            and the error if the request failed
+    """
+    return await request_completion(
+        client or get_openai_client(open_api_key),
+        get_completion_body(labelled_examples, new_example),
+        rate_limiter=rate_limiter,
+        max_retries=max_retries,
+        initial_backoff=initial_backoff,
     )
-    return response
 
 
-async def gather_responses(
-    labelled_subs_json: str, new_subs_json: str, open_api_key: str
-) -> list:
-    responses = await asyncio.gather(
-        *[
-            get_response(
-                i,  # type: ignore
-                labelled_examples=labelled_subs_json,
-                new_example=i,
-                open_api_key=open_api_key,
+def split_tokens(n_tokens: int, n_records: int) -> list[int]:
+    """Share the tokens of a packed request between its records, so they still add up
+    to the tokens of the request"""
+    share, remainder = divmod(n_tokens, n_records)
+    return [share + (i < remainder) for i in range(n_records)]
+
+
+async def create_packed_labelled_data(
+    labelled_examples: str,
+    new_examples: list[str],
+    open_api_key: str | None = None,
+    client: AsyncOpenAI | None = None,
+    rate_limiter: RateLimiter | None = None,
+    max_retries: int = 5,
+    initial_backoff: float = 1.0,
+) -> list[dict]:
+    """Label several records in one request, checking the response has a valid labelled
+    record for each id sent. Records missing from the response, or labelled invalidly,
+    are labelled again one at a time. If the request itself fails after retrying,
+    every record gets its error.
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (list[str]): JSON of each record to label
+        open_api_key (str, optional): the OpenAI API key, if client is not given
+        client (AsyncOpenAI, optional): a client shared across requests, see
+            get_openai_client. Defaults to a new client.
+        rate_limiter (RateLimiter, optional): a limiter shared across requests.
+            Defaults to None.
+        max_retries (int, optional): the maximum number of retries. Defaults to 5.
+        initial_backoff (float, optional): seconds to wait before the first retry,
+            doubling for each retry after. Defaults to 1.0.
+
+    Returns:
+        list[dict]: the response for each record, as from create_openai_labelled_data,
+            with the tokens of the packed request shared between its records
+    """
+    client = client or get_openai_client(open_api_key)
+    packed_response = await request_completion(
+        client,
+        get_packed_completion_body(labelled_examples, new_examples),
+        rate_limiter=rate_limiter,
+        max_retries=max_retries,
+        initial_backoff=initial_backoff,
+    )
+    if packed_response["error"] is not None:
+        return [dict(packed_response) for _ in new_examples]
+
+    ids = [json.loads(new_example).get("id") for new_example in new_examples]
+    labelled = validate_packed_labels(packed_response["open_labelled_records"], ids)
+    prompt_tokens = split_tokens(packed_response["prompt_tokens"], len(new_examples))
+    completion_tokens = split_tokens(
+        packed_response["completion_tokens"], len(new_examples)
+    )
+    responses = []
+    for i, new_example in enumerate(new_examples):
+        if i in labelled:
+            responses.append(
+                {
+                    "open_labelled_records": labelled[i],
+                    "prompt_tokens": prompt_tokens[i],
+                    "completion_tokens": completion_tokens[i],
+                    "error": None,
+                }
+            )
+            continue
+        response = await create_openai_labelled_data(
+            labelled_examples,
+            new_example,
+            client=client,
+            rate_limiter=rate_limiter,
+            max_retries=max_retries,
+            initial_backoff=initial_backoff,
+        )
+        response["prompt_tokens"] += prompt_tokens[i]
+        response["completion_tokens"] += completion_tokens[i]
+        responses.append(response)
+
+    n_retried = len(new_examples) - len(labelled)
+    if n_retried:
+        print(
+            f"Labelled {n_retried} of {len(new_examples)} packed records on their own"
+        )
+    return responses
+
+
+async def stream_responses(
+    labelled_examples: str,
+    new_examples: Iterable[str],
+    open_api_key: str | None = None,
+    client: AsyncOpenAI | None = None,
+    max_concurrency: int = 8,
+    requests_per_minute: float = 500,
+    tokens_per_minute: float = 60000,
+    max_retries: int = 5,
+    rate_limiter: RateLimiter | None = None,
+    pack_records: bool = False,
+    max_prompt_tokens: int = 8000,
+    max_records_per_request: int = 20,
+    count_tokens: Callable[[str], int] | None = None,
+    select_examples: ExampleSelector | None = None,
+) -> AsyncIterator[tuple[int, dict]]:
+    """Label records with up to max_concurrency requests in flight, yielding each
+    response as it completes. Records are read from new_examples as workers become free,
+    so it can be a generator over more records than fit in memory.
+
+    With pack_records, each request labels as many records as fit in max_prompt_tokens
+    (up to max_records_per_request), so the system prompt and labelled examples are
+    sent once per pack rather than once per record.
+
+    With select_examples, an ExampleSelector from label_propagation, each request
+    carries only the labelled examples it selects for the request's records.
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (Iterable[str]): JSON of each record to label
+        open_api_key (str, optional): the OpenAI API key, if client is not given
+        client (AsyncOpenAI, optional): the client. Defaults to get_openai_client.
+        max_concurrency (int, optional): the maximum requests in flight. Defaults to 8.
+        requests_per_minute (float, optional): the account's requests per minute limit.
+            Defaults to 500.
+        tokens_per_minute (float, optional): the account's tokens per minute limit.
+            Defaults to 60000.
+        max_retries (int, optional): the maximum retries per record. Defaults to 5.
+        rate_limiter (RateLimiter, optional): a limiter shared with other calls, which
+            replaces requests_per_minute and tokens_per_minute. Defaults to None.
+        pack_records (bool, optional): whether to label several records per request.
+            Defaults to False.
+        max_prompt_tokens (int, optional): the prompt token budget of a packed request.
+            Defaults to 8000.
+        max_records_per_request (int, optional): the maximum records in a packed
+            request. Defaults to 20.
+        count_tokens (Callable[[str], int], optional): counts the tokens of a text, to
+            size packs. Defaults to the model's tokeniser, see get_token_counter.
+        select_examples (ExampleSelector, optional): selects the labelled examples for
+            the records of each request, replacing labelled_examples. Packs are sized
+            for the k examples per record it selects. Defaults to None.
+
+    Yields:
+        tuple[int, dict]: the index of the record in new_examples, and its response
+    """
+    client = client or get_openai_client(open_api_key)
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    if pack_records:
+        count_tokens = count_tokens or get_token_counter()
+        budget_examples = labelled_examples
+        if select_examples is not None:
+            # A pack is sent at most k examples for each of its records
+            budget_examples = select_examples.get_largest_examples(
+                select_examples.k * max_records_per_request, count_tokens
             )
-            for i in new_subs_json.split("},")  # type: ignore
-        ]
+        packs = iter_packs(
+            enumerate(new_examples),
+            fixed_tokens=count_tokens(SYSTEM_PROMPT)
+            + count_tokens(get_packed_user_prompt(budget_examples, [])),
+            count_tokens=count_tokens,
+            max_prompt_tokens=max_prompt_tokens,
+            max_records=max_records_per_request,
+        )
+    else:
+        packs = ([example] for example in enumerate(new_examples))
+    results = asyncio.Queue()
+
+    async def _worker():
+        try:
+            for pack in packs:
+                examples = labelled_examples
+                if select_examples is not None:
+                    # Selecting may query Qdrant, so keep it off the event loop
+                    examples = await asyncio.to_thread(
+                        select_examples, [new_example for _, new_example in pack]
+                    )
+                if pack_records:
+                    responses = await create_packed_labelled_data(
+                        labelled_examples=examples,
+                        new_examples=[new_example for _, new_example in pack],
+                        client=client,
+                        rate_limiter=rate_limiter,
+                        max_retries=max_retries,
+                    )
+                else:
+                    responses = [
+                        await create_openai_labelled_data(
+                            labelled_examples=examples,
+                            new_example=pack[0][1],
+                            client=client,
+                            rate_limiter=rate_limiter,
+                            max_retries=max_retries,
+                        )
+                    ]
+                for (i, _), response in zip(pack, responses):
+                    await results.put((i, response))
+        finally:
+            await results.put(None)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(max_concurrency)]
+    try:
+        n_running = len(workers)
+        while n_running:
+            result = await results.get()
+            if result is None:
+                n_running -= 1
+            else:
+                yield result
+        # Raise an error a worker stopped on, e.g. from reading new_examples
+        for worker in workers:
+            await worker
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+def get_duplicate_response(record_id, labels: list[str], urgency: int) -> dict:
+    """Get the response for a record with the same feedback as one already labelled,
+    which used no tokens
+
+    Args:
+        record_id: the id of the record
+        labels (list[str]): the labels of the feedback
+        urgency (int): the urgency of the feedback
+
+    Returns:
+        dict: the response, as from create_openai_labelled_data
+    """
+    return {
+        "open_labelled_records": json.dumps(
+            {"id": record_id, "labels": labels, "urgency": urgency}
+        ),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "error": None,
+    }
+
+
+async def label_records(
+    labelled_examples: str,
+    records: Iterable[dict],
+    open_api_key: str | None = None,
+    client: AsyncOpenAI | None = None,
+    cache_path: str | None = LABEL_CACHE_PATH,
+    chunk_size: int = 1000,
+    requests_per_minute: float = 500,
+    tokens_per_minute: float = 60000,
+    prelabel: Callable[[list[dict]], list[dict | None]] | None = None,
+    select_examples: ExampleSelector | None = None,
+    **kwargs,
+) -> AsyncIterator[tuple[int, dict, dict]]:
+    """Label records read from an iterator, e.g. read_jsonl, a chunk at a time, so
+    memory use doesn't grow with the number of records.
+
+    Records whose feedback normalises to the same text (see normalise_feedback) are
+    labelled once, and the labels are copied to each of them. Labels are cached on disk
+    by normalised feedback and prompt version, so feedback labelled by an earlier run
+    with the same prompt, labelled examples and model is not sent again.
+
+    A prelabel function, e.g. label_propagation.get_prelabeller, can label some of each
+    chunk first, so only the records it can't label go to the cache and the LLM.
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        records (Iterable[dict]): the records to label, each with an id and feedback,
+            see iter_feedback_records
+        open_api_key (str, optional): the OpenAI API key, if client is not given
+        client (AsyncOpenAI, optional): the client. Defaults to get_openai_client.
+        cache_path (str, optional): the path of the label cache, or None to only
+            cache labels for this run. Defaults to LABEL_CACHE_PATH.
+        chunk_size (int, optional): the number of records to read at a time.
+            Defaults to 1000.
+        requests_per_minute (float, optional): the account's requests per minute limit.
+            Defaults to 500.
+        tokens_per_minute (float, optional): the account's tokens per minute limit.
+            Defaults to 60000.
+        prelabel (Callable, optional): gets a response for each record of a chunk, or
+            None for the records to send to the LLM. Defaults to None.
+        select_examples (ExampleSelector, optional): selects the labelled examples
+            for each request, see stream_responses. Labels are cached under its
+            version rather than labelled_examples. Defaults to None.
+        **kwargs: concurrency, retries and packing, see stream_responses
+
+    Yields:
+        tuple[int, dict, dict]: the index of the record in records, the record and its
+            response, as from create_openai_labelled_data
+    """
+    client = client or get_openai_client(open_api_key)
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    prompt_version = get_prompt_version(
+        labelled_examples if select_examples is None else select_examples.version
     )
+    connection = open_label_cache(cache_path or ":memory:")
+    records = enumerate(records)
+    n_records = n_propagated = n_cached = n_requested = n_failed = 0
+    try:
+        while chunk := list(itertools.islice(records, chunk_size)):
+            n_records += len(chunk)
+
+            if prelabel is not None:
+                responses = prelabel([record for _, record in chunk])
+                unlabelled = []
+                for (i, record), response in zip(chunk, responses):
+                    if response is None:
+                        unlabelled.append((i, record))
+                    else:
+                        n_propagated += 1
+                        yield i, record, response
+                chunk = unlabelled
+
+            # Group the records by the cache key of their feedback. Records without
+            # feedback are labelled on their own.
+            groups = {}
+            texts = {}
+            for i, record in chunk:
+                feedback = record.get("feedback")
+                key = None
+                if isinstance(feedback, str):
+                    key = get_text_key(feedback, prompt_version)
+                    texts[key] = feedback
+                groups.setdefault(key or i, []).append((i, record))
+
+            cached = read_cached_labels(
+                connection, [key for key in groups if isinstance(key, str)]
+            )
+            for key, (labels, urgency) in cached.items():
+                for i, record in groups.pop(key):
+                    n_cached += 1
+                    yield (
+                        i,
+                        record,
+                        get_duplicate_response(record.get("id"), labels, urgency),
+                    )
+
+            # Label the first record of each group, then copy its labels to the rest
+            keys = list(groups)
+            n_requested += len(keys)
+            async for j, response in stream_responses(
+                labelled_examples,
+                (json.dumps(groups[key][0][1], indent=4) for key in keys),
+                client=client,
+                rate_limiter=rate_limiter,
+                select_examples=select_examples,
+                **kwargs,
+            ):
+                key = keys[j]
+                (first, first_record), *duplicates = groups[key]
+                record = None
+                if response["error"] is None:
+                    record = parse_labelled_record(response["open_labelled_records"])
+                if record is not None and isinstance(key, str):
+                    write_cached_labels(
+                        connection,
+                        key,
+                        prompt_version,
+                        texts[key],
+                        record["labels"],
+                        record["urgency"],
+                    )
+                n_failed += response["error"] is not None
+                yield first, first_record, response
+                for i, duplicate in duplicates:
+                    if record is not None:
+                        duplicate_response = get_duplicate_response(
+                            duplicate.get("id"), record["labels"], record["urgency"]
+                        )
+                    else:
+                        n_failed += 1
+                        duplicate_response = {
+                            "open_labelled_records": None,
+                            "prompt_tokens": 0,
+                            "completion_tokens": 0,
+                            "error": response["error"]
+                            or f"Labels of duplicate record {first} aren't valid",
+                        }
+                    yield i, duplicate, duplicate_response
+            print(f"Labelled {n_records} records")
+    finally:
+        connection.close()
+
+    n_duplicates = n_records - n_propagated - n_cached - n_requested
+    print(
+        f"Labelled {n_records - n_failed} records ({n_propagated} without the LLM, "
+        f"{n_cached} from the cache, {n_duplicates} duplicates), {n_failed} failed"
+    )
+
+
+async def gather_responses(
+    labelled_subs_json: str,
+    new_subs: str | Iterable[dict],
+    open_api_key: str,
+    **kwargs,
+) -> list:
+    """Label every record, returning the responses in the order of the records
+
+    Args:
+        labelled_subs_json (str): JSON of the labelled examples
+        new_subs (str | Iterable[dict]): the records to label, or a JSON list of them
+            from jsonify_data
+        open_api_key (str): the OpenAI API key
+        **kwargs: caching, concurrency, rate limits and packing, see label_records
+
+    Returns:
+        list: the response for each record
+    """
+    if isinstance(new_subs, str):
+        new_subs = json.loads(new_subs)
+    responses = []
+    async for i, _, response in label_records(
+        labelled_subs_json, new_subs, open_api_key=open_api_key, **kwargs
+    ):
+        responses.extend([None] * (i + 1 - len(responses)))
+        responses[i] = response
     return responses
+
+
+async def label_jsonl(
+    labelled_examples: str,
+    input_path: str,
+    output_path: str,
+    open_api_key: str | None = None,
+    **kwargs,
+) -> int:
+    """Label the records in a JSON Lines file, writing each response to another as it
+    completes, so any number of records can be labelled in constant memory
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        input_path (str): a JSON Lines file of the records to label, each with an id
+            and feedback, e.g. from write_jsonl(iter_feedback_records(rows), path)
+        output_path (str): the JSON Lines file to write the responses to, each with the
+            line number of its record as index and the record id
+        open_api_key (str, optional): the OpenAI API key
+        **kwargs: caching, concurrency, rate limits and packing, see label_records
+
+    Returns:
+        int: the number of responses written
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    n_responses = 0
+    with open(output_path, "w") as f:
+        async for i, record, response in label_records(
+            labelled_examples,
+            read_jsonl(input_path),
+            open_api_key=open_api_key,
+            **kwargs,
+        ):
+            f.write(json.dumps({"index": i, "id": record.get("id"), **response}) + "\n")
+            n_responses += 1
+    return n_responses
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import time
+from typing import Iterable, Iterator
+
+from openai import OpenAI
+
+from src.utils.async_call_openai import get_completion_body
+
+BATCH_DIR = "data/batches"
+
+# The Batch API accepts up to 50,000 requests and 200MB per input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def get_batch_request(custom_id: str, labelled_examples: str, new_example: str) -> dict:
+    """Get the Batch API request to label one record
+
+    Args:
+        custom_id (str): the id to match the result to the record
+        labelled_examples (str): JSON of the labelled examples
+        new_example (str): JSON of the record to label
+
+    Returns:
+        dict: the request, as one line of a batch input file
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": get_completion_body(labelled_examples, new_example),
+    }
+
+
+def write_batch_requests(
+    labelled_examples: str,
+    new_examples: Iterable[str],
+    batch_dir: str = BATCH_DIR,
+    max_requests: int = MAX_REQUESTS_PER_FILE,
+    max_bytes: int = MAX_BYTES_PER_FILE,
+) -> list[str]:
+    """Write a request to label each record to JSONL input files, starting a new file
+    whenever one would exceed the Batch API limits. Each request's custom_id is the
+    position of its record in new_examples.
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (Iterable[str]): JSON of each record to label
+        batch_dir (str, optional): the directory to write to. Defaults to BATCH_DIR.
+        max_requests (int, optional): the maximum requests per file. Defaults to
+            MAX_REQUESTS_PER_FILE.
+        max_bytes (int, optional): the maximum bytes per file. Defaults to
+            MAX_BYTES_PER_FILE.
+
+    Returns:
+        list[str]: the paths of the input files
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    paths = []
+    file = None
+    n_requests = n_bytes = 0
+    try:
+        for i, new_example in enumerate(new_examples):
+            line = (
+                json.dumps(
+                    get_batch_request(f"record-{i}", labelled_examples, new_example)
+                )
+                + "\n"
+            ).encode()
+            if (
+                file is None
+                or n_requests == max_requests
+                or n_bytes + len(line) > max_bytes
+            ):
+                if file is not None:
+                    file.close()
+                paths.append(
+                    os.path.join(batch_dir, f"batch_requests_{len(paths):03d}.jsonl")
+                )
+                file = open(paths[-1], "wb")
+                n_requests = n_bytes = 0
+            file.write(line)
+            n_requests += 1
+            n_bytes += len(line)
+    finally:
+        if file is not None:
+            file.close()
+    print(f"Wrote {len(paths)} batch input files to {batch_dir}")
+    return paths
+
+
+def submit_batch(client: OpenAI, path: str, manifest_path: str | None = None) -> str:
+    """Upload a batch input file and start the batch, unless the manifest says a file
+    with the same contents was already submitted in a batch that is still running or
+    has completed, so an interrupted run can be resumed without paying twice. Files
+    whose batch failed, expired or was cancelled are submitted again.
+
+    Args:
+        client (OpenAI): the OpenAI client
+        path (str): the path of the input file
+        manifest_path (str, optional): a JSON file of the batch id for the SHA-256 of
+            each submitted input file. Defaults to batches.json next to the input file.
+
+    Returns:
+        str: the batch id
+    """
+    manifest_path = manifest_path or os.path.join(os.path.dirname(path), "batches.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        file_hash = hashlib.file_digest(f, "sha256").hexdigest()
+        if file_hash in manifest:
+            batch = client.batches.retrieve(manifest[file_hash])
+            if batch.status not in FINAL_STATUSES - {"completed"}:
+                print(f"{name} already submitted as batch {batch.id} ({batch.status})")
+                return batch.id
+            print(f"{name} batch {batch.id} {batch.status}, submitting it again")
+        f.seek(0)
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    manifest[file_hash] = batch.id
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    print(f"Submitted {name} as batch {batch.id}")
+    return batch.id
+
+
+def wait_for_batch(
+    client: OpenAI,
+    batch_id: str,
+    poll_interval: float = 60.0,
+    timeout: float | None = None,
+):
+    """Poll a batch until it completes, fails, expires or is cancelled
+
+    Args:
+        client (OpenAI): the OpenAI client
+        batch_id (str): the batch id
+        poll_interval (float, optional): seconds between polls. Defaults to 60.0.
+        timeout (float, optional): seconds to wait before giving up. Defaults to None,
+            waiting for up to the batch's 24 hour completion window.
+
+    Raises:
+        TimeoutError: if the batch hasn't finished after timeout seconds
+
+    Returns:
+        Batch: the finished batch
+    """
+    start = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(
+                f"Batch {batch_id} {batch.status}: {counts.completed}/{counts.total} "
+                f"completed, {counts.failed} failed"
+            )
+        if batch.status in FINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {batch_id} is still {batch.status}")
+        time.sleep(poll_interval)
+
+
+def iter_file_lines(client: OpenAI, file_id: str) -> Iterator[str]:
+    """Stream the lines of a file, without holding the whole file in memory
+
+    Args:
+        client (OpenAI): the OpenAI client
+        file_id (str): the file id
+
+    Yields:
+        str: each non-empty line
+    """
+    with client.files.with_streaming_response.content(file_id) as response:
+        for line in response.iter_lines():
+            if line:
+                yield line
+
+
+def parse_batch_output(lines: Iterable[str]) -> Iterator[dict]:
+    """Parse batch output or error file lines into the responses returned by
+    create_openai_labelled_data, which write_to_bigquery consumes
+
+    Args:
+        lines (Iterable[str]): the lines of the output or error file
+
+    Yields:
+        dict: the custom_id, the labelled record as a JSON string, the prompt and
+            completion tokens, and the error if the request failed
+    """
+    for line in lines:
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") == 200:
+            body = response["body"]
+            yield {
+                "custom_id": result["custom_id"],
+                "open_labelled_records": body["choices"][0]["message"]["content"],
+                "prompt_tokens": body["usage"]["prompt_tokens"],
+                "completion_tokens": body["usage"]["completion_tokens"],
+                "error": None,
+            }
+        else:
+            yield {
+                "custom_id": result["custom_id"],
+                "open_labelled_records": None,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "error": json.dumps(result.get("error") or response.get("body")),
+            }
+
+
+def get_batch_responses(client: OpenAI, batch) -> Iterator[dict]:
+    """Get the responses of a finished batch, including any that failed. A batch that
+    expired or was cancelled still has responses for the requests it completed.
+
+    Args:
+        client (OpenAI): the OpenAI client
+        batch (Batch): the finished batch
+
+    Yields:
+        dict: the response for each request, see parse_batch_output
+    """
+    for file_id in [batch.output_file_id, batch.error_file_id]:
+        if file_id:
+            yield from parse_batch_output(iter_file_lines(client, file_id))
+
+
+def run_batch_labelling(
+    labelled_examples: str,
+    new_examples: Iterable[str],
+    open_api_key: str | None = None,
+    client: OpenAI | None = None,
+    batch_dir: str = BATCH_DIR,
+    poll_interval: float = 60.0,
+) -> Iterator[dict]:
+    """Label records with the Batch API, at half the price of chat completions and
+    without using the rate limits of synchronous requests
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        new_examples (Iterable[str]): JSON of each record to label
+        open_api_key (str, optional): the OpenAI API key, if client is not given
+        client (OpenAI, optional): the client. Defaults to a new client.
+        batch_dir (str, optional): the directory for input files and the manifest of
+            submitted batches. Defaults to BATCH_DIR.
+        poll_interval (float, optional): seconds between polls. Defaults to 60.0.
+
+    Yields:
+        dict: the response for each record, in the order the batches finish, with the
+            position of the record in new_examples as "record-<i>" in custom_id
+    """
+    client = client or OpenAI(api_key=open_api_key)
+    paths = write_batch_requests(labelled_examples, new_examples, batch_dir)
+    batch_ids = [submit_batch(client, path) for path in paths]
+    for batch_id in batch_ids:
+        batch = wait_for_batch(client, batch_id, poll_interval)
+        if batch.status != "completed":
+            print(f"Batch {batch_id} {batch.status}, reading the responses it has")
+        yield from get_batch_responses(client, batch)
@@ -1,81 +1,270 @@
+import glob
+import hashlib
+import json
+import os
+from typing import Iterable
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 from google.cloud import bigquery
-from google.api_core.exceptions import NotFound
+
+from src.utils.query_backends import get_query_backend, get_source_tables
+
+
+def is_offline() -> bool:
+    """Whether BigQuery should be bypassed and every query served from the cache.
+
+    Set the environment variable BIGQUERY_OFFLINE to "true" to run without cloud access.
+    """
+    return os.getenv("BIGQUERY_OFFLINE", "false").lower() in ("true", "1", "yes")
+
+
+def get_cache_dir() -> str:
+    """Directory for cached query results. Set BIGQUERY_CACHE_DIR to "" to disable the cache."""
+    return os.getenv("BIGQUERY_CACHE_DIR", "data/bigquery_cache")
+
+
+def get_query_hash(query: str) -> str:
+    """Hash a rendered SQL query, ignoring differences in whitespace"""
+    normalised_query = " ".join(query.split())
+    return hashlib.sha256(normalised_query.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cache_path(cache_dir: str, query: str, last_modified: str) -> str:
+    """Path of the cached result for a query against a given version of its source tables
+
+    Args:
+        cache_dir (str): cache directory
+        query (str): rendered SQL query
+        last_modified (str): last-modified times of the source tables
+
+    Returns:
+        str: path to the Parquet file
+    """
+    modified_hash = hashlib.sha256(last_modified.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{get_query_hash(query)}_{modified_hash}.parquet")
+
+
+def get_latest_cache_path(cache_dir: str, query: str) -> str | None:
+    """Path of the most recently written cached result for a query, whatever the table version"""
+    paths = glob.glob(os.path.join(cache_dir, f"{get_query_hash(query)}_*.parquet"))
+    if paths:
+        return max(paths, key=os.path.getmtime)
+
+
+def read_cached_result(path: str) -> pa.Table:
+    """Read a cached query result, memory-mapping the Parquet file"""
+    return pq.read_table(path, memory_map=True)
+
+
+def write_cached_result(path: str, table: pa.Table) -> None:
+    """Write a query result to the cache, replacing older versions of the same query"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cache_dir, file_name = os.path.split(path)
+    query_hash = file_name.split("_")[0]
+    for old_path in glob.glob(os.path.join(cache_dir, f"{query_hash}_*.parquet")):
+        os.remove(old_path)
+    # Write to a temporary file first so an interrupted write never leaves a partial result
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def arrow_to_rows(table: pa.Table, write_to_dict: bool = True) -> list:
+    """Convert an Arrow table to a list of dicts, or to a list of BigQuery rows
+
+    Args:
+        table (pa.Table): query result
+        write_to_dict (bool): return dicts if True, else bigquery.Row objects
+
+    Returns:
+        list: rows of the query result
+    """
+    rows = table.to_pylist()
+    if write_to_dict:
+        return rows
+    field_to_index = {name: i for i, name in enumerate(table.column_names)}
+    return [bigquery.Row(tuple(row.values()), field_to_index) for row in rows]
 
 
-def query_bigquery(project_id: str, query: str, write_to_dict: bool = True):
+def query_bigquery(
+    project_id: str, query: str, write_to_dict: bool = True, use_cache: bool = True
+):
     """Extracts feedback records from BigQuery
 
+    Queries run on the backend set by QUERY_BACKEND: BigQuery, or DuckDB over local
+    Parquet files. Results are cached as Parquet under BIGQUERY_CACHE_DIR, keyed by a
+    hash of the query and the last-modified time of its source tables. With
+    BIGQUERY_OFFLINE set, the latest cached result is returned without running the query.
+
     Args:
         project_id (str): BigQuery project ID
-        dataset_id (str): BigQuery dataset ID
         query (str): SQL query to get data from BigQuery
+        write_to_dict (bool): return dicts if True, else bigquery.Row objects
+        use_cache (bool): read from and write to the cache. Defaults to True.
 
     Returns:
-        dict: Dictionary containing feedback records
+        list: Feedback records
+
+    Raises:
+        FileNotFoundError: If offline and the query has not been cached.
     """
-    # Initialize a BigQuery client
-    client = bigquery.Client(project=project_id)
+    cache_dir = get_cache_dir() if use_cache else ""
 
-    # Construct a reference to the dataset
-    # dataset_ref = client.dataset(dataset_id)
+    if is_offline():
+        cache_path = get_latest_cache_path(cache_dir, query) if cache_dir else None
+        if cache_path is None:
+            raise FileNotFoundError(
+                "BIGQUERY_OFFLINE is set but no cached result exists for this query"
+            )
+        print(f"Offline: reading cached query result from {cache_path}")
+        return arrow_to_rows(read_cached_result(cache_path), write_to_dict)
 
-    # Make a BigQuery API request to run the query
-    query_job = client.query(query)
+    backend = get_query_backend(project_id)
 
-    # Wait for the query to complete
-    query_job.result()
+    cache_path = None
+    if cache_dir:
+        try:
+            last_modified = backend.get_tables_last_modified(get_source_tables(query))
+            cache_path = get_cache_path(cache_dir, query, last_modified)
+        except Exception as e:
+            print(f"Unable to get source table versions, not caching query: {e}")
 
-    # Fetch the results of the query
-    # results = query_job.result()
+    if cache_path and os.path.exists(cache_path):
+        print(f"Reading cached query result from {cache_path}")
+        return arrow_to_rows(read_cached_result(cache_path), write_to_dict)
 
-    # Write to dict
-    if write_to_dict:
-        result = [dict(row) for row in query_job]
-    else:
-        result = query_job.result()
+    # Run the query and wait for it to complete
+    result = backend.query(query)
+
+    if cache_path:
+        try:
+            write_cached_result(cache_path, result)
+            print(f"Query result cached at {cache_path}")
+        except Exception as e:
+            print(f"Unable to cache query result at {cache_path}: {e}")
+
+    return arrow_to_rows(result, write_to_dict)
+
+
+LABELLED_FEEDBACK_SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("labels", "STRING", mode="REPEATED"),
+    bigquery.SchemaField("urgency", "INTEGER"),
+]
+
+DEAD_LETTER_PATH = "data/bigquery_dead_letter.jsonl"
+
+
+def parse_labelled_row(response: dict) -> dict:
+    """Parse a labelling response into a row of LABELLED_FEEDBACK_SCHEMA
+
+    Args:
+        response (dict): the response, as from gather_responses
+
+    Raises:
+        ValueError: if the response isn't a JSON object with a string or integer id,
+            a list of string labels and an integer urgency
+
+    Returns:
+        dict: the row
+    """
+    try:
+        record = json.loads(response["open_labelled_records"])
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Response isn't valid JSON: {e}") from e
+    if not isinstance(record, dict):
+        raise ValueError("Response isn't a JSON object")
+
+    record_id = record.get("id")
+    labels = record.get("labels")
+    urgency = record.get("urgency")
+    if isinstance(record_id, bool) or not isinstance(record_id, (str, int)):
+        raise ValueError(f"id {record_id!r} isn't a string")
+    if not isinstance(labels, list) or not all(
+        isinstance(label, str) for label in labels
+    ):
+        raise ValueError(f"labels {labels!r} aren't a list of strings")
+    if isinstance(urgency, bool) or not isinstance(urgency, int):
+        raise ValueError(f"urgency {urgency!r} isn't an integer")
+    return {"id": str(record_id), "labels": labels, "urgency": urgency}
 
-    return result
+
+def write_dead_letters(dead_letters: list[dict], path: str):
+    """Append responses that couldn't be written to a JSON Lines file, with their
+    errors, so they can be fixed and written again
+
+    Args:
+        dead_letters (list[dict]): the responses and errors
+        path (str): the path of the file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        for dead_letter in dead_letters:
+            f.write(json.dumps(dead_letter, default=str) + "\n")
 
 
 def write_to_bigquery(
     table_id: str,
-    responses: list[dict],
+    responses: Iterable[dict],
     publishing_project_id: str,
-) -> None:
+    chunk_size: int = 500,
+    dead_letter_path: str = DEAD_LETTER_PATH,
+) -> list:
     """
-    Writes data to BigQuery
-    """
-    # Initialize a BigQuery client
-    client = bigquery.Client(project=publishing_project_id)
+    Writes labelling responses to BigQuery, parsing and validating each one, in chunks
+    of streaming inserts. Responses that can't be parsed, or rows that BigQuery rejects,
+    are reported and appended to a dead letter file, without stopping the other rows
+    being written.
 
-    # Define schema for the table
-    schema = [
-        bigquery.SchemaField("id", "STRING"),
-        bigquery.SchemaField("labels", "STRING", mode="REPEATED"),
-        bigquery.SchemaField("urgency", "INTEGER"),
-    ]
+    Args:
+        table_id (str): the table to write to, created if it does not exist
+        responses (Iterable[dict]): the responses, as from gather_responses
+        publishing_project_id (str): the project of the table
+        chunk_size (int, optional): the maximum rows per insert. Defaults to 500.
+        dead_letter_path (str, optional): the file to append responses that couldn't be
+            written to. Defaults to DEAD_LETTER_PATH.
 
-    # Create a list to hold the rows
-    rows = []
+    Returns:
+        list: the responses that couldn't be written, each with its error
+    """
+    backend = get_query_backend(publishing_project_id)
+    dead_letters = []
+    n_written = 0
 
-    # Convert each response dictionary to a BigQuery row
+    def _insert(chunk: list[tuple[dict, dict]]):
+        nonlocal n_written
+        errors = backend.insert_rows(
+            table_id, [row for _, row in chunk], LABELLED_FEEDBACK_SCHEMA
+        )
+        failed = set()
+        for error in errors:
+            # Errors without a row index reject the whole chunk
+            indexes = [error["index"]] if "index" in error else range(len(chunk))
+            for index in indexes:
+                failed.add(index)
+                dead_letters.append(
+                    {"response": chunk[index][0], "error": str(error["errors"])}
+                )
+        n_written += len(chunk) - len(failed)
+
+    chunk = []
     for response in responses:
-        row = {
-            "id": eval(response["open_labelled_records"])["id"],
-            "labels": eval(response["open_labelled_records"])["labels"],
-            "urgency": eval(response["open_labelled_records"])["urgency"],
-        }
-        rows.append(row)
-
-    # Write rows to BigQuery
-    try:
-        table = client.get_table(table_id)
-    except NotFound:
-        table = bigquery.Table(table_id, schema=schema)
-        table = client.create_table(table)
-
-    errors = client.insert_rows(table, rows)
-    if errors == []:
-        print(f"Data inserted into table {table_id}")
-    else:
-        print(f"Errors occurred while inserting data into table {table_id}: {errors}")
+        try:
+            chunk.append((response, parse_labelled_row(response)))
+        except ValueError as e:
+            dead_letters.append({"response": response, "error": str(e)})
+        if len(chunk) == chunk_size:
+            _insert(chunk)
+            chunk = []
+    if chunk:
+        _insert(chunk)
+
+    print(f"{n_written} rows inserted into table {table_id}")
+    if dead_letters:
+        write_dead_letters(dead_letters, dead_letter_path)
+        print(
+            f"{len(dead_letters)} responses couldn't be written, see {dead_letter_path}:"
+        )
+        for dead_letter in dead_letters[:10]:
+            print(f"  {dead_letter['error']}")
+    return dead_letters
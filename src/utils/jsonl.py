@@ -0,0 +1,37 @@
+import json
+import os
+from typing import Iterable, Iterator
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """Read a JSON Lines file one record at a time, so it needn't fit in memory
+
+    Args:
+        path (str): the path of the file
+
+    Yields:
+        dict: each record, skipping blank lines
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_jsonl(records: Iterable[dict], path: str) -> int:
+    """Write records to a JSON Lines file, one record per line
+
+    Args:
+        records (Iterable[dict]): the records
+        path (str): the path of the file
+
+    Returns:
+        int: the number of records written
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    n_records = 0
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            n_records += 1
+    return n_records
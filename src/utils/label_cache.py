@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from typing import Iterable
+
+LABEL_CACHE_PATH = "data/label_cache.sqlite3"
+
+# SQLite allows up to 999 parameters per statement in older versions
+MAX_QUERY_PARAMS = 500
+
+
+def normalise_feedback(text: str) -> str:
+    """Normalise feedback so that trivially different comments, e.g. "No." and " no",
+    share a cache entry: fold case and compatibility characters, drop punctuation and
+    collapse whitespace
+
+    Args:
+        text (str): the feedback
+
+    Returns:
+        str: the normalised feedback, empty if it has no letters or digits
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"[^\w\s]|_", " ", text)
+    return " ".join(text.split())
+
+
+def get_text_key(text: str, prompt_version: str) -> str | None:
+    """Get the cache key for the labels of some feedback
+
+    Args:
+        text (str): the feedback
+        prompt_version (str): identifies the prompt, labelled examples and model the
+            labels come from
+
+    Returns:
+        str | None: the cache key, or None if the feedback normalises to nothing
+    """
+    normalised = normalise_feedback(text)
+    if not normalised:
+        return None
+    return hashlib.sha256(f"{prompt_version}\n{normalised}".encode()).hexdigest()
+
+
+def open_label_cache(path: str = LABEL_CACHE_PATH) -> sqlite3.Connection:
+    """Open the label cache, creating it if it doesn't exist
+
+    Args:
+        path (str, optional): the path of the SQLite database. Defaults to
+            LABEL_CACHE_PATH.
+
+    Returns:
+        sqlite3.Connection: the connection
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS labels (
+            key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            text TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            urgency INTEGER NOT NULL,
+            created_time REAL NOT NULL
+        )
+        """
+    )
+    connection.commit()
+    return connection
+
+
+def read_cached_labels(
+    connection: sqlite3.Connection, keys: Iterable[str]
+) -> dict[str, tuple[list[str], int]]:
+    """Read the cached labels for some feedback
+
+    Args:
+        connection (sqlite3.Connection): the label cache
+        keys (Iterable[str]): the cache keys, see get_text_key
+
+    Returns:
+        dict[str, tuple[list[str], int]]: the labels and urgency for each cached key
+    """
+    keys = list(keys)
+    cached = {}
+    for start in range(0, len(keys), MAX_QUERY_PARAMS):
+        chunk = keys[start : start + MAX_QUERY_PARAMS]
+        rows = connection.execute(
+            "SELECT key, labels, urgency FROM labels WHERE key IN "
+            f"({', '.join('?' * len(chunk))})",
+            chunk,
+        )
+        for key, labels, urgency in rows:
+            cached[key] = (json.loads(labels), urgency)
+    return cached
+
+
+def write_cached_labels(
+    connection: sqlite3.Connection,
+    key: str,
+    prompt_version: str,
+    text: str,
+    labels: list[str],
+    urgency: int,
+):
+    """Cache the labels for some feedback, committing straight away so an interrupted
+    run keeps everything labelled so far
+
+    Args:
+        connection (sqlite3.Connection): the label cache
+        key (str): the cache key, see get_text_key
+        prompt_version (str): identifies the prompt, labelled examples and model
+        text (str): the feedback, kept for inspecting the cache
+        labels (list[str]): the labels
+        urgency (int): the urgency
+    """
+    connection.execute(
+        "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?)",
+        (key, prompt_version, text, json.dumps(labels), urgency, time.time()),
+    )
+    connection.commit()
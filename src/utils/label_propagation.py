@@ -0,0 +1,465 @@
+import hashlib
+import json
+from typing import Callable, Iterator
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Record
+
+
+def normalise_vectors(vectors) -> np.ndarray:
+    """Normalise vectors to unit length, so dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.size == 0:
+        return vectors.reshape(0, 0)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def iter_labelled_points(
+    client: QdrantClient, collection_name: str, chunk_size: int = 1000
+) -> Iterator[Record]:
+    """Scroll the points of a collection that have labels, with their vectors and
+    payloads
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        chunk_size (int, optional): number of points per scroll request. Defaults to 1000.
+
+    Yields:
+        Record: each labelled point
+    """
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name,
+            limit=chunk_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for record in records:
+            if record.payload.get("labels"):
+                yield record
+        if offset is None or not records:
+            break
+
+
+def get_labelled_vectors(
+    client: QdrantClient, collection_name: str, chunk_size: int = 1000
+) -> tuple[list[str], np.ndarray, list[list[str]], np.ndarray]:
+    """Read the labelled points of a collection, e.g. the evaluation collection, with
+    their vectors, labels and urgency
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        chunk_size (int, optional): number of points per scroll request. Defaults to 1000.
+
+    Returns:
+        list[str]: the point ids
+        np.ndarray: the normalised vectors
+        list[list[str]]: the labels of each point
+        np.ndarray: the urgency of each point, -1 if unknown
+    """
+    ids, vectors, label_sets, urgency = [], [], [], []
+    for record in iter_labelled_points(client, collection_name, chunk_size):
+        ids.append(str(record.id))
+        vectors.append(record.vector)
+        label_sets.append(list(record.payload["labels"]))
+        urgency.append(record.payload.get("urgency") or -1)
+    print(f"Loaded {len(ids)} labelled vectors from {collection_name}")
+    return ids, normalise_vectors(vectors), label_sets, np.array(urgency, dtype=int)
+
+
+def get_point_vectors(
+    client: QdrantClient, collection_name: str, ids: list, chunk_size: int = 500
+) -> dict[str, np.ndarray]:
+    """Retrieve the vectors of points by id
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        ids (list): the feedback record ids
+        chunk_size (int, optional): number of points per request. Defaults to 500.
+
+    Returns:
+        dict[str, np.ndarray]: the normalised vector of each id found in the collection
+    """
+    point_ids = [int(point_id) for point_id in ids]
+    vectors = {}
+    for i in range(0, len(point_ids), chunk_size):
+        records = client.retrieve(
+            collection_name=collection_name,
+            ids=point_ids[i : i + chunk_size],
+            with_payload=False,
+            with_vectors=True,
+        )
+        if records:
+            found = normalise_vectors([record.vector for record in records])
+            for record, vector in zip(records, found):
+                vectors[str(record.id)] = vector
+    return vectors
+
+
+class KnnLabeller:
+    """Labels records with the label set and urgency that most of their nearest labelled
+    neighbours share, weighted by similarity, when the neighbours agree strongly enough
+    and are similar enough for the labels to be trusted"""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        label_sets: list[list[str]],
+        urgency: np.ndarray,
+        k: int = 10,
+        min_agreement: float = 0.8,
+        min_similarity: float = 0.5,
+    ):
+        """
+        Index the labelled records
+
+        Args:
+            vectors (np.ndarray): the normalised vectors of the labelled records
+            label_sets (list[list[str]]): the labels of each labelled record
+            urgency (np.ndarray): the urgency of each labelled record, -1 if unknown
+            k (int, optional): the number of neighbours to vote. Defaults to 10.
+            min_agreement (float, optional): the share of the neighbours' similarity
+                that must be for the winning label set. Defaults to 0.8.
+            min_similarity (float, optional): the minimum mean similarity of the
+                neighbours. Defaults to 0.5.
+        """
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.urgency = np.asarray(urgency, dtype=int)
+        self.k = min(k, len(self.vectors))
+        self.min_agreement = min_agreement
+        self.min_similarity = min_similarity
+
+        # Map each distinct set of labels to an integer class
+        class_ids = {}
+        self.classes = []
+        self.label_classes = np.empty(len(label_sets), dtype=np.int64)
+        for i, labels in enumerate(label_sets):
+            key = tuple(sorted(set(labels)))
+            if key not in class_ids:
+                class_ids[key] = len(self.classes)
+                self.classes.append(list(key))
+            self.label_classes[i] = class_ids[key]
+
+    def predict(self, query_vectors: np.ndarray, chunk_size: int = 256) -> dict:
+        """
+        Vote on the labels and urgency of records from their nearest labelled records
+
+        Args:
+            query_vectors (np.ndarray): the normalised vectors of the records
+            chunk_size (int, optional): number of records to score at a time.
+                Defaults to 256.
+
+        Returns:
+            dict: the winning labels of each record, and arrays of its urgency, the
+                agreement and mean similarity of its neighbours, and whether the labels
+                are confident enough to use
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        n_queries = len(query_vectors)
+        winners = np.zeros(n_queries, dtype=np.int64)
+        urgency = np.full(n_queries, -1, dtype=int)
+        agreement = np.zeros(n_queries, dtype=np.float32)
+        similarity = np.zeros(n_queries, dtype=np.float32)
+        if self.k == 0:
+            return self._get_predictions(winners, urgency, agreement, similarity)
+
+        for start in range(0, n_queries, chunk_size):
+            scores = query_vectors[start : start + chunk_size] @ self.vectors.T
+            rows = np.arange(len(scores))[:, None]
+            top = np.argpartition(-scores, self.k - 1, axis=1)[:, : self.k]
+            similarities = scores[rows, top]
+            weights = np.maximum(similarities, 0)
+
+            # Similarity-weighted votes for each neighbour's label set
+            classes = self.label_classes[top]
+            votes = np.zeros((len(scores), len(self.classes)), dtype=np.float32)
+            np.add.at(votes, (rows, classes), weights)
+            chunk_winners = votes.argmax(axis=1)
+            total = weights.sum(axis=1)
+            chunk_agreement = votes[rows[:, 0], chunk_winners] / np.maximum(
+                total, 1e-12
+            )
+
+            # Votes for urgency from the neighbours with the winning label set
+            neighbour_urgency = self.urgency[top]
+            valid = (classes == chunk_winners[:, None]) & (neighbour_urgency >= 1)
+            urgency_votes = np.zeros((len(scores), 4), dtype=np.float32)
+            np.add.at(
+                urgency_votes,
+                (rows, np.clip(neighbour_urgency, 0, 3)),
+                weights * valid,
+            )
+            chunk_urgency = urgency_votes[:, 1:].argmax(axis=1) + 1
+            chunk_urgency[urgency_votes[:, 1:].sum(axis=1) == 0] = -1
+
+            end = start + len(scores)
+            winners[start:end] = chunk_winners
+            urgency[start:end] = chunk_urgency
+            agreement[start:end] = chunk_agreement
+            similarity[start:end] = similarities.mean(axis=1)
+
+        return self._get_predictions(winners, urgency, agreement, similarity)
+
+    def _get_predictions(self, winners, urgency, agreement, similarity) -> dict:
+        """Collect the votes, marking which records are confidently labelled"""
+        confident = (
+            (agreement >= self.min_agreement)
+            & (similarity >= self.min_similarity)
+            & (urgency >= 1)
+        )
+        return {
+            "labels": [
+                self.classes[winner] if self.classes else [] for winner in winners
+            ],
+            "urgency": urgency,
+            "agreement": agreement,
+            "similarity": similarity,
+            "confident": confident,
+        }
+
+
+class ExampleSelector:
+    """Selects the labelled examples most similar to the records of each labelling
+    request, so the prompt carries k relevant examples rather than all of them"""
+
+    def __init__(
+        self,
+        examples: list[dict],
+        vectors: np.ndarray,
+        get_vectors: Callable[[list], dict[str, np.ndarray]],
+        k: int = 5,
+    ):
+        """
+        Index the labelled examples
+
+        Args:
+            examples (list[dict]): the labelled examples, see iter_feedback_records
+            vectors (np.ndarray): the normalised vector of each example
+            get_vectors (Callable[[list], dict[str, np.ndarray]]): gets the normalised
+                vectors of records by id, e.g. get_point_vectors on the collection
+            k (int, optional): the number of examples per record. Defaults to 5.
+        """
+        self.examples = examples
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.get_vectors = get_vectors
+        self.k = min(k, len(examples))
+        self.labelled_examples = json.dumps(examples, indent=4)
+        self.version = hashlib.sha256(
+            f"{self.k}\n{self.labelled_examples}".encode()
+        ).hexdigest()
+
+    def select(self, query_vectors: np.ndarray) -> np.ndarray:
+        """
+        Find the most similar examples to each record
+
+        Args:
+            query_vectors (np.ndarray): the normalised vectors of the records
+
+        Returns:
+            np.ndarray: the indices of each record's k nearest examples, most similar
+                first
+        """
+        scores = np.asarray(query_vectors, dtype=np.float32) @ self.vectors.T
+        top = np.argpartition(-scores, self.k - 1, axis=1)[:, : self.k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def get_largest_examples(
+        self, n_examples: int, count_tokens: Callable[[str], int]
+    ) -> str:
+        """
+        Get the n examples with the most tokens, to budget for the longest prompt the
+        selector can give a request
+
+        Args:
+            n_examples (int): the number of examples
+            count_tokens (Callable[[str], int]): counts the tokens of a text
+
+        Returns:
+            str: JSON of the examples
+        """
+        sizes = [
+            count_tokens(json.dumps(example, indent=4)) for example in self.examples
+        ]
+        largest = sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True)
+        return json.dumps(
+            [self.examples[i] for i in sorted(largest[:n_examples])], indent=4
+        )
+
+    def __call__(self, new_examples: list[str]) -> str:
+        """
+        Get the labelled examples for a labelling request
+
+        Args:
+            new_examples (list[str]): JSON of each record of the request
+
+        Returns:
+            str: JSON of the nearest examples to the records, or of all the examples
+                if none of the records has a vector
+        """
+        ids = []
+        for new_example in new_examples:
+            try:
+                record = json.loads(new_example)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get("id") is not None:
+                ids.append(str(record["id"]))
+        vectors = self.get_vectors(ids) if ids and self.k else {}
+        found = [vectors[i] for i in ids if i in vectors]
+        if not found:
+            return self.labelled_examples
+        indices = dict.fromkeys(self.select(np.stack(found)).ravel().tolist())
+        return json.dumps([self.examples[i] for i in indices], indent=4)
+
+
+def get_example_selector(
+    client: QdrantClient,
+    examples_collection_name: str,
+    collection_name: str,
+    k: int = 5,
+) -> ExampleSelector:
+    """Get an example selector over the labelled points of a collection, e.g. the
+    evaluation collection, for records whose vectors are in another
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        examples_collection_name (str): the collection of labelled examples
+        collection_name (str): the collection holding the records' vectors
+        k (int, optional): the number of examples per record. Defaults to 5.
+
+    Returns:
+        ExampleSelector: the selector
+    """
+    examples, vectors = [], []
+    for record in iter_labelled_points(client, examples_collection_name):
+        examples.append(
+            {
+                "id": str(record.id),
+                "feedback": record.payload.get("feedback"),
+                "label": [record.payload["labels"]],
+            }
+        )
+        vectors.append(record.vector)
+    print(f"Loaded {len(examples)} labelled examples from {examples_collection_name}")
+    return ExampleSelector(
+        examples,
+        normalise_vectors(vectors),
+        lambda ids: get_point_vectors(client, collection_name, ids),
+        k=k,
+    )
+
+
+def get_prelabeller(
+    labeller: KnnLabeller, client: QdrantClient, collection_name: str
+) -> Callable[[list[dict]], list[dict | None]]:
+    """Get a function labelling a chunk of records from their neighbours, for
+    label_records to send only the records it can't label confidently to the LLM
+
+    Args:
+        labeller (KnnLabeller): the labeller
+        client (QdrantClient): the Qdrant client
+        collection_name (str): the collection holding the records' vectors
+
+    Returns:
+        Callable[[list[dict]], list[dict | None]]: gets a response for each record, as
+            from create_openai_labelled_data, or None if it must go to the LLM
+    """
+
+    def prelabel(records: list[dict]) -> list[dict | None]:
+        vectors = get_point_vectors(
+            client, collection_name, [record["id"] for record in records]
+        )
+        found = [i for i, record in enumerate(records) if str(record["id"]) in vectors]
+        responses = [None] * len(records)
+        if not found:
+            return responses
+        predictions = labeller.predict(
+            np.stack([vectors[str(records[i]["id"])] for i in found])
+        )
+        for j, i in enumerate(found):
+            if predictions["confident"][j]:
+                responses[i] = {
+                    "open_labelled_records": json.dumps(
+                        {
+                            "id": records[i]["id"],
+                            "labels": predictions["labels"][j],
+                            "urgency": int(predictions["urgency"][j]),
+                        }
+                    ),
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "error": None,
+                    "labelled_by": "knn",
+                }
+        return responses
+
+    return prelabel
+
+
+def evaluate_knn_labelling(
+    vectors: np.ndarray,
+    label_sets: list[list[str]],
+    urgency: np.ndarray,
+    holdout_fraction: float = 0.2,
+    seed: int = 42,
+    **kwargs,
+) -> dict:
+    """Hold out some of the LLM labelled records, label them from their neighbours in
+    the rest, and compare with the LLM's labels
+
+    Args:
+        vectors (np.ndarray): the normalised vectors of the labelled records
+        label_sets (list[list[str]]): the labels of each labelled record
+        urgency (np.ndarray): the urgency of each labelled record, -1 if unknown
+        holdout_fraction (float, optional): the share of records to hold out.
+            Defaults to 0.2.
+        seed (int, optional): the random seed. Defaults to 42.
+        **kwargs: k, min_agreement and min_similarity, see KnnLabeller
+
+    Returns:
+        dict: the number of held out records, the number and share labelled from their
+            neighbours (the LLM calls saved), the share of those whose label set and
+            urgency match the LLM's and their mean label Jaccard similarity, and the
+            share of all held out records given different labels to the LLM's (the
+            agreement lost)
+    """
+    urgency = np.asarray(urgency, dtype=int)
+    order = np.random.default_rng(seed).permutation(len(label_sets))
+    n_holdout = max(1, int(round(len(order) * holdout_fraction)))
+    holdout, train = order[:n_holdout], order[n_holdout:]
+
+    labeller = KnnLabeller(
+        vectors[train], [label_sets[i] for i in train], urgency[train], **kwargs
+    )
+    predictions = labeller.predict(vectors[holdout])
+    confident = np.flatnonzero(predictions["confident"])
+
+    label_matches, jaccards, urgency_matches = [], [], []
+    for j in confident:
+        predicted = set(predictions["labels"][j])
+        actual = set(label_sets[holdout[j]])
+        label_matches.append(predicted == actual)
+        jaccards.append(len(predicted & actual) / len(predicted | actual))
+        if urgency[holdout[j]] >= 1:
+            urgency_matches.append(predictions["urgency"][j] == urgency[holdout[j]])
+
+    def _mean(values):
+        return float(np.mean(values)) if values else None
+
+    n_propagated = len(confident)
+    return {
+        "n_holdout": n_holdout,
+        "n_propagated": n_propagated,
+        "calls_saved": n_propagated / n_holdout,
+        "label_agreement": _mean(label_matches),
+        "label_jaccard": _mean(jaccards),
+        "urgency_agreement": _mean(urgency_matches),
+        "agreement_lost": (n_propagated - sum(label_matches)) / n_holdout,
+    }
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import time
+from typing import Iterable, Iterator
+
+from src.utils.async_call_openai import label_records
+from src.utils.bigquery import write_to_bigquery
+
+LABELLING_JOURNAL_PATH = "data/labelling_journal.jsonl"
+
+
+def get_flushed_path(journal_path: str) -> str:
+    """Get the path of the file recording how much of a journal has been written to
+    BigQuery"""
+    return f"{journal_path}.flushed"
+
+
+def read_flushed_offset(journal_path: str) -> int:
+    """Read the byte offset up to which a journal has been written to BigQuery
+
+    Args:
+        journal_path (str): the path of the journal
+
+    Returns:
+        int: the offset, 0 if nothing has been written
+    """
+    flushed_path = get_flushed_path(journal_path)
+    if not os.path.exists(flushed_path):
+        return 0
+    with open(flushed_path) as f:
+        return json.load(f)["offset"]
+
+
+def write_flushed_offset(journal_path: str, offset: int):
+    """Record the byte offset up to which a journal has been written to BigQuery,
+    replacing the file atomically so it is never read half written
+
+    Args:
+        journal_path (str): the path of the journal
+        offset (int): the offset
+    """
+    flushed_path = get_flushed_path(journal_path)
+    tmp_path = f"{flushed_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"offset": offset}, f)
+    os.replace(tmp_path, flushed_path)
+
+
+def iter_journal(journal_path: str, offset: int = 0) -> Iterator[tuple[dict, int]]:
+    """Read the entries of a journal from an offset, stopping at a last line left half
+    written by a crash
+
+    Args:
+        journal_path (str): the path of the journal
+        offset (int, optional): the byte offset to read from. Defaults to 0.
+
+    Yields:
+        tuple[dict, int]: each entry, and the offset of the end of its line
+    """
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            yield json.loads(line), offset
+
+
+def repair_journal(journal_path: str):
+    """Remove a last line left half written by a crash, so new entries start on a line
+    of their own
+
+    Args:
+        journal_path (str): the path of the journal
+    """
+    if not os.path.exists(journal_path):
+        return
+    end = 0
+    for _, end in iter_journal(journal_path):
+        pass
+    if os.path.getsize(journal_path) != end:
+        print(f"Removing a half written entry from the end of {journal_path}")
+        with open(journal_path, "r+b") as f:
+            f.truncate(end)
+
+
+def get_done_ids(journal_path: str) -> set:
+    """Get the ids of the records a journal has labelled. Records whose request failed
+    are not done, so they are labelled again on resuming.
+
+    Args:
+        journal_path (str): the path of the journal
+
+    Returns:
+        set: the ids
+    """
+    return {
+        entry["id"]
+        for entry, _ in iter_journal(journal_path)
+        if entry["error"] is None and entry["id"] is not None
+    }
+
+
+def flush_journal(
+    journal_path: str,
+    table_id: str,
+    publishing_project_id: str,
+    batch_size: int = 500,
+) -> int:
+    """Write the labelled records journalled since the last flush to BigQuery, in
+    batches, recording the offset written up to after each batch. Rows BigQuery rejects
+    go to write_to_bigquery's dead letter file rather than being written again.
+
+    Args:
+        journal_path (str): the path of the journal
+        table_id (str): the table to write to
+        publishing_project_id (str): the project of the table
+        batch_size (int, optional): the maximum rows per write. Defaults to 500.
+
+    Returns:
+        int: the number of rows written, not counting rows sent to the dead letter file
+    """
+    offset = read_flushed_offset(journal_path)
+    n_rows = 0
+    batch = []
+    for entry, end in iter_journal(journal_path, offset):
+        if entry["error"] is None:
+            batch.append(entry)
+        if len(batch) == batch_size:
+            dead_letters = write_to_bigquery(table_id, batch, publishing_project_id)
+            write_flushed_offset(journal_path, end)
+            n_rows += len(batch) - len(dead_letters)
+            batch = []
+        offset = end
+    if batch:
+        dead_letters = write_to_bigquery(table_id, batch, publishing_project_id)
+        n_rows += len(batch) - len(dead_letters)
+    write_flushed_offset(journal_path, offset)
+    return n_rows
+
+
+async def run_labelling_job(
+    labelled_examples: str,
+    records: Iterable[dict],
+    table_id: str,
+    publishing_project_id: str,
+    open_api_key: str | None = None,
+    journal_path: str = LABELLING_JOURNAL_PATH,
+    flush_size: int = 500,
+    flush_interval: float = 30.0,
+    **kwargs,
+) -> dict:
+    """Label records and write them to BigQuery, journalling each response as it
+    completes so that a job that dies can be resumed by running it again with the same
+    journal. On resuming, journalled records not yet written to BigQuery are written
+    first, and records already labelled are skipped by id. Rows are written to BigQuery
+    at least once: a crash between a write and recording it writes those rows again.
+
+    Args:
+        labelled_examples (str): JSON of the labelled examples
+        records (Iterable[dict]): the records to label, each with an id and feedback
+        table_id (str): the table to write the labelled records to
+        publishing_project_id (str): the project of the table
+        open_api_key (str, optional): the OpenAI API key
+        journal_path (str, optional): the path of the journal. Defaults to
+            LABELLING_JOURNAL_PATH.
+        flush_size (int, optional): write to BigQuery after this many responses.
+            Defaults to 500.
+        flush_interval (float, optional): or after this many seconds. Defaults to 30.0.
+        **kwargs: caching, concurrency, rate limits and packing, see label_records
+
+    Returns:
+        dict: the number of records skipped, labelled and failed, and rows written
+    """
+    os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+    repair_journal(journal_path)
+    n_written = await asyncio.to_thread(
+        flush_journal,
+        journal_path,
+        table_id,
+        publishing_project_id,
+        batch_size=flush_size,
+    )
+    done_ids = get_done_ids(journal_path)
+    if done_ids:
+        print(f"Resuming: skipping {len(done_ids)} records already labelled")
+
+    n_skipped = 0
+
+    def _remaining_records():
+        nonlocal n_skipped
+        for record in records:
+            if record.get("id") in done_ids:
+                n_skipped += 1
+            else:
+                yield record
+
+    n_labelled = n_failed = n_unflushed = 0
+    last_flush = time.monotonic()
+    with open(journal_path, "a") as journal:
+
+        async def _flush():
+            nonlocal n_written, n_unflushed, last_flush
+            journal.flush()
+            os.fsync(journal.fileno())
+            # Write to BigQuery in a thread, so requests in flight carry on meanwhile
+            n_written += await asyncio.to_thread(
+                flush_journal,
+                journal_path,
+                table_id,
+                publishing_project_id,
+                batch_size=flush_size,
+            )
+            n_unflushed = 0
+            last_flush = time.monotonic()
+
+        async for _, record, response in label_records(
+            labelled_examples, _remaining_records(), open_api_key=open_api_key, **kwargs
+        ):
+            journal.write(json.dumps({"id": record.get("id"), **response}) + "\n")
+            journal.flush()
+            n_labelled += response["error"] is None
+            n_failed += response["error"] is not None
+            n_unflushed += 1
+            if (
+                n_unflushed >= flush_size
+                or time.monotonic() - last_flush >= flush_interval
+            ):
+                await _flush()
+        await _flush()
+
+    print(
+        f"Labelling job done: {n_labelled} labelled, {n_failed} failed, {n_skipped} "
+        f"skipped as already labelled, {n_written} rows written to {table_id}"
+    )
+    return {
+        "n_skipped": n_skipped,
+        "n_labelled": n_labelled,
+        "n_failed": n_failed,
+        "n_written": n_written,
+    }
@@ -0,0 +1,264 @@
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+def label_as_unknown(body: dict) -> str:
+    """Label the record in a labelling request as "Unknown", with the id taken from the
+    record at the end of the user prompt
+
+    Args:
+        body (dict): the chat completion request
+
+    Returns:
+        str: the labelled record as a JSON string
+    """
+    record = body["messages"][-1]["content"].rsplit("Here's the feedback", 1)[-1]
+    ids = re.findall(r'"id":\s*"?([^",}\s]+)', record)
+    return json.dumps(
+        {"id": ids[0] if ids else None, "labels": ["Unknown"], "urgency": 1}
+    )
+
+
+class OpenAIStubServer(ThreadingHTTPServer):
+    """Stands in for the OpenAI files and batches endpoints, so batch labelling can be
+    run offline. Batches complete after a number of polls, answering each request with
+    the content from respond."""
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        respond: Callable[[dict], str] = label_as_unknown,
+        polls_to_complete: int = 1,
+    ):
+        """
+        Create the server
+
+        Args:
+            address (tuple[str, int]): the host and port to listen on
+            respond (Callable, optional): gets the content of the completion for a chat
+                completion request, raising an exception to fail the request. Defaults
+                to label_as_unknown.
+            polls_to_complete (int, optional): the number of times a batch is retrieved
+                in progress before it completes. Defaults to 1.
+        """
+        super().__init__(address, StubRequestHandler)
+        self.respond = respond
+        self.polls_to_complete = polls_to_complete
+        self.files = {}
+        self.batches = {}
+        self.n_polls = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """The base URL to give the OpenAI client"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        """Store a file, returning its file object"""
+        file_id = f"file-{next(self.ids)}"
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content,
+        }
+        return {
+            key: value for key, value in self.files[file_id].items() if key != "content"
+        }
+
+    def run_batch(self, batch: dict):
+        """Answer every request in a batch, writing the output and error files"""
+        output_lines = []
+        error_lines = []
+        for line in self.files[batch["input_file_id"]]["content"].splitlines():
+            request = json.loads(line)
+            result = {
+                "id": f"batch_req_{next(self.ids)}",
+                "custom_id": request["custom_id"],
+            }
+            try:
+                content = self.respond(request["body"])
+                prompt_tokens = (
+                    sum(
+                        len(message["content"])
+                        for message in request["body"]["messages"]
+                    )
+                    // 4
+                )
+                completion_tokens = len(content) // 4
+                result["response"] = {
+                    "status_code": 200,
+                    "request_id": result["id"],
+                    "body": {
+                        "id": f"chatcmpl-{result['id']}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request["body"]["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    },
+                }
+                result["error"] = None
+                output_lines.append(json.dumps(result))
+            except Exception as e:
+                result["response"] = None
+                result["error"] = {"code": "server_error", "message": str(e)}
+                error_lines.append(json.dumps(result))
+
+        for key, lines in [
+            ("output_file_id", output_lines),
+            ("error_file_id", error_lines),
+        ]:
+            if lines:
+                batch[key] = self.add_file(
+                    ("\n".join(lines) + "\n").encode(), f"{key}.jsonl", "batch_output"
+                )["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {
+            "total": len(output_lines) + len(error_lines),
+            "completed": len(output_lines),
+            "failed": len(error_lines),
+        }
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests made by client.files and client.batches"""
+
+    def send_json(self, content: dict, status: int = 200):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_not_found(self):
+        self.send_json({"error": {"message": f"No route {self.path}"}}, status=404)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        server = self.server
+        if self.path == "/v1/files":
+            message = BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+                + self.read_body()
+            )
+            fields = {
+                part.get_param("name", header="content-disposition"): part
+                for part in message.get_payload()
+            }
+            with server.lock:
+                file = server.add_file(
+                    fields["file"].get_payload(decode=True),
+                    fields["file"].get_filename(),
+                    fields["purpose"].get_payload(decode=True).decode(),
+                )
+            self.send_json(file)
+        elif self.path == "/v1/batches":
+            request = json.loads(self.read_body())
+            with server.lock:
+                batch_id = f"batch_{next(server.ids)}"
+                server.batches[batch_id] = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": request["endpoint"],
+                    "input_file_id": request["input_file_id"],
+                    "completion_window": request["completion_window"],
+                    "status": "validating",
+                    "created_at": int(time.time()),
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                server.n_polls[batch_id] = 0
+            self.send_json(server.batches[batch_id])
+        else:
+            self.send_not_found()
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+            batch_id = parts[2]
+            if batch_id not in server.batches:
+                return self.send_not_found()
+            with server.lock:
+                batch = server.batches[batch_id]
+                server.n_polls[batch_id] += 1
+                # Batches failed, expired or cancelled by a test stay that way
+                if batch["status"] in ("validating", "in_progress"):
+                    if server.n_polls[batch_id] > server.polls_to_complete:
+                        server.run_batch(batch)
+                    else:
+                        batch["status"] = "in_progress"
+            self.send_json(batch)
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content":
+            file = server.files.get(parts[2])
+            if file is None:
+                return self.send_not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(file["content"])))
+            self.end_headers()
+            self.wfile.write(file["content"])
+        else:
+            self.send_not_found()
+
+    def log_message(self, format, *args):
+        # Keep test and script output readable
+        pass
+
+
+def start_stub_server(
+    host: str = "127.0.0.1", port: int = 0, **kwargs
+) -> OpenAIStubServer:
+    """Start the stub server in a background thread
+
+    Args:
+        host (str, optional): the host to listen on. Defaults to "127.0.0.1".
+        port (int, optional): the port to listen on. Defaults to 0, any free port.
+        **kwargs: see OpenAIStubServer
+
+    Returns:
+        OpenAIStubServer: the server, with its base_url for the OpenAI client. Call
+            shutdown() to stop it.
+    """
+    server = OpenAIStubServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve stand-ins for the OpenAI files and batches endpoints."
+    )
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    server = OpenAIStubServer(("127.0.0.1", args.port))
+    print(f"Serving on {server.base_url}, set OPENAI_BASE_URL to use it")
+    server.serve_forever()
@@ -0,0 +1,221 @@
+import datetime
+import os
+import re
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+
+def get_source_tables(query: str) -> list[str]:
+    """Get the tables and views a query reads from
+
+    Args:
+        query (str): rendered SQL query
+
+    Returns:
+        list[str]: sorted, distinct table ids following FROM or JOIN
+    """
+    tables = re.findall(r"(?:FROM|JOIN)\s+`?([\w\-]+(?:\.[\w\-]+)+)`?", query, re.I)
+    return sorted(set(tables))
+
+
+class BigQueryBackend:
+    """Runs queries and writes rows using BigQuery"""
+
+    name = "bigquery"
+
+    def __init__(self, project_id: str):
+        self.client = bigquery.Client(project=project_id)
+
+    def query(self, query: str) -> pa.Table:
+        """Run a query and wait for it to complete
+
+        Args:
+            query (str): rendered SQL query
+
+        Returns:
+            pa.Table: query result
+        """
+        query_job = self.client.query(query)
+        return query_job.result().to_arrow(create_bqstorage_client=False)
+
+    def get_tables_last_modified(self, table_ids: list[str]) -> str:
+        """Get the last-modified times of a list of tables, joined into a single string.
+        Views are resolved to the tables they read from, as a view's own modified time
+        only changes with its definition.
+
+        Args:
+            table_ids (list[str]): table ids
+
+        Returns:
+            str: last-modified times in ISO format, separated by commas
+        """
+        last_modified = []
+        for table_id in table_ids:
+            table = self.client.get_table(table_id)
+            last_modified.append(f"{table_id}={table.modified.isoformat()}")
+            if table.table_type == "VIEW":
+                view_tables = get_source_tables(table.view_query)
+                last_modified.append(self.get_tables_last_modified(view_tables))
+        return ",".join(last_modified)
+
+    def insert_rows(
+        self, table_id: str, rows: list[dict], schema: list[bigquery.SchemaField]
+    ) -> list:
+        """Insert rows into a table, creating it if it does not exist
+
+        Args:
+            table_id (str): table id
+            rows (list[dict]): rows to insert
+            schema (list[bigquery.SchemaField]): schema used if the table is created
+
+        Returns:
+            list: insert errors, empty if all rows were inserted
+        """
+        try:
+            table = self.client.get_table(table_id)
+        except NotFound:
+            table = bigquery.Table(table_id, schema=schema)
+            table = self.client.create_table(table)
+
+        return self.client.insert_rows(table, rows)
+
+
+class DuckDBBackend:
+    """Runs the BigQuery SQL in src/sql_queries.py with DuckDB over local Parquet files.
+
+    A table id such as `project.dataset.table` is mapped to the file
+    {data_dir}/table.parquet. Only the BigQuery syntax used in this repo is translated.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, data_dir: str):
+        # Imported here as DuckDB is only needed to run without BigQuery
+        import duckdb
+
+        self.data_dir = data_dir
+        self.connection = duckdb.connect()
+
+    def get_table_path(self, table_id: str) -> str:
+        """Path of the Parquet file standing in for a BigQuery table"""
+        table_name = table_id.strip("`").split(".")[-1]
+        return os.path.join(self.data_dir, f"{table_name}.parquet")
+
+    def translate_query(self, query: str) -> str:
+        """Translate BigQuery SQL to DuckDB SQL
+
+        Args:
+            query (str): rendered BigQuery SQL query
+
+        Returns:
+            str: DuckDB SQL query reading from local Parquet files
+        """
+        for table_id in get_source_tables(query):
+            path = self.get_table_path(table_id).replace("'", "''")
+            query = re.sub(
+                rf"`?{re.escape(table_id)}(?![\w\-.])`?",
+                lambda _: f"read_parquet('{path}')",
+                query,
+            )
+        # BigQuery quotes identifiers with backticks, so double quotes are always strings
+        query = re.sub(
+            r'"([^"]*)"', lambda match: "'" + match[1].replace("'", "''") + "'", query
+        )
+        query = re.sub(r"\bRAND\(\)", "random()", query, flags=re.I)
+        # BigQuery's correlated comma join on UNNEST becomes a subquery
+        query = re.sub(
+            r"FROM\s+(read_parquet\('[^']*'\)),\s*UNNEST\((\w+)\)\s+as\s+(\w+)",
+            r"FROM (SELECT UNNEST(\2) AS \3 FROM \1)",
+            query,
+            flags=re.I,
+        )
+        return query
+
+    def query(self, query: str) -> pa.Table:
+        """Run a query
+
+        Args:
+            query (str): rendered BigQuery SQL query
+
+        Returns:
+            pa.Table: query result
+        """
+        result = self.connection.sql(self.translate_query(query)).arrow()
+        # Newer DuckDB versions return a RecordBatchReader rather than a Table
+        return pa.table(result)
+
+    def get_tables_last_modified(self, table_ids: list[str]) -> str:
+        """Get the last-modified times of the Parquet files for a list of tables
+
+        Args:
+            table_ids (list[str]): table ids
+
+        Returns:
+            str: last-modified times in ISO format, separated by commas
+        """
+        last_modified = []
+        for table_id in table_ids:
+            modified = os.path.getmtime(self.get_table_path(table_id))
+            modified = datetime.datetime.fromtimestamp(modified).isoformat()
+            last_modified.append(f"{self.name}:{table_id}={modified}")
+        return ",".join(last_modified)
+
+    def insert_rows(
+        self, table_id: str, rows: list[dict], schema: list[bigquery.SchemaField]
+    ) -> list:
+        """Append rows to the Parquet file for a table, creating it if it does not exist
+
+        Args:
+            table_id (str): table id
+            rows (list[dict]): rows to insert
+            schema (list[bigquery.SchemaField]): schema of the table
+
+        Returns:
+            list: insert errors, empty if all rows were inserted
+        """
+        types = {"STRING": pa.string(), "INTEGER": pa.int64(), "FLOAT": pa.float64()}
+        arrow_schema = pa.schema(
+            [
+                (
+                    field.name,
+                    pa.list_(types[field.field_type])
+                    if field.mode == "REPEATED"
+                    else types[field.field_type],
+                )
+                for field in schema
+            ]
+        )
+        try:
+            table = pa.Table.from_pylist(rows, schema=arrow_schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            return [{"errors": str(e)}]
+
+        path = self.get_table_path(table_id)
+        if os.path.exists(path):
+            table = pa.concat_tables([pq.read_table(path, schema=arrow_schema), table])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        pq.write_table(table, path)
+        return []
+
+
+def get_query_backend(project_id: str):
+    """Get the backend set by QUERY_BACKEND: "bigquery" (default) or "duckdb".
+
+    The DuckDB backend reads Parquet files from DUCKDB_DATA_DIR (default data/local_tables).
+
+    Args:
+        project_id (str): BigQuery project ID
+
+    Returns:
+        BigQueryBackend | DuckDBBackend: the query backend
+    """
+    backend = os.getenv("QUERY_BACKEND", "bigquery").lower()
+    if backend == "bigquery":
+        return BigQueryBackend(project_id)
+    elif backend == "duckdb":
+        return DuckDBBackend(os.getenv("DUCKDB_DATA_DIR", "data/local_tables"))
+    else:
+        raise ValueError(f"Unknown QUERY_BACKEND {backend}, use bigquery or duckdb")
@@ -1,5 +1,7 @@
 import random
-from collections import Counter, defaultdict
+from collections import Counter
+
+import numpy as np
 
 
 def calculate_class_proportions(records: list):
@@ -44,20 +46,90 @@ def get_random_sample(records: list, sample_size: int):
     return sampled_dicts
 
 
+def allocate_sample_sizes(counts, total_sample_size: int) -> np.ndarray:
+    """
+    Shares a total sample size between labels in proportion to their counts, using the
+    largest remainder method. Labels too rare for a proportional share get one sample
+    each, and the rest is shared between the others. If there are more labels than
+    samples, the most common labels get one sample each.
+
+    Args:
+        counts (array-like): The number of occurrences of each label.
+        total_sample_size (int): The total number of samples to share.
+
+    Returns:
+        np.ndarray: The sample size of each label, summing to total_sample_size.
+    """
+    counts = np.asarray(counts, dtype=float)
+    sample_sizes = np.zeros(len(counts), dtype=int)
+    if total_sample_size <= 0 or len(counts) == 0:
+        return sample_sizes
+    if total_sample_size <= len(counts):
+        sample_sizes[np.argsort(-counts, kind="stable")[:total_sample_size]] = 1
+        return sample_sizes
+
+    # Give one sample to each label whose proportional share is under one, until the
+    # shares of the remaining labels are all at least one
+    minimum = np.zeros(len(counts), dtype=bool)
+    while True:
+        n_seats = total_sample_size - minimum.sum()
+        shares = np.where(minimum, 0, counts * n_seats / counts[~minimum].sum())
+        below = ~minimum & (shares < 1)
+        if not below.any():
+            break
+        minimum |= below
+
+    sample_sizes = np.floor(shares).astype(int)
+    remainders = np.where(minimum, -1, shares - sample_sizes)
+    n_left = n_seats - sample_sizes.sum()
+    sample_sizes[np.argsort(-remainders, kind="stable")[:n_left]] += 1
+    sample_sizes[minimum] = 1
+    return sample_sizes
+
+
+def get_label_codes(records: list, label_key: str = "labels"):
+    """
+    Encodes the labels of each record as integer codes, numbered from the rarest label.
+
+    Args:
+        records (list): A list of dictionaries, each with a list of labels.
+        label_key (str): The name of the key containing the labels.
+
+    Returns:
+        list: The labels, in code order.
+        np.ndarray: The number of occurrences of each label.
+        list of tuple: The codes of each record's labels, rarest first.
+    """
+    label_counts = Counter(label for record in records for label in record[label_key])
+    labels = sorted(label_counts, key=label_counts.get)
+    codes = {label: code for code, label in enumerate(labels)}
+    record_codes = [
+        tuple(sorted({codes[label] for label in record[label_key]}))
+        for record in records
+    ]
+    counts = np.array([label_counts[label] for label in labels], dtype=np.int64)
+    return labels, counts, record_codes
+
+
 def get_stratified_sample(
-    records, total_sample_size=20, id_key="feedback_record_id", label_key="labels"
+    records,
+    total_sample_size=20,
+    id_key="feedback_record_id",
+    label_key="labels",
+    seed=None,
 ):
     """
     Performs simplified stratified sampling from a list of records. It aims to return a list
     of records close to the specified total sample size while approximating class proportions
     without including any duplicates.
 
-    This function first calculates the proportional sample size for each label based on the
-    occurrences in the input records. It then samples records for each label, ensuring no
-    record is included more than once. If the sum of proportional samples exceeds the total
-    sample size, it reduces the sample size for the most represented label. If the final
-    sampled records are less than the total sample size, it fills the gap with random samples
-    from the remaining records.
+    This function first shares the total sample size between labels in proportion to
+    their occurrences in the input records (see allocate_sample_sizes). It then takes a
+    single pass over the records in a random order, sampling each record for its rarest
+    label that still needs samples, so no record is included more than once. If the
+    labels run out of records before the total sample size is reached, it fills the gap
+    with the next records in the same random order. The time taken grows linearly with
+    the number of records.
 
     Args:
         records (list of dict): A list where each dict is a record containing at least a 'labels'
@@ -66,59 +138,44 @@ def get_stratified_sample(
         id_key (str): The name of the key containing the unique id. Required to ensure
                         there are no duplicates in the sample.
         label_key (str): The name of the key containing the labels.
+        seed (int, optional): The random seed. Defaults to None.
 
     Returns:
         list of dict: A list of sampled records, approximately matching the total sample size,
                       without any duplicates.
 
     """
-    # Count the occurrences of each label
-    label_counts = Counter(label for record in records for label in record[label_key])
-    total_labels = sum(label_counts.values())
+    _, counts, record_codes = get_label_codes(records, label_key)
+    remaining = allocate_sample_sizes(counts, total_sample_size).tolist()
+    n_remaining = sum(remaining)
 
-    # Determine proportional sample sizes for each label
-    label_sample_sizes = {
-        label: max(1, int((count / total_labels) * total_sample_size))
-        for label, count in label_counts.items()
-    }
-
-    # Adjust sample sizes if the sum exceeds total_sample_size
-    while sum(label_sample_sizes.values()) > total_sample_size:
-        max_label = max(label_sample_sizes, key=label_sample_sizes.get)
-        label_sample_sizes[max_label] -= 1
-
-    grouped_records = defaultdict(list)
-    for record in records:
-        for label in record[label_key]:
-            grouped_records[label].append(record)
-
-    sampled_records = []
+    order = np.random.default_rng(seed).permutation(len(records))
+    sampled = np.zeros(len(records), dtype=bool)
     sampled_ids = set()  # Track sampled record IDs to prevent duplicates
-
-    for label, sample_size in label_sample_sizes.items():
-        available_records = [
-            record
-            for record in grouped_records[label]
-            if record[id_key] not in sampled_ids
-        ]
-        samples = random.sample(
-            available_records, min(sample_size, len(available_records))
-        )
-        sampled_records.extend(samples)
-        sampled_ids.update(record[id_key] for record in samples)
-
-    # Adjust the final sampled records to meet the total_sample_size - required due to multi-labels
-    if len(sampled_records) > total_sample_size:
-        sampled_records = random.sample(sampled_records, total_sample_size)
-    elif len(sampled_records) < total_sample_size:
-        remaining_records = [
-            record for record in records if record[id_key] not in sampled_ids
-        ]
-        if remaining_records:
-            additional_samples = random.sample(
-                remaining_records,
-                min(total_sample_size - len(sampled_records), len(remaining_records)),
-            )
-            sampled_records.extend(additional_samples)
-
-    return sampled_records
+    n_sampled = 0
+    for i in order.tolist():
+        if not n_remaining:
+            break
+        record_id = records[i][id_key]
+        if record_id in sampled_ids:
+            continue
+        for code in record_codes[i]:
+            if remaining[code]:
+                remaining[code] -= 1
+                n_remaining -= 1
+                sampled[i] = True
+                sampled_ids.add(record_id)
+                n_sampled += 1
+                break
+
+    # Fill any gap left by labels without enough records - required due to multi-labels
+    for i in order.tolist():
+        if n_sampled >= total_sample_size:
+            break
+        record_id = records[i][id_key]
+        if not sampled[i] and record_id not in sampled_ids:
+            sampled[i] = True
+            sampled_ids.add(record_id)
+            n_sampled += 1
+
+    return [records[i] for i in order[sampled[order]]]
@@ -1,6 +1,7 @@
 import os
 import csv
 import json
+from typing import Iterable, Iterator
 
 from qdrant_client import QdrantClient
 from sentence_transformers import SentenceTransformer
@@ -44,21 +45,31 @@ def load_model(model_name: str) -> SentenceTransformer:
     return model
 
 
+def iter_feedback_records(records: Iterable, labelled=False) -> Iterator[dict]:
+    """Get the record to label for each row of concatenated feedback
+
+    Args:
+        records (Iterable): rows with feedback_record_id, concatenated_response_value
+            and, if labelled, labels
+        labelled (bool, optional): whether the rows are labelled. Defaults to False.
+
+    Yields:
+        dict: the id, feedback and label of each row
+    """
+    for item in records:
+        yield {
+            "id": item["feedback_record_id"],
+            "feedback": item["concatenated_response_value"],
+            "label": [item["labels"] if labelled else ""],
+        }
+
+
 def jsonify_data(records: list, labelled=False):
     """
     Create json string from feedback
     :return: json string of feedback records
     """
-    subs = []
-    for item in records:
-        response_value = item["concatenated_response_value"]
-        subs.append(
-            {
-                "id": item["feedback_record_id"],
-                "feedback": response_value,
-                "label": [item["labels"] if labelled else ""],
-            }
-        )
+    subs = list(iter_feedback_records(records, labelled=labelled))
 
     return json.dumps(subs, indent=4)
 
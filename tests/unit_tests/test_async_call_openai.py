@@ -0,0 +1,320 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from src.utils.async_call_openai import (
+    RateLimiter,
+    create_openai_labelled_data,
+    create_packed_labelled_data,
+    gather_responses,
+    get_retry_after,
+    iter_packs,
+    label_jsonl,
+    stream_responses,
+    validate_packed_labels,
+)
+from src.utils.jsonl import read_jsonl, write_jsonl
+
+
+def rate_limit_error(headers: dict) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.RateLimitError(
+        "Rate limit reached",
+        response=httpx.Response(429, headers=headers, request=request),
+        body=None,
+    )
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions, echoing the record to label, or returning
+    the given contents in turn"""
+
+    def __init__(self, errors=None, delay=0.0, contents=None):
+        self.errors = list(errors or [])
+        self.delay = delay
+        self.contents = list(contents or [])
+        self.n_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, messages, **kwargs):
+        self.n_calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            if self.contents:
+                content = self.contents.pop(0)
+            else:
+                content = messages[1]["content"].rsplit("Here's the feedback", 1)[1]
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+            )
+        finally:
+            self.in_flight -= 1
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_client():
+    def client(**kwargs):
+        completions = FakeCompletions(**kwargs)
+        return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    return client
+
+
+def test_get_retry_after():
+    """Test Retry-After is read in seconds or milliseconds."""
+    assert get_retry_after(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert get_retry_after(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert get_retry_after(rate_limit_error({})) is None
+    assert get_retry_after(ValueError()) is None
+
+
+def test_create_openai_labelled_data_retries(get_client):
+    """Test rate limit errors are retried after Retry-After, and give up eventually."""
+    client = get_client(errors=[rate_limit_error({"retry-after": "0.2"})])
+    start = time.monotonic()
+    response = asyncio.run(
+        create_openai_labelled_data("examples", "record", client=client)
+    )
+    assert time.monotonic() - start >= 0.2
+    assert client.chat.completions.n_calls == 2
+    assert response["error"] is None
+    assert response["prompt_tokens"] == 10
+
+    client = get_client(errors=[rate_limit_error({"retry-after": "0"})] * 3)
+    response = asyncio.run(
+        create_openai_labelled_data("examples", "record", client=client, max_retries=2)
+    )
+    assert client.chat.completions.n_calls == 3
+    assert response["open_labelled_records"] is None
+    assert "RateLimitError" in response["error"]
+
+
+def test_rate_limiter():
+    """Test requests beyond the burst capacity wait for the bucket to refill."""
+
+    async def acquire_all(rate_limiter, n):
+        for _ in range(n):
+            await rate_limiter.acquire(n_tokens=1)
+
+    # 100 requests per second, so 150 requests take at least half a second
+    rate_limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=10**9)
+    start = time.monotonic()
+    asyncio.run(acquire_all(rate_limiter, 150))
+    assert time.monotonic() - start >= 0.45
+
+
+def test_stream_responses(get_client):
+    """Test every record is labelled with bounded concurrency, in any order, and
+    gathered back in order."""
+    client = get_client(delay=0.01)
+    new_examples = [f'{{"id": {i}}}' for i in range(20)]
+
+    async def collect():
+        return [
+            result
+            async for result in stream_responses(
+                "examples",
+                iter(new_examples),
+                client=client,
+                max_concurrency=4,
+                requests_per_minute=10**6,
+                tokens_per_minute=10**9,
+            )
+        ]
+
+    results = asyncio.run(collect())
+    assert sorted(i for i, _ in results) == list(range(20))
+    assert client.chat.completions.max_in_flight == 4
+    for i, response in results:
+        assert new_examples[i] in response["open_labelled_records"]
+
+
+def test_gather_responses_order(get_client, monkeypatch):
+    """Test gather_responses returns responses in the order of the records."""
+    client = get_client()
+    monkeypatch.setattr(
+        "src.utils.async_call_openai.get_openai_client", lambda open_api_key: client
+    )
+    responses = asyncio.run(
+        gather_responses(
+            "examples",
+            '[{"id": 1}, {"id": 2, "feedback": "Broken {link}, help"}, {"id": 3}]',
+            "key",
+            cache_path=None,
+            tokens_per_minute=10**9,
+        )
+    )
+    assert ['"id": 2' in r["open_labelled_records"] for r in responses] == [
+        False,
+        True,
+        False,
+    ]
+
+
+def test_iter_packs():
+    """Test packs are filled up to the token budget and record limit, and a record over
+    the budget gets its own pack."""
+    examples = enumerate(["a" * 10, "b" * 10, "c" * 50, "d" * 10, "e" * 10, "f" * 10])
+    packs = iter_packs(
+        examples,
+        fixed_tokens=20,
+        count_tokens=len,
+        max_prompt_tokens=50,
+        max_records=2,
+    )
+    assert [[i for i, _ in pack] for pack in packs] == [[0, 1], [2], [3, 4], [5]]
+
+
+def test_validate_packed_labels():
+    """Test only records with a known id, labels and a valid urgency are kept."""
+    content = json.dumps(
+        {
+            "records": [
+                {"id": "1", "labels": ["Tax"], "urgency": 2},
+                {"id": "x", "labels": ["Tax"], "urgency": 2},
+                {"id": "b", "labels": [], "urgency": 1},
+                {"id": "c", "labels": ["Spam"], "urgency": 4},
+                {"id": "1", "labels": ["Duplicate"], "urgency": 1},
+            ]
+        }
+    )
+    assert validate_packed_labels(content, [1, "b", "c"]) == {
+        0: json.dumps({"id": 1, "labels": ["Tax"], "urgency": 2})
+    }
+    assert validate_packed_labels("not json", [1]) == {}
+    assert validate_packed_labels('{"id": 1}', [1]) == {}
+
+
+def test_create_packed_labelled_data(get_client):
+    """Test a packed response is split into records, and records it missed are labelled
+    on their own."""
+    new_examples = [f'{{"id": "{i}", "feedback": "text {i}"}}' for i in range(3)]
+    packed_content = json.dumps(
+        {
+            "records": [
+                {"id": "0", "labels": ["Tax"], "urgency": 1},
+                {"id": "2", "labels": ["Passports"], "urgency": 3},
+            ]
+        }
+    )
+    client = get_client(contents=[packed_content])
+    responses = asyncio.run(
+        create_packed_labelled_data("examples", new_examples, client=client)
+    )
+    assert client.chat.completions.n_calls == 2
+    assert json.loads(responses[2]["open_labelled_records"])["labels"] == ["Passports"]
+    assert new_examples[1] in responses[1]["open_labelled_records"]
+    # The packed request's tokens are shared between its records
+    assert [response["prompt_tokens"] for response in responses] == [4, 13, 3]
+
+
+def test_stream_responses_packed(get_client):
+    """Test packed records are sent together and each record's response is yielded."""
+    new_examples = [f'{{"id": "{i}", "feedback": "text"}}' for i in range(4)]
+    packed_content = json.dumps(
+        {"records": [{"id": str(i), "labels": ["Tax"], "urgency": 1} for i in range(4)]}
+    )
+    client = get_client(contents=[packed_content])
+
+    async def collect():
+        return [
+            result
+            async for result in stream_responses(
+                "examples",
+                new_examples,
+                client=client,
+                tokens_per_minute=10**9,
+                pack_records=True,
+                count_tokens=len,
+            )
+        ]
+
+    results = asyncio.run(collect())
+    assert client.chat.completions.n_calls == 1
+    assert sorted(
+        (i, json.loads(response["open_labelled_records"])["id"])
+        for i, response in results
+    ) == [(i, str(i)) for i in range(4)]
+
+
+def test_gather_responses_dedup(get_client, monkeypatch, tmp_path):
+    """Test feedback repeated across records is labelled once, and feedback labelled by
+    an earlier run is read from the cache."""
+    client = get_client(
+        contents=[
+            json.dumps({"id": "a", "labels": ["Spam"], "urgency": 1}),
+            json.dumps({"id": "b", "labels": ["Tax"], "urgency": 2}),
+        ]
+    )
+    monkeypatch.setattr(
+        "src.utils.async_call_openai.get_openai_client", lambda open_api_key: client
+    )
+    new_subs_json = json.dumps(
+        [
+            {"id": "a", "feedback": "Test"},
+            {"id": "b", "feedback": "My tax code is wrong"},
+            {"id": "c", "feedback": "test!"},
+        ]
+    )
+    kwargs = dict(
+        cache_path=str(tmp_path / "label_cache.sqlite3"),
+        max_concurrency=1,
+        tokens_per_minute=10**9,
+    )
+    responses = asyncio.run(
+        gather_responses("examples", new_subs_json, "key", **kwargs)
+    )
+    assert client.chat.completions.n_calls == 2
+    assert json.loads(responses[2]["open_labelled_records"]) == {
+        "id": "c",
+        "labels": ["Spam"],
+        "urgency": 1,
+    }
+    assert responses[2]["prompt_tokens"] == 0
+
+    responses = asyncio.run(
+        gather_responses("examples", new_subs_json, "key", **kwargs)
+    )
+    assert client.chat.completions.n_calls == 2
+    assert json.loads(responses[1]["open_labelled_records"])["labels"] == ["Tax"]
+
+
+def test_label_jsonl(get_client, monkeypatch, tmp_path):
+    """Test records are streamed from one JSON Lines file and their responses written
+    to another, in chunks."""
+    client = get_client()
+    monkeypatch.setattr(
+        "src.utils.async_call_openai.get_openai_client", lambda open_api_key: client
+    )
+    input_path = str(tmp_path / "records.jsonl")
+    output_path = str(tmp_path / "responses.jsonl")
+    write_jsonl(
+        ({"id": f"r{i}", "feedback": f"feedback {i}}},"} for i in range(25)), input_path
+    )
+    n_responses = asyncio.run(
+        label_jsonl(
+            "examples",
+            input_path,
+            output_path,
+            "key",
+            cache_path=None,
+            chunk_size=10,
+            tokens_per_minute=10**9,
+        )
+    )
+    assert n_responses == 25
+    responses = sorted(read_jsonl(output_path), key=lambda response: response["index"])
+    assert [response["id"] for response in responses] == [f"r{i}" for i in range(25)]
+    assert '"feedback 7},"' in responses[7]["open_labelled_records"]
@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+from openai import OpenAI
+
+from src.utils.batch_call_openai import (
+    parse_batch_output,
+    run_batch_labelling,
+    submit_batch,
+    write_batch_requests,
+)
+from src.utils.openai_stub_server import start_stub_server
+
+
+# Mock data to use across tests
+@pytest.fixture
+def new_examples():
+    return [json.dumps({"id": i, "response_value": f"feedback {i}"}) for i in range(5)]
+
+
+@pytest.fixture
+def stub_server():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_write_batch_requests(new_examples, tmp_path):
+    """Test requests are split across files and numbered by record position."""
+    paths = write_batch_requests(
+        "examples", new_examples, batch_dir=str(tmp_path), max_requests=2
+    )
+    assert [os.path.basename(path) for path in paths] == [
+        "batch_requests_000.jsonl",
+        "batch_requests_001.jsonl",
+        "batch_requests_002.jsonl",
+    ]
+    with open(paths[1]) as f:
+        requests = [json.loads(line) for line in f]
+    assert [request["custom_id"] for request in requests] == ["record-2", "record-3"]
+    assert requests[0]["url"] == "/v1/chat/completions"
+    assert new_examples[2] in requests[0]["body"]["messages"][-1]["content"]
+
+
+def test_parse_batch_output():
+    """Test successful and failed results are parsed into labelling responses."""
+    lines = [
+        json.dumps(
+            {
+                "custom_id": "record-0",
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{"message": {"content": '{"id": 0}'}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+                    },
+                },
+                "error": None,
+            }
+        ),
+        json.dumps(
+            {
+                "custom_id": "record-1",
+                "response": None,
+                "error": {"code": "server_error", "message": "Failed"},
+            }
+        ),
+    ]
+    success, failure = parse_batch_output(lines)
+    assert success == {
+        "custom_id": "record-0",
+        "open_labelled_records": '{"id": 0}',
+        "prompt_tokens": 10,
+        "completion_tokens": 5,
+        "error": None,
+    }
+    assert failure["open_labelled_records"] is None
+    assert "server_error" in failure["error"]
+
+
+def test_run_batch_labelling(new_examples, stub_server, tmp_path):
+    """Test records are labelled through the stub server, and an input file that was
+    already submitted is not submitted again."""
+    client = OpenAI(api_key="test", base_url=stub_server.base_url)
+    responses = list(
+        run_batch_labelling(
+            "examples",
+            new_examples,
+            client=client,
+            batch_dir=str(tmp_path),
+            poll_interval=0.01,
+        )
+    )
+    assert len(responses) == 5
+    for response in responses:
+        i = int(response["custom_id"].removeprefix("record-"))
+        assert json.loads(response["open_labelled_records"])["id"] == str(i)
+        assert response["error"] is None
+    assert len(stub_server.batches) == 1
+
+    path = os.path.join(tmp_path, "batch_requests_000.jsonl")
+    assert submit_batch(client, path) in stub_server.batches
+    assert len(stub_server.batches) == 1
+
+
+@pytest.mark.parametrize("status", ["failed", "expired", "cancelled"])
+def test_submit_batch_resubmits(new_examples, stub_server, tmp_path, status):
+    """Test an input file is submitted again when its batch didn't complete."""
+    client = OpenAI(api_key="test", base_url=stub_server.base_url)
+    path = write_batch_requests("examples", new_examples, batch_dir=str(tmp_path))[0]
+    batch_id = submit_batch(client, path)
+    assert submit_batch(client, path) == batch_id
+
+    stub_server.batches[batch_id]["status"] = status
+    new_batch_id = submit_batch(client, path)
+    assert new_batch_id != batch_id
+    assert submit_batch(client, path) == new_batch_id
+    assert len(stub_server.batches) == 2
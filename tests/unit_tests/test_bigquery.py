@@ -0,0 +1,153 @@
+import datetime
+import json
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.sql_queries import query_labelled_feedback
+from src.utils.bigquery import (
+    get_cache_path,
+    get_latest_cache_path,
+    query_bigquery,
+    read_cached_result,
+    write_cached_result,
+    write_to_bigquery,
+)
+from src.utils.query_backends import get_source_tables
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_table():
+    table = pa.Table.from_pylist(
+        [
+            {"id": "1", "created": datetime.date(2024, 1, 1), "labels": ["tax"]},
+            {"id": "2", "created": datetime.date(2024, 1, 2), "labels": []},
+        ]
+    )
+    return table
+
+
+def test_get_source_tables():
+    """Test that the tables following FROM and JOIN are found."""
+    query = query_labelled_feedback.replace(
+        "@LABELLED_FEEDBACK_TABLE", "project.dataset.labels"
+    ).replace("@PUBLISHING_VIEW", "`project.dataset.view`")
+    assert get_source_tables(query) == [
+        "project.dataset.labels",
+        "project.dataset.view",
+    ]
+
+
+def test_cache_path_changes_with_last_modified(tmp_path):
+    """Test that the cache key depends on both the query and the table versions."""
+    path = get_cache_path(str(tmp_path), "SELECT 1", "2024-01-01")
+    assert path == get_cache_path(str(tmp_path), "SELECT  1\n", "2024-01-01")
+    assert path != get_cache_path(str(tmp_path), "SELECT 1", "2024-01-02")
+    assert path != get_cache_path(str(tmp_path), "SELECT 2", "2024-01-01")
+
+
+def test_write_cached_result_replaces_old_versions(tmp_path, get_table):
+    """Test that only the latest version of a cached query is kept."""
+    old_path = get_cache_path(str(tmp_path), "SELECT 1", "2024-01-01")
+    new_path = get_cache_path(str(tmp_path), "SELECT 1", "2024-01-02")
+    write_cached_result(old_path, get_table)
+    write_cached_result(new_path, get_table)
+    assert get_latest_cache_path(str(tmp_path), "SELECT 1") == new_path
+    assert len(list(tmp_path.iterdir())) == 1
+    assert read_cached_result(new_path).to_pylist() == get_table.to_pylist()
+
+
+def test_query_bigquery_offline(tmp_path, monkeypatch, get_table):
+    """Test that offline queries are served from the cache without a client."""
+    monkeypatch.setenv("BIGQUERY_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("BIGQUERY_OFFLINE", "true")
+    with pytest.raises(FileNotFoundError):
+        query_bigquery("project", "SELECT 1")
+
+    write_cached_result(get_cache_path(str(tmp_path), "SELECT 1", ""), get_table)
+    assert query_bigquery("project", "SELECT 1") == get_table.to_pylist()
+    rows = query_bigquery("project", "SELECT 1", write_to_dict=False)
+    assert [row.values()[0] for row in rows] == ["1", "2"]
+
+
+def test_query_bigquery_cache_write_fails(tmp_path, monkeypatch, get_table):
+    """Test the query result is returned when it can't be cached."""
+    monkeypatch.setenv("BIGQUERY_CACHE_DIR", str(tmp_path))
+    backend = SimpleNamespace(
+        get_tables_last_modified=lambda tables: "2024-01-01",
+        query=lambda query: get_table,
+    )
+    monkeypatch.setattr(
+        "src.utils.bigquery.get_query_backend", lambda project_id: backend
+    )
+
+    def write_cached_result(cache_path, result):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr("src.utils.bigquery.write_cached_result", write_cached_result)
+    assert query_bigquery("project", "SELECT 1") == get_table.to_pylist()
+
+
+def get_response(content):
+    return {
+        "open_labelled_records": content,
+        "prompt_tokens": 10,
+        "completion_tokens": 5,
+        "error": None,
+    }
+
+
+def test_write_to_bigquery(tmp_path, monkeypatch):
+    """Test valid responses are written in chunks, and invalid ones dead lettered."""
+    monkeypatch.setenv("QUERY_BACKEND", "duckdb")
+    monkeypatch.setenv("DUCKDB_DATA_DIR", str(tmp_path))
+    responses = [
+        get_response(json.dumps({"id": "a", "labels": ["Tax"], "urgency": 1})),
+        get_response("not json"),
+        get_response(json.dumps({"id": "b", "labels": ["Spam"], "urgency": "high"})),
+        get_response(json.dumps({"id": "c", "labels": [], "urgency": 2})),
+        get_response(json.dumps({"id": "d", "labels": ["Login"], "urgency": 3})),
+    ]
+    dead_letter_path = str(tmp_path / "dead_letter.jsonl")
+    dead_letters = write_to_bigquery(
+        "project.dataset.labels",
+        iter(responses),
+        "project",
+        chunk_size=2,
+        dead_letter_path=dead_letter_path,
+    )
+    table = pq.read_table(tmp_path / "labels.parquet")
+    assert table["id"].to_pylist() == ["a", "c", "d"]
+    assert [dead_letter["response"] for dead_letter in dead_letters] == [
+        responses[1],
+        responses[2],
+    ]
+    with open(dead_letter_path) as f:
+        assert "urgency 'high'" in f.readlines()[1]
+
+
+def test_write_to_bigquery_row_errors(tmp_path, monkeypatch):
+    """Test rows rejected by BigQuery are dead lettered and the rest are written."""
+
+    class Backend:
+        def insert_rows(self, table_id, rows, schema):
+            return [{"index": 1, "errors": [{"reason": "invalid"}]}]
+
+    monkeypatch.setattr(
+        "src.utils.bigquery.get_query_backend", lambda project_id: Backend()
+    )
+    responses = [
+        get_response(json.dumps({"id": i, "labels": ["Tax"], "urgency": 1}))
+        for i in range(3)
+    ]
+    dead_letters = write_to_bigquery(
+        "project.dataset.labels",
+        responses,
+        "project",
+        dead_letter_path=str(tmp_path / "dead_letter.jsonl"),
+    )
+    assert [dead_letter["response"] for dead_letter in dead_letters] == [responses[1]]
+    assert "invalid" in dead_letters[0]["error"]
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct
+
+# evaluate_collection imports the encoder model loader
+pytest.importorskip("sentence_transformers")
+
+from src.collection_utils.evaluate_collection import (  # noqa: E402
+    calculate_f2_score,
+    calculate_precision,
+    calculate_ranking_metrics,
+    calculate_recall,
+    process_labels,
+    sweep_thresholds,
+)
+from src.collection_utils.set_collection import create_collection  # noqa: E402
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_search_results():
+    rng = np.random.default_rng(0)
+    ids = [str(i) for i in range(200)]
+    scores = rng.random(200)
+    relevant_records = [str(i) for i in rng.choice(400, size=50, replace=False)]
+    return ids, scores, relevant_records
+
+
+def test_sweep_thresholds(get_search_results):
+    """Test the single pass sweep matches searching again at each threshold."""
+    ids, scores, relevant_records = get_search_results
+    thresholds = np.arange(0, 1.1, 0.1)
+    is_relevant = np.isin(ids, relevant_records)
+
+    precision, recall, f2_score = sweep_thresholds(
+        scores, is_relevant, len(relevant_records), thresholds
+    )
+
+    for threshold in thresholds:
+        result_ids = [i for i, score in zip(ids, scores) if score >= threshold]
+        expected_precision = calculate_precision(result_ids, relevant_records)
+        expected_recall = calculate_recall(result_ids, relevant_records)
+        assert precision[threshold] == pytest.approx(expected_precision)
+        assert recall[threshold] == pytest.approx(expected_recall)
+        assert f2_score[threshold] == pytest.approx(
+            calculate_f2_score(expected_precision, expected_recall)
+        )
+
+
+def test_process_labels_order():
+    """Test results are in label order however many workers run the searches."""
+    rng = np.random.default_rng(0)
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=8, distance_metric=Distance.COSINE)
+    client.upsert(
+        "test",
+        [
+            PointStruct(id=i, vector=vector.tolist())
+            for i, vector in enumerate(rng.standard_normal((100, 8)))
+        ],
+    )
+    unique_labels = [f"label {i}" for i in range(10)]
+    query_embeddings = rng.standard_normal((10, 8))
+    regex_ids = {label: [str(i), str(i + 10)] for i, label in enumerate(unique_labels)}
+
+    class Model:
+        def encode(self, labels, batch_size=32):
+            return query_embeddings
+
+    serial = process_labels(
+        unique_labels,
+        regex_ids,
+        Model(),
+        client,
+        "test",
+        search_batch_size=3,
+        n_workers=1,
+    )
+    progress = []
+    parallel = process_labels(
+        unique_labels,
+        regex_ids,
+        Model(),
+        client,
+        "test",
+        search_batch_size=1,
+        n_workers=4,
+        progress_callback=lambda n_done, n_total: progress.append((n_done, n_total)),
+    )
+    assert [list(values) for values in parallel[0]] == [
+        [label] for label in unique_labels
+    ]
+    assert serial == parallel
+    assert progress == [(n_done, 10) for n_done in range(1, 11)]
+
+
+def test_calculate_ranking_metrics():
+    """Test ranking metrics against values worked by hand."""
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    # Ranked by score: relevant, not relevant, relevant, not relevant
+    is_relevant = np.array([False, True, True, False])
+    metrics = calculate_ranking_metrics(scores, is_relevant, n_relevant=3, ks=(1, 3))
+    assert metrics["recall@1"] == pytest.approx(1 / 3)
+    assert metrics["recall@3"] == pytest.approx(2 / 3)
+    assert metrics["ndcg@1"] == pytest.approx(1.0)
+    assert metrics["ndcg@3"] == pytest.approx(
+        (1 + 1 / np.log2(4)) / (1 + 1 / np.log2(3) + 1 / np.log2(4))
+    )
+    assert metrics["average_precision"] == pytest.approx((1 + 2 / 3) / 3)
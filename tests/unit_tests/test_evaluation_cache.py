@@ -0,0 +1,84 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct
+
+from src.collection_utils.evaluation_cache import (
+    get_collection_version,
+    process_labels_with_cache,
+)
+from src.collection_utils.set_collection import create_collection
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_compute():
+    computed_labels = []
+
+    def compute(labels):
+        computed_labels.extend(labels)
+        return (
+            [{label: {0.0: 0.5, 0.5: 1.0}} for label in labels],
+            [{label: {0.0: 1.0, 0.5: 0.5}} for label in labels],
+            [{label: {0.0: 0.8, 0.5: 0.5}} for label in labels],
+        )
+
+    return compute, computed_labels
+
+
+def test_process_labels_with_cache(get_compute, tmp_path):
+    """Test only new labels, labels with changed ids and new contexts are computed."""
+    compute, computed_labels = get_compute
+    path = str(tmp_path / "cache.parquet")
+    context = {"collection_version": "1", "search": "a"}
+    regex_ids = {"a": ["1"], "b": ["2"]}
+
+    first = process_labels_with_cache(["a", "b"], regex_ids, context, compute, path)
+    assert computed_labels == ["a", "b"]
+
+    regex_ids = {"a": ["1"], "b": ["2", "3"], "c": []}
+    second = process_labels_with_cache(
+        ["a", "b", "c"], regex_ids, context, compute, path
+    )
+    assert computed_labels == ["a", "b", "b", "c"]
+    assert second[0][0] == first[0][0]
+
+    # Another context on the same collection is computed, and the first is kept
+    other_context = {"collection_version": "1", "search": "b"}
+    process_labels_with_cache(["a"], regex_ids, other_context, compute, path)
+    process_labels_with_cache(["a", "b", "c"], regex_ids, context, compute, path)
+    assert computed_labels == ["a", "b", "b", "c", "a"]
+
+
+def test_get_collection_version():
+    """Test the version changes when the collection is rebuilt with other data."""
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=2, distance_metric=Distance.COSINE)
+    client.upsert("test", [PointStruct(id=1, vector=[1.0, 0.0])])
+    version = get_collection_version(client, "test")
+    assert get_collection_version(client, "test") == version
+
+    create_collection(client, "test", size=2, distance_metric=Distance.COSINE)
+    client.upsert("test", [PointStruct(id=1, vector=[0.0, 1.0])])
+    assert get_collection_version(client, "test") != version
+
+
+def test_get_collection_version_every_point():
+    """Test the version changes when any point changes, beyond the first chunk."""
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=2, distance_metric=Distance.COSINE)
+    points = [
+        PointStruct(id=i, vector=[1.0, float(i)], payload={"labels": ["a"]})
+        for i in range(10)
+    ]
+    client.upsert("test", points)
+    version = get_collection_version(client, "test", chunk_size=3)
+    assert get_collection_version(client, "test", chunk_size=4) == version
+
+    client.upsert(
+        "test", [PointStruct(id=9, vector=[1.0, 0.5], payload={"labels": ["a"]})]
+    )
+    vector_version = get_collection_version(client, "test", chunk_size=3)
+    assert vector_version != version
+
+    client.set_payload("test", {"labels": ["b"]}, points=[8])
+    assert get_collection_version(client, "test", chunk_size=3) != vector_version
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+from src.collection_utils.evaluation_job import (
+    is_running,
+    read_progress,
+    write_progress,
+)
+
+
+def test_progress_round_trip(tmp_path):
+    """Test progress is written and read, and a missing file means no job."""
+    path = str(tmp_path / "progress.json")
+    assert read_progress(path) is None
+
+    write_progress("running", 5, 10, "Evaluating labels", path=path)
+    progress = read_progress(path)
+    assert progress["n_done"] == 5
+    assert progress["n_total"] == 10
+    assert is_running(progress)
+
+    write_progress("done", path=path)
+    assert not is_running(read_progress(path))
+
+
+def test_is_running_exited_job(tmp_path):
+    """Test a job whose process exited without finishing is not running."""
+    path = str(tmp_path / "progress.json")
+    job = subprocess.Popen([sys.executable, "-c", "pass"])
+    job.wait()
+    write_progress("running", path=path, pid=job.pid)
+    assert not is_running(read_progress(path))
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.collection_utils.evaluation_results import (
+    flatten_values,
+    get_box_stats,
+    get_boxplot_data,
+    get_line_data,
+    plot_data_is_current,
+    read_label_matches,
+    read_plot_data,
+    read_table,
+    write_label_matches,
+    write_plot_data,
+    write_results,
+)
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_values():
+    thresholds = np.arange(0, 1.1, 0.1)
+    precision_values = [
+        {"a": {threshold: 0.5 for threshold in thresholds}},
+        {"b": {threshold: 1.0 for threshold in thresholds}},
+        {"c": {threshold: None for threshold in thresholds}},
+    ]
+    recall_values = [
+        {label: {threshold: threshold for threshold in thresholds}}
+        for label in ["a", "b", "c"]
+    ]
+    return precision_values, recall_values
+
+
+def test_results_round_trip(get_values, tmp_path):
+    """Test results are written to and read from Parquet, and grouped by threshold."""
+    precision_values, recall_values = get_values
+    path = str(tmp_path / "results.parquet")
+    write_results(precision_values, recall_values, recall_values, path=path)
+
+    table = read_table(path)
+    assert table.num_rows == 33
+    assert table["precision"].null_count == 11
+
+    thresholds = table["threshold"].to_numpy()
+    precision = table["precision"].to_numpy(zero_copy_only=False)
+    assert get_line_data(thresholds, precision)[0.3] == 0.75
+    boxplot_data = get_boxplot_data(thresholds, precision)
+    assert list(boxplot_data) == [round(t, 2) for t in np.arange(0, 1.1, 0.1)]
+    assert boxplot_data[0.3][:2] == [0.5, 1.0]
+
+    _, _, values = flatten_values(recall_values)
+    assert np.allclose(table["recall"].to_numpy(), values)
+
+
+def test_read_table_schema_version(tmp_path):
+    """Test files without the current schema version are rejected."""
+    path = str(tmp_path / "old.parquet")
+    pq.write_table(pa.table({"label": ["a"]}), path)
+    with pytest.raises(ValueError):
+        read_table(path)
+
+
+def test_label_matches_round_trip(tmp_path):
+    """Test unique labels and regex ids are written and read in order."""
+    labels_path = str(tmp_path / "labels.parquet")
+    matches_path = str(tmp_path / "label_matches.parquet")
+    regex_ids = {"b": ["3", "1"], "a": [], "c": ["2"]}
+    regex_counts = {
+        label: {"label": label, "n_matches": len(ids)}
+        for label, ids in regex_ids.items()
+    }
+    write_label_matches(
+        ["b", "a", "c"], regex_ids, regex_counts, labels_path, matches_path
+    )
+    assert read_label_matches(labels_path, matches_path) == (["b", "a", "c"], regex_ids)
+
+
+def test_get_box_stats():
+    """Test box plot statistics, with whiskers stopping at the last value in range."""
+    thresholds = np.array([0.5] * 6 + [0.6])
+    values = np.array([0.0, 0.4, 0.45, 0.5, 0.55, np.nan, np.nan])
+    box_stats = get_box_stats(thresholds, values)
+    assert list(box_stats) == [0.5]
+    assert box_stats[0.5]["median"] == 0.45
+    assert box_stats[0.5]["q1"] == 0.4
+    # 0.0 is more than 1.5 times the interquartile range below q1
+    assert box_stats[0.5]["lowerfence"] == 0.4
+    assert box_stats[0.5]["upperfence"] == 0.55
+    assert box_stats[0.5]["mean"] == pytest.approx(0.38)
+
+
+def test_plot_data_round_trip(get_values, tmp_path):
+    """Test plot data is precomputed from the results and goes stale with them."""
+    precision_values, recall_values = get_values
+    results_path = str(tmp_path / "results.parquet")
+    path = str(tmp_path / "plot_data.json")
+    write_results(precision_values, recall_values, recall_values, path=results_path)
+    assert not plot_data_is_current(results_path, path)
+
+    write_plot_data(results_path, path)
+    assert plot_data_is_current(results_path, path)
+    plot_data = read_plot_data(path)
+    assert plot_data["thresholds"] == [round(t, 2) for t in np.arange(0, 1.1, 0.1)]
+    assert plot_data["line"]["precision"][3] == 0.75
+    assert plot_data["box"]["precision"][3]["median"] == 0.75
+
+    write_results(precision_values, recall_values, recall_values, path=results_path)
+    os.utime(results_path, (0, 0))
+    assert not plot_data_is_current(results_path, path)
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct
+
+# exact_search imports evaluate_collection, which imports the encoder model loader
+pytest.importorskip("sentence_transformers")
+
+from src.collection_utils.evaluate_collection import (  # noqa: E402
+    process_labels,
+    process_ranking_metrics,
+)
+from src.collection_utils.exact_search import (  # noqa: E402
+    calculate_ann_divergence,
+    calculate_ann_recall_at_k,
+    exact_process_labels,
+    exact_ranking_metrics,
+    get_collection_vectors,
+)
+from src.collection_utils.query_collection import (  # noqa: E402
+    get_semantically_similar_results_batch,
+)
+from src.collection_utils.set_collection import create_collection  # noqa: E402
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_client():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 8))
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=8, distance_metric=Distance.COSINE)
+    client.upsert(
+        "test",
+        [PointStruct(id=i, vector=vector.tolist()) for i, vector in enumerate(vectors)],
+    )
+    return client
+
+
+@pytest.fixture
+def get_labels():
+    rng = np.random.default_rng(1)
+    unique_labels = ["a", "b", "c"]
+    query_embeddings = rng.standard_normal((3, 8))
+    regex_ids = {
+        label: [str(i) for i in rng.choice(200, size=20, replace=False)]
+        for label in unique_labels
+    }
+    return unique_labels, query_embeddings, regex_ids
+
+
+def test_exact_process_labels(get_client, get_labels, tmp_path):
+    """Test exact search metrics match searching the collection, and the vectors are
+    loaded from the cache on the second call."""
+    unique_labels, query_embeddings, regex_ids = get_labels
+
+    class Model:
+        def encode(self, labels, batch_size=32):
+            return query_embeddings
+
+    ids, vectors = get_collection_vectors(get_client, "test", str(tmp_path))
+    assert vectors.shape == (200, 8)
+    ids, vectors = get_collection_vectors(get_client, "test", str(tmp_path))
+    assert isinstance(vectors, np.memmap)
+
+    # Re-embedding the collection with the same point count invalidates the cache
+    get_client.upsert("test", [PointStruct(id=0, vector=[1.0] + [0.0] * 7)])
+    ids, vectors = get_collection_vectors(get_client, "test", str(tmp_path))
+    assert vectors[list(ids).index("0")].tolist() == [1.0] + [0.0] * 7
+
+    exact_values = exact_process_labels(
+        unique_labels, regex_ids, query_embeddings, ids, vectors
+    )
+    search_values = process_labels(
+        unique_labels, regex_ids, Model(), get_client, "test"
+    )
+    for exact_metric, search_metric in zip(exact_values, search_values):
+        for exact_label, search_label in zip(exact_metric, search_metric):
+            for label, values in exact_label.items():
+                for threshold, value in values.items():
+                    assert value == pytest.approx(search_label[label][threshold])
+
+    ann_results = get_semantically_similar_results_batch(
+        get_client, "test", query_embeddings, score_threshold=0.0
+    )
+    divergence = calculate_ann_divergence(ann_results, query_embeddings, ids, vectors)
+    assert all(
+        value["ann_recall"] == pytest.approx(1.0) for value in divergence.values()
+    )
+
+
+def test_exact_ranking_metrics(get_client, get_labels, tmp_path):
+    """Test exact ranking metrics match ranking by searching the collection."""
+    unique_labels, query_embeddings, regex_ids = get_labels
+
+    class Model:
+        def encode(self, labels, batch_size=32):
+            return query_embeddings
+
+    ids, vectors = get_collection_vectors(get_client, "test", str(tmp_path))
+    exact_values = exact_ranking_metrics(
+        unique_labels, regex_ids, query_embeddings, ids, vectors
+    )
+    search_values = process_ranking_metrics(
+        unique_labels, regex_ids, Model(), get_client, "test"
+    )
+    for exact_label, search_label in zip(exact_values, search_values):
+        for label, values in exact_label.items():
+            for metric, value in values.items():
+                assert value == pytest.approx(search_label[label][metric])
+
+    ann_results = get_semantically_similar_results_batch(
+        get_client, "test", query_embeddings, score_threshold=None
+    )
+    ann_recall = calculate_ann_recall_at_k(ann_results, query_embeddings, ids, vectors)
+    assert all(value == pytest.approx(1.0) for value in ann_recall.values())
+
+
+def test_calculate_ann_recall_at_k_empty():
+    """Test an empty collection has no ANN recall@k rather than raising."""
+    query_embeddings = np.ones((2, 4), dtype=np.float32)
+    ids = np.array([], dtype=str)
+    vectors = np.zeros((0, 4), dtype=np.float32)
+    assert calculate_ann_recall_at_k([[], []], query_embeddings, ids, vectors) == {}
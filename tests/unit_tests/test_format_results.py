@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+from src.collection_utils.format_results import format_search_results
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_results():
+    def payload(record_id, created, urgency):
+        return {
+            "feedback_record_id": record_id,
+            "created": created,
+            "feedback": f"feedback {record_id}",
+            "url": "/vat-rates",
+            "page_title": "VAT rates",
+            "urgency": urgency,
+            "feedback_type": "problem_report",
+            "primary_department": "HMRC",
+            "document_type": "answer",
+        }
+
+    results = [
+        {"id": 1, "score": 0.6, "payload": payload("1", "2024-01-10", 3)},
+        {"id": 2, "score": 0.9, "payload": payload("2", "2024-01-05", -1)},
+        {"id": 3, "score": 0.9, "payload": payload("3", "2024-01-20", 1)},
+        {"id": 4, "score": 0.4, "payload": payload("4", "2024-01-10", 2)},
+        {"id": 5, "score": 0.8, "payload": payload("5", "2023-12-01", 2)},
+    ]
+    return results
+
+
+def test_format_search_results(get_results):
+    """Test that results are filtered, renamed and sorted by score then date."""
+    formatted = format_search_results(
+        get_results,
+        similarity_threshold=0.5,
+        start_date=datetime.date(2024, 1, 1),
+        end_date=datetime.date(2024, 1, 31),
+    )
+    assert [result["Feedback comment"] for result in formatted] == [
+        "feedback 3",
+        "feedback 2",
+        "feedback 1",
+    ]
+    assert [result["Urgency"] for result in formatted] == ["Low", "Unknown", "High"]
+    assert formatted[0]["created_date"] == datetime.date(2024, 1, 20)
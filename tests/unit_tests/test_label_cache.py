@@ -0,0 +1,38 @@
+from src.utils.label_cache import (
+    get_text_key,
+    normalise_feedback,
+    open_label_cache,
+    read_cached_labels,
+    write_cached_labels,
+)
+
+
+def test_normalise_feedback():
+    """Test case, punctuation and whitespace differences are ignored."""
+    assert normalise_feedback("  No!! ") == normalise_feedback("no")
+    assert normalise_feedback("Useless\n\nsite.") == "useless site"
+    assert normalise_feedback("...") == ""
+
+
+def test_get_text_key():
+    """Test keys depend on the normalised text and prompt version."""
+    assert get_text_key("No.", "v1") == get_text_key("no", "v1")
+    assert get_text_key("no", "v1") != get_text_key("no", "v2")
+    assert get_text_key("no", "v1") != get_text_key("yes", "v1")
+    assert get_text_key("?!", "v1") is None
+
+
+def test_cached_labels(tmp_path):
+    """Test labels are read back from the cache, across connections."""
+    path = str(tmp_path / "label_cache.sqlite3")
+    connection = open_label_cache(path)
+    keys = [get_text_key(f"feedback {i}", "v1") for i in range(600)]
+    for i, key in enumerate(keys):
+        write_cached_labels(connection, key, "v1", f"feedback {i}", ["Tax"], i % 3 + 1)
+    connection.close()
+
+    connection = open_label_cache(path)
+    cached = read_cached_labels(connection, [*keys, get_text_key("other", "v1")])
+    connection.close()
+    assert len(cached) == 600
+    assert cached[keys[4]] == (["Tax"], 2)
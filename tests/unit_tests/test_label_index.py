@@ -0,0 +1,36 @@
+import pytest
+
+from src.collection_utils.label_index import AhoCorasick, get_label_matches
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_data():
+    data = [
+        {"id": "1", "labels": "[Application, payment]"},
+        {"id": "2", "labels": "[c++, apply]"},
+        {"id": "3", "labels": "[app, application error]"},
+        {"id": "4", "labels": "[tax (credit), pay]"},
+    ]
+    return data
+
+
+def test_aho_corasick():
+    """Test overlapping and nested patterns are all found."""
+    automaton = AhoCorasick(["he", "she", "his", "hers", "xyz"])
+    assert automaton.find_all("ushers") == {0, 1, 3}
+
+
+def test_get_label_matches(get_data):
+    """Test labels match as literal, case-insensitive substrings, in record order."""
+    unique_labels = ["app", "application", "c++", "tax (credit)", "pay"]
+    regex_ids, regex_counts = get_label_matches(get_data, unique_labels)
+    assert regex_ids == {
+        "app": ["1", "2", "3"],
+        "application": ["1", "3"],
+        "c++": ["2"],
+        "tax (credit)": ["4"],
+        "pay": ["1", "4"],
+    }
+    assert regex_counts["app"] == {"label": "app", "n_matches": 4}
+    assert regex_counts["pay"] == {"label": "pay", "n_matches": 2}
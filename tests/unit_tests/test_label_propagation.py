@@ -0,0 +1,233 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from src.utils.async_call_openai import (
+    SYSTEM_PROMPT,
+    get_packed_user_prompt,
+    label_records,
+    stream_responses,
+)
+from src.utils.label_propagation import (
+    KnnLabeller,
+    evaluate_knn_labelling,
+    get_example_selector,
+    get_labelled_vectors,
+    get_prelabeller,
+    normalise_vectors,
+)
+
+
+# Mock data to use across tests
+@pytest.fixture
+def clusters():
+    """Two tight clusters labelled Tax and Benefits, and a spread of mixed labels"""
+    rng = np.random.default_rng(0)
+    centres = np.eye(8, dtype=np.float32)
+    vectors = np.concatenate(
+        [
+            centres[0] + 0.05 * rng.standard_normal((20, 8)),
+            centres[1] + 0.05 * rng.standard_normal((20, 8)),
+            rng.standard_normal((20, 8)),
+        ]
+    )
+    label_sets = (
+        [["Tax"]] * 20
+        + [["Benefits", "Universal Credit"]] * 20
+        + [[label] for label in rng.choice(["A", "B", "C", "D"], 20)]
+    )
+    urgency = np.array([1] * 20 + [3] * 20 + [2] * 20)
+    return normalise_vectors(vectors), label_sets, urgency
+
+
+@pytest.fixture
+def qdrant(clusters):
+    vectors, label_sets, urgency = clusters
+    client = QdrantClient(":memory:")
+    for name in ["feedback", "eval"]:
+        client.create_collection(
+            name, vectors_config=VectorParams(size=8, distance=Distance.COSINE)
+        )
+    client.upsert(
+        "eval",
+        [
+            PointStruct(
+                id=i,
+                vector=vectors[i].tolist(),
+                payload={
+                    "feedback": f"feedback {i}",
+                    "labels": label_sets[i],
+                    "urgency": int(urgency[i]),
+                },
+            )
+            for i in range(len(vectors))
+        ],
+    )
+    client.upsert(
+        "feedback",
+        [
+            PointStruct(id=100, vector=[1.0] + [0.0] * 7),
+            PointStruct(id=101, vector=[0.0] * 7 + [1.0]),
+        ],
+    )
+    return client
+
+
+def test_knn_labeller(clusters):
+    """Test records are labelled from agreeing neighbours, and left for the LLM when
+    their neighbours disagree or aren't similar."""
+    labeller = KnnLabeller(*clusters, k=5, min_agreement=0.8, min_similarity=0.5)
+    queries = normalise_vectors([[1.0] + [0.0] * 7, [0.0, 1.0] + [0.0] * 6])
+    predictions = labeller.predict(np.concatenate([queries, -queries]), chunk_size=3)
+    assert predictions["labels"][:2] == [["Tax"], ["Benefits", "Universal Credit"]]
+    assert predictions["urgency"][:2].tolist() == [1, 3]
+    assert predictions["confident"].tolist() == [True, True, False, False]
+
+
+def test_evaluate_knn_labelling(clusters):
+    """Test the holdout report counts the calls saved and the agreement lost."""
+    report = evaluate_knn_labelling(*clusters, holdout_fraction=0.5, k=5)
+    assert report["n_holdout"] == 30
+    assert 0 < report["n_propagated"] < 30
+    assert report["calls_saved"] == report["n_propagated"] / 30
+    assert report["label_agreement"] == 1.0
+    assert report["agreement_lost"] == 0.0
+
+
+def test_label_records_prelabel(qdrant):
+    """Test records labelled from their neighbours in the collection aren't sent to the
+    LLM."""
+    _, vectors, label_sets, urgency = get_labelled_vectors(qdrant, "eval")
+    assert len(label_sets) == 60
+    prelabel = get_prelabeller(
+        KnnLabeller(vectors, label_sets, urgency, k=5), qdrant, "feedback"
+    )
+
+    sent = []
+
+    async def create(messages, **kwargs):
+        prompt = messages[1]["content"].split("Here's the feedback you need to label:")
+        record, _ = json.JSONDecoder().raw_decode(prompt[1].strip())
+        sent.append(record["id"])
+        content = json.dumps({"id": sent[-1], "labels": ["Other"], "urgency": 2})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    records = [
+        {"id": "100", "feedback": "tax"},
+        {"id": "101", "feedback": "something else"},
+        {"id": "102", "feedback": "not in the collection"},
+    ]
+
+    async def _label():
+        return [
+            (i, response)
+            async for i, _, response in label_records(
+                "[]", records, client=client, cache_path=None, prelabel=prelabel
+            )
+        ]
+
+    responses = dict(asyncio.run(_label()))
+    assert sorted(sent) == ["101", "102"]
+    assert responses[0]["labelled_by"] == "knn"
+    assert json.loads(responses[0]["open_labelled_records"]) == {
+        "id": "100",
+        "labels": ["Tax"],
+        "urgency": 1,
+    }
+    assert json.loads(responses[2]["open_labelled_records"])["labels"] == ["Other"]
+
+
+def test_example_selector(qdrant):
+    """Test each request is sent the nearest labelled examples to its records, or all
+    of them for records without a vector."""
+    selector = get_example_selector(qdrant, "eval", "feedback", k=3)
+    prompts = []
+
+    async def create(messages, **kwargs):
+        prompts.append(messages[1]["content"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+
+    async def _label(new_examples):
+        return [
+            response
+            async for _, response in stream_responses(
+                "all examples",
+                new_examples,
+                client=client,
+                select_examples=selector,
+            )
+        ]
+
+    asyncio.run(_label([json.dumps({"id": "100", "feedback": "tax"})]))
+    examples = json.loads(
+        prompts[0].split("Here are the examples for reference:")[1].split("Based on")[0]
+    )
+    assert len(examples) == 3
+    assert all(example["label"] == [["Tax"]] for example in examples)
+    assert set(examples[0]) == {"id", "feedback", "label"}
+
+    asyncio.run(_label([json.dumps({"id": "102", "feedback": "not in collection"})]))
+    assert selector.labelled_examples in prompts[1]
+    assert len(json.loads(selector.labelled_examples)) == 60
+
+
+def test_example_selector_packs(qdrant):
+    """Test packs are sized for the selected examples rather than all of them."""
+    selector = get_example_selector(qdrant, "eval", "feedback", k=3)
+    prompts = []
+
+    content = json.dumps(
+        {"records": [{"id": str(i), "labels": ["Tax"], "urgency": 1} for i in range(4)]}
+    )
+
+    async def create(messages, **kwargs):
+        prompts.append(messages[1]["content"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    new_examples = [json.dumps({"id": str(i), "feedback": "tax"}) for i in range(4)]
+
+    async def _label():
+        return [
+            response
+            async for _, response in stream_responses(
+                selector.labelled_examples,
+                new_examples,
+                client=client,
+                select_examples=selector,
+                pack_records=True,
+                # All the examples leave no room for records
+                max_prompt_tokens=len(SYSTEM_PROMPT)
+                + len(get_packed_user_prompt(selector.labelled_examples, [])),
+                max_records_per_request=4,
+                count_tokens=len,
+                max_concurrency=1,
+            )
+        ]
+
+    assert len(asyncio.run(_label())) == 4
+    assert len(prompts) == 1
+    assert "Here are the 4 pieces of feedback" in prompts[0]
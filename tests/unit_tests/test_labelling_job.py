@@ -0,0 +1,108 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pyarrow.parquet as pq
+import pytest
+
+from src.utils.labelling_job import (
+    flush_journal,
+    get_done_ids,
+    iter_journal,
+    repair_journal,
+    run_labelling_job,
+)
+
+
+class LabellingCompletions:
+    """Stands in for client.chat.completions, labelling every record as Tax"""
+
+    def __init__(self):
+        self.n_calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.n_calls += 1
+        prompt = messages[1]["content"].split("Here's the feedback you need to label:")
+        record, _ = json.JSONDecoder().raw_decode(prompt[1].strip())
+        content = json.dumps({"id": record["id"], "labels": ["Tax"], "urgency": 1})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+
+# Mock data to use across tests
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setenv("QUERY_BACKEND", "duckdb")
+    monkeypatch.setenv("DUCKDB_DATA_DIR", str(tmp_path / "tables"))
+    client = SimpleNamespace(chat=SimpleNamespace(completions=LabellingCompletions()))
+    monkeypatch.setattr(
+        "src.utils.async_call_openai.get_openai_client", lambda open_api_key: client
+    )
+    return client
+
+
+def get_records(n_records, fail_after=None):
+    for i in range(n_records):
+        if i == fail_after:
+            raise ConnectionError("Container restarted")
+        yield {"id": f"r{i}", "feedback": f"feedback {i}"}
+
+
+def test_repair_journal(tmp_path):
+    """Test a half written last line is ignored and then removed."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    with open(journal_path, "w") as f:
+        f.write(json.dumps({"id": "a", "error": None}) + "\n")
+        f.write(json.dumps({"id": "b", "error": "RateLimitError"}) + "\n")
+        f.write('{"id": "c", "err')
+    assert [entry["id"] for entry, _ in iter_journal(journal_path)] == ["a", "b"]
+    assert get_done_ids(journal_path) == {"a"}
+    repair_journal(journal_path)
+    with open(journal_path) as f:
+        assert f.read().endswith('"error": "RateLimitError"}\n')
+
+
+def test_run_labelling_job_resumes(client, tmp_path):
+    """Test a job that dies is resumed without labelling or writing records twice."""
+    kwargs = dict(
+        table_id="project.dataset.labels",
+        publishing_project_id="project",
+        journal_path=str(tmp_path / "journal.jsonl"),
+        flush_size=4,
+        cache_path=None,
+        chunk_size=5,
+        tokens_per_minute=10**9,
+    )
+    with pytest.raises(ConnectionError):
+        asyncio.run(
+            run_labelling_job("examples", get_records(15, fail_after=12), **kwargs)
+        )
+    assert client.chat.completions.n_calls == 10
+    assert pq.read_table(tmp_path / "tables" / "labels.parquet").num_rows == 8
+
+    stats = asyncio.run(run_labelling_job("examples", get_records(15), **kwargs))
+    assert client.chat.completions.n_calls == 15
+    assert stats["n_skipped"] == 10
+    assert stats["n_labelled"] == 5
+    ids = pq.read_table(tmp_path / "tables" / "labels.parquet")["id"].to_pylist()
+    assert sorted(ids) == sorted(f"r{i}" for i in range(15))
+
+
+def test_flush_journal_dead_letters(client, tmp_path, monkeypatch):
+    """Test rows sent to the dead letter file aren't counted as written."""
+    monkeypatch.chdir(tmp_path)
+    journal_path = str(tmp_path / "journal.jsonl")
+    with open(journal_path, "w") as f:
+        for content in [{"id": "a", "labels": ["Tax"], "urgency": 1}, {"id": "b"}]:
+            entry = {
+                "id": content["id"],
+                "open_labelled_records": json.dumps(content),
+                "prompt_tokens": 10,
+                "completion_tokens": 5,
+                "error": None,
+            }
+            f.write(json.dumps(entry) + "\n")
+    assert flush_journal(journal_path, "project.dataset.labels", "project") == 1
+    assert (tmp_path / "data" / "bigquery_dead_letter.jsonl").exists()
@@ -0,0 +1,107 @@
+import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from google.cloud import bigquery
+
+from src.sql_queries import (
+    query_all_feedback,
+    query_distinct_orgs,
+    query_evaluation_data,
+    query_labelled_feedback,
+    query_labelled_ids,
+)
+from src.utils.query_backends import DuckDBBackend
+
+PUBLISHING_VIEW = "`project.dataset.publishing_view`"
+LABELLED_FEEDBACK_TABLE = "`project.dataset.labelled_feedback`"
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_backend(tmp_path):
+    feedback = [
+        {
+            "type": "problem_report",
+            "created": datetime.datetime(2024, 1, i + 1),
+            "subject_page_path": f"/page-{i}",
+            "feedback_record_id": i,
+            "response_value": f"feedback {i}",
+            "organisation": ["HMRC", "DVLA"] if i % 2 else ["HMRC"],
+            "primary_organisation": "HMRC",
+            "document_type": "special route" if i == 3 else "guide",
+            "embeddings": [float(i), 1.0],
+            "sentiment": "negative",
+            "spam_classification": "not spam",
+            "spam_probability": 0.1,
+            "publishing_app": "publisher",
+            "locale": "en",
+            "title": f"Page {i}",
+            "taxons": ["tax"],
+        }
+        for i in range(4)
+    ]
+    labels = [
+        {"id": "1", "labels": ["tax", "login"], "urgency": 2},
+        {"id": "2", "labels": ["spam"], "urgency": None},
+    ]
+    pq.write_table(pa.Table.from_pylist(feedback), tmp_path / "publishing_view.parquet")
+    pq.write_table(pa.Table.from_pylist(labels), tmp_path / "labelled_feedback.parquet")
+    return DuckDBBackend(str(tmp_path))
+
+
+def test_query_all_feedback(get_backend):
+    """Test that the main extract runs, excluding special routes."""
+    query = query_all_feedback.replace("@PUBLISHING_VIEW", PUBLISHING_VIEW)
+    rows = get_backend.query(query).to_pylist()
+    assert [row["feedback_record_id"] for row in rows] == ["0", "1", "2"]
+    assert rows[1]["full_url"] == "https://www.gov.uk/page-1"
+    assert rows[1]["created"] == datetime.date(2024, 1, 2)
+
+
+def test_query_labelled_feedback(get_backend):
+    """Test that the labelled extract joins labels onto feedback."""
+    query = query_labelled_feedback.replace(
+        "@LABELLED_FEEDBACK_TABLE", LABELLED_FEEDBACK_TABLE
+    ).replace("@PUBLISHING_VIEW", PUBLISHING_VIEW)
+    rows = get_backend.query(query).to_pylist()
+    assert [(row["feedback_record_id"], row["urgency"]) for row in rows] == [
+        ("1", 2),
+        ("2", -1),
+    ]
+    assert rows[0]["labels"] == ["tax", "login"]
+
+
+def test_query_labels(get_backend):
+    """Test the queries against the labelled feedback table alone."""
+    query = query_labelled_ids.replace(
+        "@LABELLED_FEEDBACK_TABLE", LABELLED_FEEDBACK_TABLE
+    )
+    assert len(get_backend.query(query)) == 2
+
+    query = query_evaluation_data.replace("@EVALUATION_TABLE", LABELLED_FEEDBACK_TABLE)
+    rows = get_backend.query(query).to_pylist()
+    assert rows[0]["labels"] == "tax, login"
+
+
+def test_query_distinct_orgs(get_backend):
+    """Test that the UNNEST comma join returns one row per organisation."""
+    query = query_distinct_orgs.replace("@PUBLISHING_VIEW", PUBLISHING_VIEW)
+    rows = get_backend.query(query).to_pylist()
+    assert sorted(row["organisation"] for row in rows) == ["DVLA", "HMRC"]
+
+
+def test_insert_rows(get_backend):
+    """Test that inserted rows are appended to the local table."""
+    schema = [
+        bigquery.SchemaField("id", "STRING"),
+        bigquery.SchemaField("labels", "STRING", mode="REPEATED"),
+        bigquery.SchemaField("urgency", "INTEGER"),
+    ]
+    rows = [{"id": "3", "labels": ["benefits"], "urgency": 1}]
+    assert get_backend.insert_rows(LABELLED_FEEDBACK_TABLE, rows, schema) == []
+    query = query_labelled_ids.replace(
+        "@LABELLED_FEEDBACK_TABLE", LABELLED_FEEDBACK_TABLE
+    )
+    assert len(get_backend.query(query)) == 3
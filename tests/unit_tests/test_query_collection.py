@@ -0,0 +1,36 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct
+
+from src.collection_utils.query_collection import (
+    get_semantically_similar_results,
+    get_semantically_similar_results_batch,
+)
+from src.collection_utils.set_collection import create_collection
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_client():
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=2, distance_metric=Distance.COSINE)
+    vectors = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, -1.0], [-1.0, 0.5]]
+    client.upsert(
+        "test",
+        [PointStruct(id=i, vector=vector) for i, vector in enumerate(vectors)],
+    )
+    return client
+
+
+def test_get_semantically_similar_results_batch(get_client):
+    """Test batched searches return the same results, in order, as single searches."""
+    query_embeddings = [[1.0, 0.1], [0.1, 1.0], [-1.0, 0.0]]
+    batch_results = get_semantically_similar_results_batch(
+        get_client, "test", query_embeddings, score_threshold=0.5, batch_size=2
+    )
+    assert len(batch_results) == len(query_embeddings)
+    for query_embedding, results in zip(query_embeddings, batch_results):
+        expected = get_semantically_similar_results(
+            get_client, "test", query_embedding, score_threshold=0.5
+        )
+        assert [result.id for result in results] == [result.id for result in expected]
@@ -1,6 +1,9 @@
+from collections import Counter
+
 import pytest
 
-from src.utils.sample import get_stratified_sample
+from benchmarks.sampling_benchmark import generate_records
+from src.utils.sample import allocate_sample_sizes, get_stratified_sample
 
 
 # Mock data to use across tests
@@ -22,3 +25,61 @@ def test_sample_size(get_labels):
     sample_size = 4
     samples = get_stratified_sample(get_labels, sample_size)
     assert len(samples) == sample_size, "Sample size does not match requested size."
+
+
+def test_allocate_sample_sizes():
+    """Test sample sizes are proportional, sum to the total and cover rare labels."""
+    assert allocate_sample_sizes([50, 30, 20], 10).tolist() == [5, 3, 2]
+    assert allocate_sample_sizes([60, 25, 15], 6).tolist() == [4, 1, 1]
+    assert allocate_sample_sizes([1000, 1, 1], 10).tolist() == [8, 1, 1]
+    assert allocate_sample_sizes([5, 10, 1], 2).tolist() == [1, 1, 0]
+
+
+def test_stratified_sample_proportions():
+    """Test single label records are sampled exactly in proportion, without
+    duplicates."""
+    records = [
+        {"feedback_record_id": i, "labels": [label]}
+        for i, label in enumerate(["A"] * 600 + ["B"] * 300 + ["C"] * 99 + ["D"])
+    ]
+    samples = get_stratified_sample(records, 50, seed=1)
+    assert Counter(record["labels"][0] for record in samples) == {
+        "A": 29,
+        "B": 15,
+        "C": 5,
+        "D": 1,
+    }
+    assert len({record["feedback_record_id"] for record in samples}) == 50
+
+
+def test_stratified_sample_multi_label():
+    """Test multi-label samples have the requested size, no duplicates and every
+    label."""
+    records = generate_records(5000, n_distinct_labels=50)
+    samples = get_stratified_sample(records, 200, seed=1)
+    assert len(samples) == 200
+    assert len({record["feedback_record_id"] for record in samples}) == 200
+    assert {label for record in samples for label in record["labels"]} == {
+        label for record in records for label in record["labels"]
+    }
+    assert len(get_stratified_sample(records[:10], 200)) == 10
+
+
+class CountingList(list):
+    """A list counting how many times its items are looked up by index"""
+
+    n_lookups = 0
+
+    def __getitem__(self, index):
+        self.n_lookups += 1
+        return super().__getitem__(index)
+
+
+def test_stratified_sample_single_pass():
+    """Test each record is looked up at most twice, once to sample by label and once
+    to fill any gap, plus once per sampled record, including when there are many more
+    labels than samples. See benchmarks/sampling_benchmark.py for timings."""
+    records = CountingList(generate_records(20000, n_distinct_labels=4000))
+    samples = get_stratified_sample(records, 1000, seed=1)
+    assert len(samples) == 1000
+    assert records.n_lookups <= 2 * len(records) + len(samples)
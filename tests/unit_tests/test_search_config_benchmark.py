@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from qdrant_client import QdrantClient  # noqa: E402
+from qdrant_client.http.models import Distance, PointStruct  # noqa: E402
+
+from src.collection_utils.query_collection import get_search_params  # noqa: E402
+from src.collection_utils.search_config_benchmark import (  # noqa: E402
+    get_search_config_grid,
+    score_label_searches,
+    time_label_searches,
+)
+from src.collection_utils.set_collection import create_collection  # noqa: E402
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_client():
+    client = QdrantClient(":memory:")
+    create_collection(client, "test", size=2, distance_metric=Distance.COSINE)
+    vectors = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, -1.0], [-1.0, 0.5]]
+    client.upsert(
+        "test",
+        [
+            PointStruct(
+                id=i, vector=vector, payload={"spam_classification": "not spam"}
+            )
+            for i, vector in enumerate(vectors)
+        ],
+    )
+    return client
+
+
+def test_get_search_config_grid():
+    """Test every combination is included, with exact search first per collection."""
+    grid = get_search_config_grid([8, 16], [32, 64], [None, "scalar"], [False, True])
+    assert len(grid) == 2 * 2 * 2 * 3
+    assert grid[0] == {
+        "m": 8,
+        "quantization": None,
+        "payload_index": False,
+        "exact": True,
+        "hnsw_ef": None,
+    }
+    assert [settings["hnsw_ef"] for settings in grid[:3]] == [None, 32, 64]
+    # Settings that need the collection rebuilt change least often
+    assert [settings["m"] for settings in grid] == [8] * 12 + [16] * 12
+
+
+def test_time_and_score_label_searches(get_client):
+    """Test searches are timed and scored against the relevant ids and exact search."""
+    labels = ["x", "y"]
+    regex_ids = {"x": ["0", "2"], "y": ["1", "2"]}
+    query_embeddings = [[1.0, 0.1], [0.1, 1.0]]
+    filter_dict = {"spam_classification": ["spam", "not spam", ""]}
+
+    latencies, exact_results = time_label_searches(
+        get_client,
+        "test",
+        query_embeddings,
+        0.5,
+        get_search_params(exact=True),
+        filter_dict,
+    )
+    assert len(latencies) == 2
+    assert all(latency > 0 for latency in latencies)
+    assert [sorted(r.id for r in results) for results in exact_results] == [
+        [0, 2, 3],
+        [1, 2],
+    ]
+
+    scores = score_label_searches(labels, regex_ids, exact_results, 0.5)
+    assert scores["precision"] == pytest.approx((2 / 3 + 1) / 2)
+    assert scores["recall"] == pytest.approx(1.0)
+
+    # Approximate search missing one of the exact results of the first label
+    scores = score_label_searches(
+        labels,
+        regex_ids,
+        [exact_results[0][:2], exact_results[1]],
+        0.5,
+        exact_results,
+    )
+    assert scores["exact_overlap"] == pytest.approx((2 / 3 + 1) / 2)
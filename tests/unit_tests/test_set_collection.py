@@ -0,0 +1,121 @@
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance
+
+from src.collection_utils.set_collection import (
+    copy_collection,
+    create_collection,
+    create_vectors_from_data,
+    get_labelled_points_from_collection,
+    get_quantization_config,
+    merge_labelled_records,
+    upsert_to_collection_from_vectors,
+)
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_docs():
+    docs = [
+        {
+            "feedback_record_id": "1",
+            "feedback": "a",
+            "urgency": 0,
+            "embeddings": [1.0, 0.0],
+        },
+        {
+            "feedback_record_id": "2",
+            "feedback": "b",
+            "urgency": 0,
+            "embeddings": [0.0, 1.0],
+        },
+        {
+            "feedback_record_id": "3",
+            "feedback": "c",
+            "urgency": 0,
+            "embeddings": [1.0, 1.0],
+        },
+    ]
+    return docs
+
+
+@pytest.fixture
+def get_labelled_records():
+    labelled_records = [
+        {"feedback_record_id": "2", "labels": ["tax"], "urgency": 3},
+        {"feedback_record_id": "3", "labels": ["spam"], "urgency": 1},
+        {"feedback_record_id": "4", "labels": ["missing"], "urgency": 2},
+    ]
+    return labelled_records
+
+
+def test_merge_labelled_records(get_docs, get_labelled_records):
+    """Test that only labelled documents are returned, with labels and urgency merged in."""
+    merged = merge_labelled_records(get_docs, get_labelled_records)
+    assert [doc["feedback_record_id"] for doc in merged] == ["2", "3"]
+    assert merged[0]["labels"] == ["tax"]
+    assert merged[0]["urgency"] == 3
+    assert merged[0]["embeddings"] == [0.0, 1.0]
+
+
+def test_get_labelled_points_from_collection(get_docs, get_labelled_records):
+    """Test that labelled points are copied from a collection with their vectors."""
+    client = QdrantClient(":memory:")
+    create_collection(client, "main", size=2, distance_metric=Distance.DOT)
+    points = create_vectors_from_data(
+        get_docs, id_key="feedback_record_id", embedding_key="embeddings"
+    )
+    upsert_to_collection_from_vectors(client, "main", data=points)
+
+    labelled_points = get_labelled_points_from_collection(
+        client, "main", get_labelled_records
+    )
+    labelled_points = sorted(labelled_points, key=lambda point: point.id)
+    assert [point.id for point in labelled_points] == [2, 3]
+    assert labelled_points[0].vector == [0.0, 1.0]
+    assert labelled_points[0].payload["labels"] == ["tax"]
+    assert labelled_points[0].payload["urgency"] == 3
+    assert labelled_points[1].payload["feedback"] == "c"
+
+
+def test_get_quantization_config():
+    """Test quantization config is built for each option and unknown options raise."""
+    assert get_quantization_config(None) is None
+    assert get_quantization_config("scalar").scalar.type == "int8"
+    assert get_quantization_config("binary").binary.always_ram
+    with pytest.raises(ValueError):
+        get_quantization_config("product")
+
+
+def test_copy_collection(get_docs, monkeypatch):
+    """Test that every point is copied with its vector and payload, into a collection
+    that indexes every segment."""
+    client = QdrantClient(":memory:")
+    recreate_collection = client.recreate_collection
+    created = {}
+
+    def _recreate_collection(collection_name, **kwargs):
+        created[collection_name] = kwargs
+        return recreate_collection(collection_name=collection_name, **kwargs)
+
+    monkeypatch.setattr(client, "recreate_collection", _recreate_collection)
+    create_collection(client, "main", size=2, distance_metric=Distance.DOT)
+    points = create_vectors_from_data(
+        get_docs, id_key="feedback_record_id", embedding_key="embeddings"
+    )
+    upsert_to_collection_from_vectors(client, "main", data=points)
+
+    copy_collection(
+        client,
+        "main",
+        "copy",
+        quantization_config=get_quantization_config("scalar"),
+        chunk_size=2,
+    )
+    assert client.get_collection("copy").config.params.vectors.distance == "Dot"
+    assert client.get_collection("copy").config.params.vectors.on_disk
+    assert created["copy"]["optimizers_config"].indexing_threshold == 1
+    assert not client.get_collection("main").config.params.vectors.on_disk
+    copied = client.retrieve("copy", [1, 2, 3], with_vectors=True)
+    assert [point.vector for point in copied] == [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+    assert [point.payload["feedback"] for point in copied] == ["a", "b", "c"]